@@ -0,0 +1,124 @@
+#imports
+from openmsistream.utilities.argument_parsing import positive_int
+from ..shared.argument_parsing import OpenMSIPythonArgumentParser
+from .config import LECROY_CONST
+from .skim_compression import COMPRESSION_CODECS
+from .file_watcher import WATCH_METHODS, QUIESCENT_SECS, POLL_SECS
+
+def nonnegative_int(argval) :
+    """
+    make sure a given value is a nonnegative integer
+    """
+    try :
+        argval = int(argval)
+    except ValueError as exc :
+        raise ValueError(f'ERROR: could not convert {argval} to an integer!') from exc
+    if argval<0 :
+        raise ValueError(f'ERROR: invalid argument: {argval} must be a nonnegative integer!')
+    return argval
+
+def row_window(argstring) :
+    """
+    convert a "rows_to_skip:rows_to_select" string argument into a tuple of two integers
+    """
+    try :
+        rows_to_skip, rows_to_select = (int(value) for value in argstring.split(':'))
+    except ValueError as exc :
+        raise ValueError(f'ERROR: row window {argstring} is not of the form "rows_to_skip:rows_to_select"!') from exc
+    if rows_to_skip<0 or rows_to_select<=0 :
+        raise ValueError(f'ERROR: invalid row window {argstring}!')
+    return rows_to_skip, rows_to_select
+
+def time_window(argstring) :
+    """
+    convert a "start_time:stop_time" string argument into a tuple of two floats
+    """
+    try :
+        start_time, stop_time = (float(value) for value in argstring.split(':'))
+    except ValueError as exc :
+        raise ValueError(f'ERROR: time window {argstring} is not of the form "start_time:stop_time"!') from exc
+    if stop_time<=start_time :
+        raise ValueError(f'ERROR: time window {argstring} does not end after it starts!')
+    return start_time, stop_time
+
+class LecroyArgumentParser(OpenMSIPythonArgumentParser) :
+    """
+    Argument parser for the programs that skim, upload, and analyze Lecroy oscilloscope files
+    """
+
+    ARGUMENTS = {**OpenMSIPythonArgumentParser.ARGUMENTS,
+        'low_memory':
+            ['optional',{'action':'store_true',
+                         'help':'''Add this flag to run analyses in single precision, releasing intermediate
+                                   arrays as soon as they've been used'''}],
+        'report_peak_memory':
+            ['optional',{'action':'store_true',
+                         'help':'''Add this flag to log the peak memory allocated by each analysis (measurements
+                                   are serialized, so analyses in different threads wait for each other)'''}],
+        'find_event_window':
+            ['optional',{'action':'store_true',
+                         'help':'''Add this flag to scan each Lecroy file for the event and select the rows
+                                   around it, instead of always skipping the same number of rows. The event is
+                                   found by comparing the signal to the quiet region at the beginning of the file,
+                                   so events that have already begun in the first few thousand rows can't be found;
+                                   a warning is logged and the default number of rows is skipped for files where
+                                   no event is found.'''}],
+        'event_margin_rows':
+            ['optional',{'default':LECROY_CONST.EVENT_MARGIN_ROWS,'type':positive_int,
+                         'help':'''Number of rows before the event to select from each Lecroy file
+                                   (used with find_event_window)'''}],
+        'row_windows':
+            ['optional',{'type':row_window,'nargs':'*','default':None,
+                         'help':'''Windows of rows to select from each Lecroy file, as "rows_to_skip:rows_to_select"
+                                   (default is one window of the rows set by rows_to_skip and rows_to_select)'''}],
+        'time_windows':
+            ['optional',{'type':time_window,'nargs':'*','default':None,
+                         'help':'''Windows of time to select from each Lecroy file, as "start_time:stop_time"
+                                   in seconds (can't be used with row_windows)'''}],
+        'encode_skimmed_data':
+            ['optional',{'action':'store_true',
+                         'help':'''Add this flag to upload the rows selected from each Lecroy file as uniformly
+                                   spaced times and packed voltages instead of as raw text'''}],
+        'compression':
+            ['optional',{'choices':list(COMPRESSION_CODECS.keys()),'default':None,
+                         'help':'''Codec to compress the data skimmed from each Lecroy file with before uploading
+                                   them ("zstd" and "lz4" need optional packages; default is no compression)'''}],
+        'compression_level':
+            ['optional',{'type':int,'default':None,
+                         'help':'Level to compress skimmed data at (default is the codec\'s default level)'}],
+        'edge_analysis':
+            ['optional',{'choices':['spall','velocity'],'default':None,
+                         'help':'''Type of analysis ("spall" or "velocity") to run for each new Lecroy file before
+                                   uploading it. Only a record of each result and a thumbnail of its velocity trace
+                                   are uploaded, to results_topic_name (default is to just upload skimmed data)'''}],
+        'results_topic_name':
+            ['optional',{'default':LECROY_CONST.RESULTS_TOPIC_NAME,
+                         'help':'Name of the topic to upload the results of analyses run with edge_analysis to'}],
+        'n_analysis_workers':
+            ['optional',{'default':1,'type':positive_int,
+                         'help':'Number of worker processes to run analyses with edge_analysis in'}],
+        'upload_skimmed_data':
+            ['optional',{'action':'store_true',
+                         'help':'''Add this flag to upload the skimmed data for every file when edge_analysis is
+                                   used (by default they're only uploaded for files whose analysis fails)'''}],
+        'n_skim_workers':
+            ['optional',{'default':LECROY_CONST.N_SKIM_WORKERS,'type':nonnegative_int,
+                         'help':'''Number of worker threads to skim new Lecroy files in (the most files read at once;
+                                   0 skims files one at a time in the thread watching the directory)'''}],
+        'skim_queue_max_size':
+            ['optional',{'default':LECROY_CONST.SKIM_QUEUE_MAX_MEGABYTES,'type':positive_int,
+                         'help':'''Maximum size (in MB) of the data skimmed from Lecroy files that are waiting to be
+                                   added to the upload queue'''}],
+        'watch_method':
+            ['optional',{'choices':[*WATCH_METHODS,'scan'],'default':'auto',
+                         'help':'''How to find new files in the watched directory: "inotify" (Linux only),
+                                   "polling", "auto" to use inotify if it's available and polling otherwise, or
+                                   "scan" to rescan the whole directory with a growing wait time'''}],
+        'quiescent_secs':
+            ['optional',{'default':QUIESCENT_SECS,'type':float,
+                         'help':'''Number of seconds a new file's size and modification time must stay the same
+                                   before it's picked up (so files still being written aren't skimmed)'''}],
+        'poll_secs':
+            ['optional',{'default':POLL_SECS,'type':float,
+                         'help':'Number of seconds between scans of the watched directory when polling'}]
+    }
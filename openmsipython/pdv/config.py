@@ -1,3 +1,6 @@
+#imports
+import pathlib
+
 class LecroyConstants :
     """
     Constants for working with Lecroy oscilloscope files
@@ -6,6 +9,9 @@ class LecroyConstants :
     def TOPIC_NAME(self) :
         return 'skimmed_lecroy_pdv_files' # name of the topic that should be produced to/consumed from
     @property
+    def RESULTS_TOPIC_NAME(self) :
+        return 'lecroy_pdv_results' # name of the topic that results of analyses run before uploading are produced to
+    @property
     def HEADER_ROWS(self) :
         return 5           # the number of rows making up the header to the file
     @property
@@ -15,6 +21,19 @@ class LecroyConstants :
     def ROWS_TO_SELECT(self) :
         return int(120e3)  # default number of rows to select after initial skip in raw files
     @property
+    def EVENT_MARGIN_ROWS(self) :
+        return int(60e3)   # default number of rows before the event to select when the event is found automatically
+    @property
+    def N_SKIM_WORKERS(self) :
+        return 2           # default number of worker threads to skim new files in
+    @property
+    def SKIM_QUEUE_MAX_MEGABYTES(self) :
+        return 500         # default maximum size (in MB) of skimmed data waiting to be added to the upload queue
+    @property
+    def LINE_INDEX_CACHE_DIR(self) :
+        return pathlib.Path.home()/'.cache'/'openmsipython'/'line_indices' # default directory for cached line
+                                                                            # indices (outside any watched directory)
+    @property
     def SKIMMED_FILENAME_APPEND(self) :
         return '_skimmed' # string to append to filenames to indicate that they don't include all of their original data
 
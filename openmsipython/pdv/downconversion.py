@@ -0,0 +1,88 @@
+#imports
+from scipy import signal
+from scipy.fft import fft, ifft, fftfreq, fftshift
+import numpy as np
+from .pdv_signal_processing import NOTCH_WIDTH
+
+# Mixing PDV signals down to baseband and decimating them so the later stages of an analysis run on fewer samples
+
+def downconvert(voltage,sample_rate,lo_freq,factor) :
+    """
+    Return the complex baseband signal made by mixing voltage down by lo_freq, then low-pass filtering
+    and decimating it by factor. Sample k of the result corresponds to sample k*factor of voltage, and its
+    frequencies are relative to lo_freq (so the carrier is at zero).
+    """
+    lo_freq = np.asarray(lo_freq)[...,np.newaxis]
+    lo = np.exp(-2j*np.pi*lo_freq*(np.arange(voltage.shape[-1])/sample_rate))
+    # single precision data stay in single precision
+    mixed = voltage*lo.astype(np.result_type(voltage.dtype,np.complex64),copy=False)
+    # a zero-phase FIR filter keeps the decimated samples aligned with the original time base
+    return signal.decimate(mixed,factor,ftype='fir',axis=-1,zero_phase=True)
+
+def get_baseband_stft_kwargs(stft_kwargs,factor) :
+    """
+    Return the keyword arguments for the short time fourier transforms of a baseband signal decimated by factor
+    that give the same time and frequency resolution as stft_kwargs give for the original signal
+    """
+    nperseg = stft_kwargs['nperseg']//factor
+    return {'fs':stft_kwargs['fs']/factor,
+            'nperseg':nperseg,
+            'noverlap':np.floor(stft_kwargs['noverlap']/stft_kwargs['nperseg']*nperseg),
+            'nfft':stft_kwargs['nfft']//factor,
+            'boundary':None,
+            'return_onesided':False}
+
+def calculate_baseband_spectrogram(baseband,stft_kwargs) :
+    """
+    Return the (baseband) frequencies in increasing order, times, and power (in dB) of the two-sided short
+    time fourier transform of a baseband signal
+    """
+    f,t,Zxx = signal.stft(baseband,axis=-1,**stft_kwargs)
+    return fftshift(f), t, 20*(np.log10(np.abs(fftshift(Zxx,axes=-2))))
+
+def shift_baseband_spectrogram(f,power,lo_freq) :
+    """
+    Return the frequencies in the original frame and power of the rows of a single baseband spectrogram
+    at positive frequencies in that frame (the other rows only hold images of negative frequencies)
+    """
+    f = f+lo_freq
+    return f[f>0], power[f>0]
+
+def calculate_baseband_signal_band(f,power,lo_freq) :
+    """
+    Return the lowest and highest frequencies (in the original frame, not relative to lo_freq) where the
+    signal peaks in a spectrogram of a baseband signal, ignoring the images of negative frequencies
+    """
+    lo_freq = np.asarray(lo_freq)
+    positive = f[:,np.newaxis] > -lo_freq[...,np.newaxis,np.newaxis]
+    freq_max_power = f[np.argmax(np.where(positive,power,-np.inf),axis=-2)] + lo_freq[...,np.newaxis]
+    return np.min(freq_max_power,axis=-1), np.max(freq_max_power,axis=-1)
+
+def isolate_baseband_signal(baseband,fixt,sample_rate,freq_low,freq_high) :
+    """
+    Return the signal isolated from a baseband signal by notch filtering out the carrier (at zero frequency)
+    after fixt and then keeping only the band between freq_low and freq_high (relative to the carrier)
+    """
+    freq_low = np.asarray(freq_low)[...,np.newaxis]
+    freq_high = np.asarray(freq_high)[...,np.newaxis]
+    filtered = np.array(baseband,dtype=np.complex128)
+    # the same sixth order Gaussian notch as the full signal uses, but only around zero
+    ntail = filtered.shape[-1]-fixt
+    notch = 1-np.exp(-fftfreq(ntail,1/sample_rate)**6/NOTCH_WIDTH**6)
+    filtered[...,fixt:] = ifft(fft(filtered[...,fixt:],axis=-1)*notch,axis=-1)
+    # isolate signal
+    freq = fftfreq(filtered.shape[-1],1/sample_rate)
+    filt = (freq > freq_low) * (freq < freq_high)
+    return ifft(fft(filtered,axis=-1,overwrite_x=True)*filt,axis=-1)
+
+def restore_time_base(values,factor,npts) :
+    """
+    Return values calculated for a signal decimated by factor linearly interpolated back onto
+    the npts points of the original time base
+    """
+    decimated_index = np.arange(values.shape[-1])*factor
+    original_index = np.arange(npts)
+    restored = np.empty(values.shape[:-1]+(npts,),dtype=values.dtype)
+    for idx in np.ndindex(values.shape[:-1]) :
+        restored[idx] = np.interp(original_index,decimated_index,values[idx])
+    return restored
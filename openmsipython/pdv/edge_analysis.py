@@ -0,0 +1,110 @@
+#imports
+import json, math, pathlib
+from io import BytesIO
+import numpy as np
+from .config import LECROY_CONST
+from .pdv_analysis import PDVSpallAnalysis, PDVVelocityAnalysis
+from .event_window import get_row_windows
+from .skim_encoding import EncodedLecroyData
+
+# Analyzing Lecroy files where they're written, to upload compact records of the results instead of the data
+
+#the types of analysis that can be run, by name
+PDV_ANALYSIS_TYPES = {'spall':PDVSpallAnalysis,'velocity':PDVVelocityAnalysis}
+#default maximum number of points in the decimated velocity traces in result records
+RESULT_TRACE_POINTS = 1000
+#size (in inches) and resolution of the thumbnail plots of the velocity traces
+THUMBNAIL_FIGSIZE = (4,2.5)
+THUMBNAIL_DPI = 80
+#strings appended to the stems of analyzed files to name their result records and thumbnails
+RESULT_RECORD_APPEND = '_pdv_result'
+RESULT_THUMBNAIL_APPEND = '_pdv_thumbnail'
+
+def decimate_trace(time,velocity,n_points=RESULT_TRACE_POINTS) :
+    """
+    Return the time and velocity of a trace decimated to at most n_points by averaging consecutive blocks of points
+    """
+    stride = max(math.ceil(time.shape[0]/n_points),1)
+    starts = np.arange(0,time.shape[0],stride)
+    counts = np.diff(np.append(starts,time.shape[0]))
+    return np.add.reduceat(time,starts)/counts, np.add.reduceat(velocity,starts)/counts
+
+def make_result_record(result,analysis_name,window=1,n_windows=1,n_trace_points=RESULT_TRACE_POINTS) :
+    """
+    Return the bytestring of the JSON result record for a PDVAnalysisResult, which holds the scalar metrics of the
+    result and a decimated copy of its velocity trace
+
+    analysis_name = the name of the type of analysis that made the result ("spall" or "velocity")
+    window, n_windows = which of the windows of rows selected from the file the result is for
+    n_trace_points = the maximum number of points in the decimated velocity trace
+    """
+    time, velocity = decimate_trace(result.cut_time-result.cut_time[0],result.velocity,n_trace_points)
+    record = {'file':result.file.name,
+              'analysis':analysis_name,
+              'window':window,
+              'n_windows':n_windows,
+              'metrics':result.metrics,
+              'trace_start_time':float(result.cut_time[0]),
+              'time':time.tolist(),
+              'velocity':velocity.tolist(),
+             }
+    return json.dumps(record).encode()
+
+def make_result_thumbnail(result) :
+    """
+    Return the bytestring of a small PNG plot of the velocity trace of a PDVAnalysisResult
+    """
+    #a standalone Figure doesn't touch any pyplot state, so this is safe in worker processes and threads
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=THUMBNAIL_FIGSIZE,dpi=THUMBNAIL_DPI)
+    ax = fig.add_subplot(1,1,1)
+    ax.plot((result.cut_time-result.cut_time[0])/1e-9,result.velocity,'k-',linewidth=0.75)
+    ax.set_xlabel('Time (ns)',fontsize=7)
+    ax.set_ylabel('Velocity (m/s)',fontsize=7)
+    ax.set_title(result.file.stem,fontsize=7)
+    ax.tick_params(labelsize=6)
+    ax.grid()
+    png = BytesIO()
+    fig.savefig(png,format='png',bbox_inches='tight')
+    return png.getvalue()
+
+def get_result_file_names(input_file_name,window=1,n_windows=1) :
+    """
+    Return the names of the result record and thumbnail files for a window of rows selected from an input file
+    """
+    stem = input_file_name.split('.')[0]
+    if n_windows>1 :
+        stem+=f'_window_{window}'
+    return f'{stem}{RESULT_RECORD_APPEND}.json', f'{stem}{RESULT_THUMBNAIL_APPEND}.png'
+
+def analyze_lecroy_file(analysis_name,filepath,header_rows=LECROY_CONST.HEADER_ROWS,row_windows=None,
+                        window_kwargs=None,n_trace_points=RESULT_TRACE_POINTS,**kwargs) :
+    """
+    Run a PDV analysis for each window of rows in a raw Lecroy file and return a list of
+    (result record file name, result record bytestring, thumbnail file name, thumbnail bytestring) tuples.
+    Only the numerical part of the analysis is run (no sheets of plots are made).
+
+    analysis_name = the name of the type of analysis to run ("spall" or "velocity")
+    row_windows = a list of (rows_to_skip, rows_to_select) tuples of the rows to analyze (default is the rows
+                  UploadLecroyDataFile would select given window_kwargs)
+    window_kwargs = keyword arguments for get_row_windows to choose the rows to analyze (if row_windows isn't given)
+    n_trace_points = the maximum number of points in the decimated velocity traces
+    kwargs are passed to the analysis objects (default N=512 and overlap_frac=0.85 like PDVPlotMaker)
+    """
+    if analysis_name not in PDV_ANALYSIS_TYPES :
+        errmsg = f'ERROR: unrecognized analysis type "{analysis_name}" '
+        errmsg+= f'(options are {", ".join(PDV_ANALYSIS_TYPES.keys())})'
+        raise ValueError(errmsg)
+    filepath = pathlib.Path(filepath)
+    if row_windows is None :
+        row_windows = get_row_windows(filepath,header_rows,**(window_kwargs or {}))
+    kwargs = {'N':512,'overlap_frac':0.85,**kwargs}
+    #the rows are read the same way as they're encoded, which is fast for both CSV and binary waveform files
+    windows = EncodedLecroyData.from_lecroy_file(filepath,header_rows,row_windows=row_windows).get_windows()
+    to_return = []
+    for iw,(time,voltage) in enumerate(windows,start=1) :
+        result = PDV_ANALYSIS_TYPES[analysis_name](file=filepath,time=time,voltage=voltage,**kwargs).compute()
+        record_name, thumbnail_name = get_result_file_names(filepath.name,iw,len(windows))
+        to_return.append((record_name,make_result_record(result,analysis_name,iw,len(windows),n_trace_points),
+                          thumbnail_name,make_result_thumbnail(result)))
+    return to_return
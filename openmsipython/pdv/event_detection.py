@@ -0,0 +1,37 @@
+#imports
+import numpy as np
+
+def find_first_run(mask,run_length,starts=None) :
+    """
+    Return the index of the first element of a 1-D boolean array that begins a run of at least run_length
+    consecutive True values, or None if there is no such run. Runs that are cut off by the end of the array
+    do not count.
+
+    Uses a cumulative sum of the mask so that the number of True values in every window of run_length
+    is found at once, in O(n) regardless of run_length.
+
+    mask = the 1-D boolean array to search
+    run_length = the minimum number of consecutive True values that must follow (and include) the index
+    starts = an optional 1-D boolean array of the same length as mask that is True only at the indices
+             allowed to begin a run
+    """
+    mask = np.asarray(mask,dtype=bool)
+    if run_length<1 :
+        raise ValueError(f'ERROR: run_length must be a positive integer but {run_length} was given!')
+    n_windows = mask.shape[0]-run_length+1
+    if n_windows<1 :
+        return None
+    counts = np.cumsum(mask,dtype=np.int64)
+    n_true = counts[run_length-1:].copy()
+    n_true[1:]-= counts[:n_windows-1]
+    is_run_start = n_true==run_length
+    if starts is not None :
+        is_run_start&= np.asarray(starts,dtype=bool)[:n_windows]
+    idxs = np.flatnonzero(is_run_start)
+    return int(idxs[0]) if idxs.shape[0]>0 else None
+
+def find_first_true(mask) :
+    """
+    Return the index of the first True value in a 1-D boolean array, or None if there isn't one
+    """
+    return find_first_run(mask,1)
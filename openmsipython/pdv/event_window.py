@@ -0,0 +1,205 @@
+#imports
+import math
+import numpy as np
+from .config import LECROY_CONST
+from .event_detection import find_first_run
+from .lecroy_csv_reader import LineOffsetIndex, map_file, parse_csv_rows
+from .lecroy_trc_file import is_trc_file, read_trc_header, LecroyWaveform
+
+# Choosing the windows of rows to skim from raw Lecroy files and splitting skimmed data back into those windows
+
+#number of rows between the beginnings of the blocks of samples that are probed
+PROBE_STRIDE = 4096
+#number of consecutive samples in each probed block
+PROBE_ROWS = 256
+#maximum fraction of the probes (from the beginning of the file) used to find the typical envelope and frequency
+BASELINE_FRACTION = 0.25
+#relative change in the RMS amplitude of a probe that counts as a change in the envelope
+ENVELOPE_THRESHOLD = 0.2
+#number of consecutive changed probes needed to find an event
+MIN_CHANGED_PROBES = 3
+
+def probe_lecroy_file(filepath,header_rows=LECROY_CONST.HEADER_ROWS,probe_stride=PROBE_STRIDE,
+                      probe_rows=PROBE_ROWS) :
+    """
+    Return the rows in a raw Lecroy CSV or binary waveform file where each probed block begins (numbered the
+    same way as rows_to_skip) and a 2-D array of the voltages in the probed blocks
+    """
+    if is_trc_file(filepath) :
+        waveform = LecroyWaveform.from_file(filepath)
+        starts = np.arange(0,waveform.n_points-probe_rows+1,probe_stride)
+        raw = waveform.raw[starts[:,np.newaxis]+np.arange(probe_rows)]
+        # the same samples as the rows in the CSV export of the waveform
+        return starts+header_rows, raw*np.float64(waveform.vertical_gain)-np.float64(waveform.vertical_offset)
+    with map_file(filepath) as mapped :
+        index = LineOffsetIndex.for_file(filepath,mapped)
+        first_row = header_rows
+        starts = np.arange(first_row,index.n_lines-probe_rows+1,probe_stride)
+        voltages = np.empty((starts.shape[0],probe_rows))
+        for i,start in enumerate(starts) :
+            block = mapped[index.get_line_offset(mapped,start):index.get_line_offset(mapped,start+probe_rows)]
+            voltages[i] = parse_csv_rows(block,2)[:,1]
+    return starts, voltages
+
+def is_changed(rms,ridge,baseline_rms,baseline_ridge,envelope_threshold=ENVELOPE_THRESHOLD) :
+    """
+    Return whether probed blocks with the given RMS amplitudes and dominant frequency bins differ from the baseline
+    """
+    if baseline_rms>0 :
+        envelope_changed = np.abs(rms/baseline_rms-1.)>envelope_threshold
+    else :
+        envelope_changed = rms>0
+    return envelope_changed | (np.abs(ridge-baseline_ridge)>1)
+
+def find_changed_probe(voltages,baseline_fraction=BASELINE_FRACTION,envelope_threshold=ENVELOPE_THRESHOLD,
+                       min_changed_probes=MIN_CHANGED_PROBES) :
+    """
+    Return the index of the first probed block of voltages (a row of the 2-D voltages array) that begins a run
+    of at least min_changed_probes blocks whose envelope or dominant frequency differs from the baseline,
+    or None if there isn't one. The baseline is the median over the quiet blocks at the beginning of the array:
+    the blocks before the first one that differs from those preceding it, up to baseline_fraction of the blocks.
+    """
+    voltages = np.asarray(voltages,dtype=np.float64)
+    if voltages.shape[0]<1+min_changed_probes :
+        return None
+    centered = voltages-np.mean(voltages,axis=-1,keepdims=True)
+    # envelope: the RMS amplitude of each block
+    rms = np.sqrt(np.mean(centered**2,axis=-1))
+    # dominant frequency: the largest bin of each block's spectrum (ignoring the DC bin)
+    spectra = np.abs(np.fft.rfft(centered*np.hanning(voltages.shape[-1]),axis=-1))
+    ridge = np.argmax(spectra[:,1:],axis=-1)
+    # grow the quiet region from the first block
+    max_baseline = max(int(voltages.shape[0]*baseline_fraction),1)
+    n_baseline = 1
+    while n_baseline<max_baseline :
+        if is_changed(rms[n_baseline],ridge[n_baseline],np.median(rms[:n_baseline]),
+                      np.median(ridge[:n_baseline]),envelope_threshold) :
+            break
+        n_baseline+=1
+    changed = is_changed(rms,ridge,np.median(rms[:n_baseline]),np.median(ridge[:n_baseline]),envelope_threshold)
+    changed[:n_baseline] = False
+    return find_first_run(changed,min_changed_probes)
+
+def find_event_row(filepath,header_rows=LECROY_CONST.HEADER_ROWS,probe_stride=PROBE_STRIDE,
+                   probe_rows=PROBE_ROWS,**kwargs) :
+    """
+    Return the (approximate) row of a raw Lecroy CSV or binary waveform file where the event begins
+    (numbered the same way as rows_to_skip), or None if no event can be found. The file is probed with short
+    blocks of samples spaced evenly through it (only the probed rows of CSV files are parsed), and the event
+    begins in the first of a run of probes whose envelope or dominant frequency differs from the quiet region at
+    the beginning of the file, so events that have already begun in the first probe can't be found.
+
+    kwargs are passed to find_changed_probe
+    """
+    starts, voltages = probe_lecroy_file(filepath,header_rows,probe_stride,probe_rows)
+    changed_idx = find_changed_probe(voltages,**kwargs)
+    if changed_idx is None :
+        return None
+    return int(starts[changed_idx])
+
+def get_event_rows_to_skip(filepath,event_margin_rows=LECROY_CONST.EVENT_MARGIN_ROWS,
+                           header_rows=LECROY_CONST.HEADER_ROWS,**kwargs) :
+    """
+    Return the number of rows to skip in a raw Lecroy file so that the selected rows begin event_margin_rows
+    before the event, or None if no event can be found
+
+    kwargs are passed to find_event_row
+    """
+    event_row = find_event_row(filepath,header_rows,**kwargs)
+    if event_row is None :
+        return None
+    return max(event_row-event_margin_rows,header_rows)
+
+def get_lecroy_file_timing(filepath,header_rows=LECROY_CONST.HEADER_ROWS) :
+    """
+    Return the time of the first sample and the sampling interval of a raw Lecroy CSV or binary waveform file
+    (for CSV files, the interval is found from the times of the first and last rows)
+    """
+    if is_trc_file(filepath) :
+        wavedesc = read_trc_header(filepath)
+        return wavedesc['HORIZ_OFFSET'], wavedesc['HORIZ_INTERVAL']
+    with map_file(filepath) as mapped :
+        index = LineOffsetIndex.for_file(filepath,mapped)
+        last_row = index.n_lines-1
+        if last_row<=header_rows :
+            raise ValueError(f'ERROR: {filepath} does not have enough rows to find its sampling interval!')
+        first_time = parse_csv_rows(mapped[index.get_line_offset(mapped,header_rows):
+                                           index.get_line_offset(mapped,header_rows+1)],2)[0,0]
+        last_time = parse_csv_rows(mapped[index.get_line_offset(mapped,last_row):],2)[0,0]
+    return first_time, (last_time-first_time)/(last_row-header_rows)
+
+def get_row_windows_for_time_windows(filepath,time_windows,header_rows=LECROY_CONST.HEADER_ROWS) :
+    """
+    Return a list of (rows_to_skip, rows_to_select) tuples for the rows of a raw Lecroy file
+    covering each (start time, stop time) window in time_windows
+    """
+    t0, dt = get_lecroy_file_timing(filepath,header_rows)
+    row_windows = []
+    for start_time,stop_time in time_windows :
+        if stop_time<=start_time :
+            raise ValueError(f'ERROR: time window ({start_time},{stop_time}) does not end after it starts!')
+        first_row = header_rows+max(math.ceil((start_time-t0)/dt-1e-6),0)
+        row_windows.append((first_row,max(math.floor((stop_time-t0)/dt+1e-6)+header_rows+1-first_row,1)))
+    return row_windows
+
+def merge_row_windows(row_windows) :
+    """
+    Return a sorted list of (rows_to_skip, rows_to_select) windows, with any that overlap or touch merged
+    """
+    merged = []
+    for rows_to_skip,rows_to_select in sorted(row_windows) :
+        if rows_to_select<1 :
+            raise ValueError(f'ERROR: window ({rows_to_skip},{rows_to_select}) does not select any rows!')
+        if len(merged)>0 and rows_to_skip<=sum(merged[-1]) :
+            merged[-1] = (merged[-1][0],max(sum(merged[-1]),rows_to_skip+rows_to_select)-merged[-1][0])
+        else :
+            merged.append((rows_to_skip,rows_to_select))
+    return merged
+
+def check_window_options(find_event_window=False,row_windows=None,time_windows=None) :
+    """
+    Raise an error if the options for choosing the windows of rows to select from raw Lecroy files conflict
+    """
+    if (row_windows is not None or time_windows is not None) and find_event_window :
+        raise ValueError('ERROR: windows of rows or times to select cannot be used with find_event_window!')
+    if row_windows is not None and time_windows is not None :
+        raise ValueError('ERROR: only one of row_windows and time_windows can be given!')
+
+def get_row_windows(filepath,header_rows=LECROY_CONST.HEADER_ROWS,rows_to_skip=LECROY_CONST.ROWS_TO_SKIP,
+                    rows_to_select=LECROY_CONST.ROWS_TO_SELECT,find_event_window=False,
+                    event_margin_rows=LECROY_CONST.EVENT_MARGIN_ROWS,row_windows=None,time_windows=None,
+                    logger=None) :
+    """
+    Return the sorted list of (rows_to_skip, rows_to_select) windows of rows to select from a raw Lecroy file,
+    given the same options as UploadLecroyDataFile (so files are skimmed and analyzed the same way)
+
+    logger = a logger to warn with if no event can be found with find_event_window
+    """
+    check_window_options(find_event_window,row_windows,time_windows)
+    if find_event_window :
+        event_rows_to_skip = get_event_rows_to_skip(filepath,event_margin_rows,header_rows)
+        if event_rows_to_skip is None :
+            if logger is not None :
+                warnmsg = f'WARNING: could not find an event in {filepath}, so the default {rows_to_skip} '
+                warnmsg+= 'rows will be skipped'
+                logger.warning(warnmsg)
+        else :
+            rows_to_skip = event_rows_to_skip
+    if time_windows is not None :
+        row_windows = get_row_windows_for_time_windows(filepath,time_windows,header_rows)
+    if row_windows is None :
+        row_windows = [(rows_to_skip,rows_to_select)]
+    #the header is always selected, so windows beginning inside it begin right after it instead
+    return merge_row_windows([(max(window_rows_to_skip,header_rows),window_rows_to_select)
+                              for window_rows_to_skip,window_rows_to_select in row_windows])
+
+def split_at_time_gaps(time,voltage) :
+    """
+    Return a list of (time, voltage) tuples for the windows in skimmed data that are separated by gaps in time
+    (steps larger than one and a half times the typical sampling interval)
+    """
+    if time.shape[0]<3 :
+        return [(time,voltage)]
+    steps = np.diff(time)
+    splits = np.flatnonzero(np.abs(steps)>1.5*np.abs(np.median(steps)))+1
+    return list(zip(np.split(time,splits),np.split(voltage,splits)))
@@ -0,0 +1,297 @@
+#imports
+import os, sys, time, select, struct, pathlib, ctypes, ctypes.util
+
+# Finding new files in watched directories without rescanning everything in them
+
+#default number of seconds a file's size and modification time must stay the same before it's reported
+QUIESCENT_SECS = 0.5
+#default number of seconds between scans of the directory tree when polling
+POLL_SECS = 2.
+#ways of watching directories that get_file_watcher can use
+WATCH_METHODS = ('auto','inotify','polling')
+
+#inotify event masks (from sys/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+#header of each inotify event (watch descriptor, mask, cookie, and length of the name that follows)
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+class FileWatcher :
+    """
+    Base class for finding files that are added to (or rewritten in) a directory tree once they're quiescent
+    (their size and modification time haven't changed for a short time, so files still being written are skipped)
+    """
+
+    @property
+    def dirpath(self) :
+        return self.__dirpath
+    @property
+    def quiescent_secs(self) :
+        return self.__quiescent_secs
+    @property
+    def n_pending(self) :
+        return len(self.__pending) # the number of files that have changed but aren't quiescent yet
+
+    def __init__(self,dirpath,quiescent_secs=QUIESCENT_SECS,exclude_dirs=(),exclude_suffixes=()) :
+        """
+        dirpath = the path to the directory to watch (subdirectories are watched too)
+        quiescent_secs = the number of seconds a file's size and modification time must stay the same
+                         before it's reported
+        exclude_dirs = paths of subdirectories whose files should never be reported (like the logs subdirectory)
+        exclude_suffixes = endings of the names of files that should never be reported
+        """
+        self.__dirpath = pathlib.Path(dirpath).resolve()
+        self.__quiescent_secs = quiescent_secs
+        self.__exclude_dirs = [pathlib.Path(exclude_dir).resolve() for exclude_dir in exclude_dirs]
+        self.__exclude_suffixes = tuple(exclude_suffixes)
+        #the size, modification time, and time first seen with them of each file that's changed but isn't reported
+        self.__pending = {}
+
+    def get_quiescent_files(self,timeout=0.) :
+        """
+        Wait up to timeout seconds for files to change, and return a list of the paths to
+        files that have changed and been quiescent for long enough since they were last reported
+        """
+        now = time.monotonic()
+        if len(self.__pending)>0 :
+            #don't wait past the time the next pending file could be quiescent
+            next_check = min(since for _,_,since in self.__pending.values())+self.__quiescent_secs
+            timeout = min(timeout,max(next_check-now,0.))
+        for filepath in self._wait_for_changes(timeout) :
+            if self.is_excluded(filepath) :
+                continue
+            stat = self.__stat(filepath)
+            if stat is not None :
+                self.__pending[filepath] = (*stat,time.monotonic())
+        quiescent = []
+        now = time.monotonic()
+        for filepath,(size,mtime,since) in list(self.__pending.items()) :
+            stat = self.__stat(filepath)
+            if stat is None :
+                self.__pending.pop(filepath)
+            elif stat!=(size,mtime) :
+                #the file is still being written, so start waiting again
+                self.__pending[filepath] = (*stat,now)
+            elif now-since>=self.__quiescent_secs :
+                self.__pending.pop(filepath)
+                quiescent.append(filepath)
+        return quiescent
+
+    def is_excluded(self,path) :
+        """
+        Return True if a path is in one of the excluded subdirectories or its name has an excluded suffix
+        """
+        if len(self.__exclude_suffixes)>0 and path.name.endswith(self.__exclude_suffixes) :
+            return True
+        return any(path==exclude_dir or exclude_dir in path.parents for exclude_dir in self.__exclude_dirs)
+
+    def close(self) :
+        """
+        Stop watching the directory
+        """
+        pass
+
+    def _wait_for_changes(self,timeout) :
+        """
+        Wait up to timeout seconds and return an iterable of the paths to files that might have changed
+
+        Not implemented in the base class
+        """
+        raise NotImplementedError
+
+    def __stat(self,filepath) :
+        """
+        Return the size and modification time of a regular file, or None if it's not one (anymore)
+        """
+        try :
+            stat = os.stat(filepath)
+        except OSError :
+            return None
+        if not os.path.isfile(filepath) :
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self,exc_type,exc_value,exc_traceback) :
+        self.close()
+
+class InotifyFileWatcher(FileWatcher) :
+    """
+    A FileWatcher that uses inotify to find files closed after writing or moved into the directory tree (Linux only)
+    """
+
+    @property
+    def n_watched_dirs(self) :
+        return len(self.__dirs_by_wd)
+
+    def __init__(self,*args,**kwargs) :
+        """
+        Raises an OSError if inotify isn't available
+        """
+        super().__init__(*args,**kwargs)
+        if not sys.platform.startswith('linux') :
+            raise OSError(f'ERROR: inotify is not available on {sys.platform}!')
+        self.__libc = ctypes.CDLL(ctypes.util.find_library('c'),use_errno=True)
+        self.__fd = self.__libc.inotify_init1(os.O_NONBLOCK|os.O_CLOEXEC)
+        if self.__fd<0 :
+            errno = ctypes.get_errno()
+            raise OSError(errno,f'ERROR: could not initialize inotify: {os.strerror(errno)}')
+        self.__dirs_by_wd = {}
+        try :
+            self.__watch_tree(self.dirpath)
+        except OSError :
+            self.close()
+            raise
+
+    def close(self) :
+        if self.__fd is not None :
+            os.close(self.__fd)
+            self.__fd = None
+            self.__dirs_by_wd = {}
+
+    def _wait_for_changes(self,timeout) :
+        if self.__fd is None :
+            raise RuntimeError('ERROR: InotifyFileWatcher is closed!')
+        readable, _, _ = select.select([self.__fd],[],[],timeout)
+        if len(readable)==0 :
+            return []
+        changed = []
+        for wd,mask,name in self.__read_events() :
+            if mask&IN_Q_OVERFLOW :
+                #some events were lost, so every file has to be checked
+                changed+=self.__list_files(self.dirpath)
+                continue
+            if mask&IN_IGNORED :
+                self.__dirs_by_wd.pop(wd,None)
+                continue
+            if wd not in self.__dirs_by_wd or name=='' :
+                continue
+            path = self.__dirs_by_wd[wd]/name
+            if mask&IN_ISDIR :
+                #watch new subdirectories, and check any files that were added before they were watched
+                if (mask&(IN_CREATE|IN_MOVED_TO)) and not self.is_excluded(path) :
+                    try :
+                        self.__watch_tree(path)
+                    except OSError :
+                        continue
+                    changed+=self.__list_files(path)
+            elif mask&(IN_CLOSE_WRITE|IN_MOVED_TO) :
+                changed.append(path)
+        return changed
+
+    def __read_events(self) :
+        """
+        Read every event that's waiting and return a list of (watch descriptor, mask, name) tuples
+        """
+        buffer = b''
+        while True :
+            try :
+                buffer+=os.read(self.__fd,65536)
+            except BlockingIOError :
+                break
+        events = []
+        offset = 0
+        while offset+INOTIFY_EVENT_HEADER.size<=len(buffer) :
+            wd, mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer,offset)
+            offset+=INOTIFY_EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset+name_length].rstrip(b'\x00'))
+            offset+=name_length
+            events.append((wd,mask,name))
+        return events
+
+    def __watch_tree(self,dirpath) :
+        """
+        Add watches for a directory and all of its subdirectories (except excluded ones)
+        """
+        for subdirpath, dirnames, _ in os.walk(dirpath) :
+            subdirpath = pathlib.Path(subdirpath)
+            dirnames[:] = [dn for dn in dirnames if not self.is_excluded(subdirpath/dn)]
+            mask = IN_CLOSE_WRITE|IN_MOVED_TO|IN_CREATE|IN_ONLYDIR
+            wd = self.__libc.inotify_add_watch(self.__fd,os.fsencode(subdirpath),ctypes.c_uint32(mask))
+            if wd<0 :
+                errno = ctypes.get_errno()
+                raise OSError(errno,f'ERROR: could not watch {subdirpath} with inotify: {os.strerror(errno)}')
+            self.__dirs_by_wd[wd] = subdirpath
+
+    def __list_files(self,dirpath) :
+        """
+        Return a list of the paths to every file in a directory tree (except in excluded subdirectories)
+        """
+        filepaths = []
+        for subdirpath, dirnames, filenames in os.walk(dirpath) :
+            subdirpath = pathlib.Path(subdirpath)
+            dirnames[:] = [dn for dn in dirnames if not self.is_excluded(subdirpath/dn)]
+            filepaths+=[subdirpath/fn for fn in filenames]
+        return filepaths
+
+class PollingFileWatcher(FileWatcher) :
+    """
+    A FileWatcher that scans the directory tree every few seconds for files whose size or modification time changed
+    """
+
+    @property
+    def poll_secs(self) :
+        return self.__poll_secs
+
+    def __init__(self,*args,poll_secs=POLL_SECS,**kwargs) :
+        """
+        poll_secs = the number of seconds between scans of the directory tree
+        """
+        super().__init__(*args,**kwargs)
+        self.__poll_secs = poll_secs
+        self.__last_scan = None
+        self.__stats = {}
+
+    def _wait_for_changes(self,timeout) :
+        if self.__last_scan is not None :
+            wait_secs = self.__last_scan+self.__poll_secs-time.monotonic()
+            if wait_secs>timeout :
+                time.sleep(timeout)
+                return []
+            if wait_secs>0 :
+                time.sleep(wait_secs)
+        self.__last_scan = time.monotonic()
+        stats = {}
+        for subdirpath, dirnames, filenames in os.walk(self.dirpath) :
+            subdirpath = pathlib.Path(subdirpath)
+            dirnames[:] = [dn for dn in dirnames if not self.is_excluded(subdirpath/dn)]
+            for filename in filenames :
+                try :
+                    stat = os.stat(subdirpath/filename)
+                except OSError :
+                    continue
+                stats[subdirpath/filename] = (stat.st_size,stat.st_mtime_ns)
+        changed = [filepath for filepath,stat in stats.items() if self.__stats.get(filepath)!=stat]
+        self.__stats = stats
+        return changed
+
+def get_file_watcher(dirpath,watch_method='auto',logger=None,poll_secs=POLL_SECS,**kwargs) :
+    """
+    Return a FileWatcher for a directory
+
+    watch_method = "inotify" or "polling" to use one type of watcher, or "auto" to use inotify if it's
+                   available and fall back to polling if it's not
+    logger = a logger to warn with if inotify isn't available
+    kwargs are passed to the FileWatcher
+    """
+    if watch_method not in WATCH_METHODS :
+        errmsg = f'ERROR: unrecognized watch method "{watch_method}" (options are {", ".join(WATCH_METHODS)})'
+        raise ValueError(errmsg)
+    if watch_method in ('auto','inotify') :
+        try :
+            return InotifyFileWatcher(dirpath,**kwargs)
+        except (OSError,AttributeError) as exc :
+            if watch_method=='inotify' :
+                raise
+            if logger is not None :
+                warnmsg = f'WARNING: could not watch {dirpath} with inotify, so it will be polled every '
+                warnmsg+= f'{poll_secs} seconds instead. Reason: {exc}'
+                logger.warning(warnmsg)
+    return PollingFileWatcher(dirpath,poll_secs=poll_secs,**kwargs)
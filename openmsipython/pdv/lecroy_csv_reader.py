@@ -0,0 +1,358 @@
+#imports
+import os, io, math, mmap, time, hashlib, pathlib, warnings, contextlib
+from argparse import ArgumentParser
+import numpy as np, pandas as pd
+from .config import LECROY_CONST
+
+# Reading selected rows from huge Lecroy oscilloscope CSV files without parsing everything before them
+
+#number of lines between the byte offsets in a line index
+LINE_INDEX_STRIDE = 4096
+#number of bytes of the file that are scanned for newlines at once while building an index
+SCAN_BLOCK_SIZE = 16*1024*1024
+#suffix of the names of the sidecar files holding cached line indices
+LINE_INDEX_SIDECAR_SUFFIX = '.lineindex.npz'
+
+class LineOffsetIndex :
+    """
+    A sparse index of the byte offsets where every stride-th line begins in a text file. Any line can be found
+    by counting the (at most stride) newlines after the indexed line before it, so only selected rows are parsed.
+    Indices are cached in sidecar files in a cache directory (never next to the data files, which may be watched)
+    along with the sizes and modification times of the files they were made from.
+    """
+
+    @property
+    def n_lines(self) :
+        return self.__n_lines # the total number of lines in the file (counting a last line with no newline)
+    @property
+    def file_size(self) :
+        return self.__file_size
+    @property
+    def offsets(self) :
+        return self.__offsets # the byte offsets where lines 0, stride, 2*stride, ... begin
+    @property
+    def stride(self) :
+        return self.__stride
+
+    def __init__(self,offsets,n_lines,file_size,stride=LINE_INDEX_STRIDE) :
+        self.__offsets = np.asarray(offsets,dtype=np.int64)
+        self.__n_lines = int(n_lines)
+        self.__file_size = int(file_size)
+        self.__stride = int(stride)
+
+    @classmethod
+    def from_buffer(cls,buffer,stride=LINE_INDEX_STRIDE) :
+        """
+        Build the index for a file's contents by scanning them for newlines
+
+        buffer = the contents of the file (a memory map or anything else supporting the buffer protocol)
+        """
+        data = np.frombuffer(buffer,dtype=np.uint8)
+        offsets = [0]
+        n_newlines = 0
+        for block_start in range(0,data.shape[0],SCAN_BLOCK_SIZE) :
+            newlines = np.flatnonzero(data[block_start:block_start+SCAN_BLOCK_SIZE]==ord('\n'))
+            # the lines that begin after newline number (k*stride - 1), counting from zero
+            first = (-(n_newlines+1))%stride
+            offsets.extend((block_start+newlines[first::stride]+1).tolist())
+            n_newlines+=newlines.shape[0]
+        n_lines = n_newlines if (data.shape[0]==0 or data[-1]==ord('\n')) else n_newlines+1
+        # an offset at the very end of the file doesn't start a line
+        if offsets[-1]>=data.shape[0] and len(offsets)>1 :
+            offsets = offsets[:-1]
+        return cls(offsets,n_lines,data.shape[0],stride)
+
+    @classmethod
+    def for_file(cls,filepath,buffer=None,use_sidecar=True,cache_dir=None) :
+        """
+        Return the index for a file, read from its sidecar file if one is up to date,
+        otherwise built from scratch (and written to a sidecar file if possible)
+
+        buffer = the memory-mapped contents of the file (mapped here if not given)
+        use_sidecar = set False to always build the index without reading or writing a sidecar file
+        cache_dir = the directory holding the sidecar files (default is LECROY_CONST.LINE_INDEX_CACHE_DIR)
+        """
+        filepath = pathlib.Path(filepath)
+        stat = filepath.stat()
+        sidecar_path = get_line_index_sidecar_path(filepath,cache_dir)
+        if use_sidecar and sidecar_path.is_file() :
+            try :
+                with np.load(sidecar_path) as cached :
+                    if (int(cached['file_size'])==stat.st_size and int(cached['mtime_ns'])==stat.st_mtime_ns
+                        and int(cached['stride'])==LINE_INDEX_STRIDE) :
+                        return cls(cached['offsets'],cached['n_lines'],cached['file_size'],cached['stride'])
+            except (OSError,ValueError,KeyError) :
+                pass
+        if buffer is None :
+            with map_file(filepath) as mapped :
+                index = cls.from_buffer(mapped)
+        else :
+            index = cls.from_buffer(buffer)
+        if use_sidecar :
+            index.write_sidecar(filepath,stat,cache_dir)
+        return index
+
+    def write_sidecar(self,filepath,stat=None,cache_dir=None) :
+        """
+        Write the index to the sidecar file for the file at filepath in cache_dir (default is
+        LECROY_CONST.LINE_INDEX_CACHE_DIR). Failures (like a directory that isn't writable) are ignored,
+        because the index can always be rebuilt.
+        """
+        filepath = pathlib.Path(filepath)
+        if stat is None :
+            stat = filepath.stat()
+        sidecar_path = get_line_index_sidecar_path(filepath,cache_dir)
+        temp_path = sidecar_path.with_name(sidecar_path.name+f'.{os.getpid()}.tmp')
+        try :
+            sidecar_path.parent.mkdir(parents=True,exist_ok=True)
+            with open(temp_path,'wb') as fp :
+                np.savez(fp,offsets=self.__offsets,n_lines=self.__n_lines,file_size=stat.st_size,
+                         mtime_ns=stat.st_mtime_ns,stride=self.__stride)
+            os.replace(temp_path,sidecar_path)
+        except OSError :
+            if temp_path.is_file() :
+                temp_path.unlink()
+
+    def get_line_offset(self,buffer,line) :
+        """
+        Return the byte offset where a line begins in the file whose contents are in buffer
+        (the size of the file if the line is past its end)
+        """
+        if line>=self.__n_lines :
+            return self.__file_size
+        offset = int(self.__offsets[line//self.__stride])
+        n_after = line%self.__stride
+        if n_after==0 :
+            return offset
+        # the line begins after the n_after-th newline after the indexed one
+        data = np.frombuffer(buffer,dtype=np.uint8)
+        block_size = 64*1024
+        while True :
+            newlines = np.flatnonzero(data[offset:offset+block_size]==ord('\n'))
+            if newlines.shape[0]>=n_after :
+                return offset+int(newlines[n_after-1])+1
+            n_after-=newlines.shape[0]
+            offset+=block_size
+
+def get_line_index_sidecar_path(filepath,cache_dir=None) :
+    """
+    Return the path to the file in cache_dir (default is LECROY_CONST.LINE_INDEX_CACHE_DIR) holding the cached
+    line index for the file at filepath. Its name includes a hash of the file's absolute path, so files with
+    the same name in different directories have different sidecar files.
+    """
+    filepath = pathlib.Path(filepath).resolve()
+    if cache_dir is None :
+        cache_dir = LECROY_CONST.LINE_INDEX_CACHE_DIR
+    path_hash = hashlib.sha1(str(filepath).encode()).hexdigest()[:16]
+    return pathlib.Path(cache_dir)/f'{filepath.name}.{path_hash}{LINE_INDEX_SIDECAR_SUFFIX}'
+
+@contextlib.contextmanager
+def map_file(filepath) :
+    """
+    Context manager for a read-only memory map of a file's contents
+    (an empty bytes object for an empty file, which can't be memory-mapped)
+    """
+    with open(filepath,'rb') as fp :
+        if os.fstat(fp.fileno()).st_size==0 :
+            yield b''
+            return
+        with mmap.mmap(fp.fileno(),0,access=mmap.ACCESS_READ) as mapped :
+            yield mapped
+
+def parse_csv_rows(text,n_columns) :
+    """
+    Return a 2-D array of the values in rows of comma-separated numbers (with n_columns in every row)
+    """
+    text = bytes(text).replace(b',',b' ')
+    with warnings.catch_warnings() :
+        warnings.simplefilter('error',DeprecationWarning)
+        try :
+            # with a whitespace separator, any amount of whitespace (including newlines) separates values
+            values = np.fromstring(text,sep=' ')
+        except (DeprecationWarning,ValueError) as e :
+            raise ValueError(f'ERROR: failed to parse rows of comma-separated numbers! Exception: {e}')
+    if values.shape[0]%n_columns!=0 :
+        errmsg = f'ERROR: found {values.shape[0]} values in rows of comma-separated numbers, which is not a '
+        errmsg+= f'multiple of the expected {n_columns} columns!'
+        raise ValueError(errmsg)
+    return values.reshape(-1,n_columns)
+
+def read_lecroy_csv_rows(filepath,rows_to_skip,nrows=None,use_sidecar=True,cache_dir=None) :
+    """
+    Return the time and voltage columns of the data in a Lecroy CSV file, selected the same way
+    pandas.read_csv(filepath,skiprows=rows_to_skip,nrows=nrows) would select them (the line after the
+    skipped rows is the header, and it's followed by nrows rows of data, or all of the rest if nrows is None)
+
+    use_sidecar = set False to skip reading/writing the cached line index
+    cache_dir = the directory holding cached line indices (default is LECROY_CONST.LINE_INDEX_CACHE_DIR)
+    """
+    with map_file(filepath) as mapped :
+        index = LineOffsetIndex.for_file(filepath,mapped,use_sidecar,cache_dir)
+        first_line = rows_to_skip+1
+        if first_line>index.n_lines :
+            raise ValueError(f'ERROR: {filepath} only has {index.n_lines} lines, but {rows_to_skip} were skipped!')
+        last_line = index.n_lines if nrows is None else min(first_line+nrows,index.n_lines)
+        start = index.get_line_offset(mapped,first_line)
+        end = index.get_line_offset(mapped,last_line)
+        data = parse_csv_rows(mapped[start:end],2)
+    return data[:,0], data[:,1]
+
+def parse_csv_columns(buffer,n_columns,skip_lines=0,dtypes=None) :
+    """
+    Return a list of 1-D arrays of the values in each column of rows of comma-separated numbers in a buffer,
+    skipping its first skip_lines lines. Like any other data read with pandas' default C parser, values can
+    differ from what float() would give by a unit in their last place (or more if they have more than about
+    eight significant digits).
+
+    buffer = the text to parse (bytes, a memoryview, a memory map, or anything else supporting the buffer protocol)
+    dtypes = a list of the dtypes of each column's array (default is double precision for every column)
+    """
+    if dtypes is None :
+        dtypes = [np.float64]*n_columns
+    try :
+        data = pd.read_csv(io.BytesIO(buffer),header=None,skiprows=skip_lines,names=list(range(n_columns)),
+                           dtype=dict(enumerate(dtypes)),engine='c')
+    except pd.errors.EmptyDataError :
+        return [np.empty(0,dtype=dtype) for dtype in dtypes]
+    return [data[icol].to_numpy() for icol in range(n_columns)]
+
+class IncrementalCSVParser :
+    """
+    Parses rows of comma-separated numbers fed to it in consecutive pieces (like the chunks of a downloaded file)
+    into preallocated column arrays, only holding on to the partial line at the end of each piece until the next
+    """
+
+    @property
+    def n_columns(self) :
+        return self.__n_columns
+    @property
+    def n_rows(self) :
+        return self.__n_rows # the number of rows parsed so far
+    @property
+    def n_bytes_fed(self) :
+        return self.__n_bytes_fed
+
+    def __init__(self,n_columns,skip_lines=0,dtypes=None,expected_size=None) :
+        """
+        skip_lines = the number of lines at the beginning of the data to skip
+        dtypes = a list of the dtypes of each column's array (default is double precision for every column)
+        expected_size = the total number of bytes expected to be fed, used to size the column arrays when the
+                        first rows are parsed (they're grown as needed if it's too small or not given)
+        """
+        self.__n_columns = n_columns
+        self.__lines_to_skip = skip_lines
+        self.__dtypes = dtypes if dtypes is not None else [np.float64]*n_columns
+        self.__expected_size = expected_size
+        self.__columns = None
+        self.__n_rows = 0
+        self.__n_bytes_fed = 0
+        #the partial line at the end of the last piece fed
+        self.__remainder = b''
+
+    def feed(self,data) :
+        """
+        Parse every complete line in the next piece of the data (and the partial line left over before it)
+        """
+        self.__n_bytes_fed+=len(data)
+        text = self.__remainder+data if len(self.__remainder)>0 else bytes(data)
+        start = 0
+        while self.__lines_to_skip>0 :
+            newline = text.find(b'\n',start)
+            if newline<0 :
+                #the rest of the piece is part of a skipped line
+                self.__remainder = b''
+                return
+            start = newline+1
+            self.__lines_to_skip-=1
+        end = text.rfind(b'\n',start)+1
+        if end>start :
+            self.__add_rows(memoryview(text)[start:end])
+        self.__remainder = text[max(start,end):]
+
+    def finish(self) :
+        """
+        Parse the last line (if it didn't end with a newline) and return a list of 1-D arrays of the values in
+        each column. Should be called once everything has been fed.
+        """
+        if self.__lines_to_skip==0 and len(self.__remainder.strip())>0 :
+            self.__add_rows(self.__remainder)
+        self.__remainder = b''
+        if self.__columns is None :
+            return [np.empty(0,dtype=dtype) for dtype in self.__dtypes]
+        return [column[:self.__n_rows] for column in self.__columns]
+
+    def __add_rows(self,text) :
+        """
+        Parse complete lines of text into the next rows of the columns, growing them if there isn't enough room
+        """
+        new_columns = parse_csv_columns(text,self.__n_columns,dtypes=self.__dtypes)
+        n_new = new_columns[0].shape[0]
+        if self.__columns is None :
+            capacity = n_new
+            if self.__expected_size is not None and len(text)>0 :
+                #assume the rest of the data have rows about as long as these ones
+                capacity = max(n_new,math.ceil(1.01*n_new*self.__expected_size/len(text)))
+            self.__columns = [np.empty(capacity,dtype=dtype) for dtype in self.__dtypes]
+        elif self.__n_rows+n_new>self.__columns[0].shape[0] :
+            capacity = max(2*self.__columns[0].shape[0],self.__n_rows+n_new)
+            grown = [np.empty(capacity,dtype=dtype) for dtype in self.__dtypes]
+            for new_column,column in zip(grown,self.__columns) :
+                new_column[:self.__n_rows] = column[:self.__n_rows]
+            self.__columns = grown
+        for column,new_column in zip(self.__columns,new_columns) :
+            column[self.__n_rows:self.__n_rows+n_new] = new_column
+        self.__n_rows+=n_new
+
+def make_synthetic_lecroy_csv(n_rows,fmt='%.6e',seed=0) :
+    """
+    Return the bytestring of a Lecroy CSV file with n_rows of evenly spaced times and random voltages
+    (written with the format fmt) after a five-line header
+    """
+    rng = np.random.default_rng(seed)
+    text = io.BytesIO()
+    text.write(b'LECROYWR,...\r\nSegments,1,SegmentSize,'+str(n_rows).encode()+b'\r\n')
+    text.write(b'Segment,TrigTime,TimeSinceSegment1\r\n#1,0,0\r\nTime,Ampl\r\n')
+    np.savetxt(text,np.column_stack((np.arange(n_rows)*1.25e-11-2e-8,0.01*rng.standard_normal(n_rows))),
+               delimiter=',',fmt=fmt,newline='\r\n')
+    return text.getvalue()
+
+def benchmark_csv_parsing(n_rows=(120000,1000000),fmts=('%.6e',),header_rows=4,n_repeats=3) :
+    """
+    Return a list of dictionaries with the best times taken to parse the time and voltage columns of synthetic
+    skimmed Lecroy CSV data into a DataFrame (the way they used to be read) and with parse_csv_columns,
+    and whether they got the same values
+    """
+    results = []
+    for fmt in fmts :
+        for n in n_rows :
+            bytestring = make_synthetic_lecroy_csv(n,fmt)
+            times = {}
+            for name in ('dataframe','columns') :
+                times[name] = float('inf')
+                for _ in range(n_repeats) :
+                    start_time = time.perf_counter()
+                    if name=='dataframe' :
+                        data = pd.read_csv(io.BytesIO(bytestring),skiprows=header_rows)
+                        expected = [data.iloc[:,0].to_numpy(),data.iloc[:,1].to_numpy()]
+                    else :
+                        columns = parse_csv_columns(bytestring,2,header_rows+1)
+                    times[name] = min(times[name],time.perf_counter()-start_time)
+            results.append({'format':fmt,'n_rows':n,'dataframe_time':times['dataframe'],
+                            'columns_time':times['columns'],
+                            'matches':all(np.array_equal(c,e) for c,e in zip(columns,expected))})
+    return results
+
+def main(args=None) :
+    parser = ArgumentParser(description='Benchmark parsing skimmed Lecroy CSV data into DataFrames and columns')
+    parser.add_argument('--n_rows',type=int,nargs='*',default=[120000,1000000])
+    parser.add_argument('--formats',nargs='*',default=['%.6e','%.9e','%.10f'])
+    parser.add_argument('--n_repeats',type=int,default=3)
+    args = parser.parse_args(args=args)
+    results = benchmark_csv_parsing(args.n_rows,args.formats,n_repeats=args.n_repeats)
+    print(f'{"Format":<8}{"Rows":>10}{"DataFrame [ms]":>16}{"columns [ms]":>14}{"Matches":>9}')
+    for result in results :
+        print(f'{result["format"]:<8}{result["n_rows"]:>10}{1000*result["dataframe_time"]:>16.2f}'
+              f'{1000*result["columns_time"]:>14.2f}{str(result["matches"]):>9}')
+
+if __name__=='__main__' :
+    main()
@@ -1,55 +1,435 @@
 #imports
+from threading import Lock
+from hashlib import sha512
+import numpy as np
+from openmsistream.data_file_io.config import RUN_OPT_CONST
+from openmsistream.data_file_io.entity.data_file_chunk import DataFileChunk
 from openmsistream.data_file_io.entity.upload_data_file import UploadDataFile
 from openmsistream.data_file_io.entity.download_data_file import DownloadDataFileToMemory
 from .config import LECROY_CONST
+from .lecroy_csv_reader import LineOffsetIndex, IncrementalCSVParser, map_file, parse_csv_columns
+from .lecroy_trc_file import is_trc_file, get_trc_select_bytes, LecroyWaveform
+from .event_window import check_window_options, get_row_windows, split_at_time_gaps
+from .skim_encoding import ENCODED_MAGIC, is_encoded_lecroy_data, EncodedLecroyData
+from .skim_compression import check_codec, compress_lecroy_data, is_compressed_lecroy_data, StreamingDecompressor
+
+def get_in_memory_chunks(filepath,filename,payload,chunk_size,rootdir=None,filename_append='',chunks_to_add=None) :
+    """
+    Return a list of DataFileChunks holding pieces of a bytestring in memory (instead of bytes to read from a file),
+    that will be reconstructed as a file with the given name when they're downloaded
+
+    chunks_to_add = a list of the chunk indices (starting from 1) to return (default is every chunk)
+    """
+    file_hash = sha512(payload).digest()
+    chunk_offsets = range(0,len(payload),chunk_size)
+    chunks = []
+    for ichunk,chunk_offset in enumerate(chunk_offsets,start=1) :
+        if chunks_to_add is None or ichunk in chunks_to_add :
+            data = payload[chunk_offset:chunk_offset+chunk_size]
+            chunks.append(DataFileChunk(filepath,filename,file_hash,sha512(data).digest(),chunk_offset,chunk_offset,
+                                        len(data),ichunk,len(chunk_offsets),rootdir=rootdir,
+                                        filename_append=filename_append,data=data))
+    return chunks
 
 class UploadLecroyDataFile(UploadDataFile) :
     """
-    A Lecroy oscilloscope file to upload
+    A Lecroy oscilloscope file to upload (either a CSV file or a binary waveform file)
+
+    If skimming is deferred, the file isn't read to find the rows to select until they're needed (or until
+    skim is called, from a worker thread for example), and it isn't ready to upload until it's been skimmed.
     """
 
     @property
     def select_bytes(self):
+        self.__find_select_bytes()
         return self.__select_bytes
+    @property
+    def rows_to_skip(self) :
+        return self.row_windows[0][0] # the number of rows skipped (found from the event position if requested)
+    @property
+    def row_windows(self) :
+        self.__find_select_bytes()
+        return list(self.__row_windows) # (rows_to_skip, rows_to_select) of each window of selected rows
+    @property
+    def encode_skimmed_data(self) :
+        self.__find_select_bytes()
+        return self.__encode_skimmed_data
+    @property
+    def skimmed(self) :
+        return self.__skimmed # False until the chunks of a file whose skimming was deferred have been made
+    @property
+    def waiting_to_upload(self) :
+        return self.__skimmed and super().waiting_to_upload
+    @property
+    def upload_in_progress(self) :
+        return self.__skimmed and super().upload_in_progress
+    @property
+    def compression(self) :
+        return self.__compression # the codec the skimmed data are compressed with (None if they're not)
     
     def __init__(self,filepath,header_rows=LECROY_CONST.HEADER_ROWS,
                  rows_to_skip=LECROY_CONST.ROWS_TO_SKIP,
                  rows_to_select=LECROY_CONST.ROWS_TO_SELECT,
+                 find_event_window=False,
+                 event_margin_rows=LECROY_CONST.EVENT_MARGIN_ROWS,
+                 row_windows=None,
+                 time_windows=None,
+                 encode_skimmed_data=False,
+                 compression=None,
+                 compression_level=None,
+                 filename_append=None,
+                 defer_skimming=False,
                  **kwargs) :
-        super().__init__(filepath,**kwargs)
-        self.__select_bytes = self.__get_select_bytes(header_rows,rows_to_skip,rows_to_select)
-
-    def __get_select_bytes(self,header_rows,rows_to_skip,rows_to_select) :
-        """
-        Return the list of byte range tuples that should be uploaded (the header lines and rows in rows_to_select)
-        """
-        #get the number of bytes in the header, rows to skip, and rows to select
-        n_header_bytes = 0
-        n_rows_to_skip_bytes = 0
-        n_rows_to_select_bytes = 0
-        with open(self.filepath,'rb') as fp :
-            for i in range(header_rows) :
-                n_header_bytes+=len(fp.readline())
-            for i in range(rows_to_skip-header_rows) :
-                n_rows_to_skip_bytes+=len(fp.readline())
-            for i in range(rows_to_select) :
-                n_rows_to_select_bytes+=len(fp.readline())
-        #return the ranges for the header and the selected rows
-        to_return = []
-        to_return.append((0,n_header_bytes))
-        to_return.append((n_header_bytes+n_rows_to_skip_bytes,
-                          n_header_bytes+n_rows_to_skip_bytes+n_rows_to_select_bytes))
+        """
+        find_event_window = if True, scan the file for the event and skip rows so that the selected rows begin
+                            event_margin_rows before it (falling back to rows_to_skip if no event is found)
+        row_windows = a list of (rows_to_skip, rows_to_select) tuples to select several windows of rows
+                      instead of the one set by rows_to_skip and rows_to_select
+        time_windows = a list of (start time, stop time) tuples to select the rows in several windows of time
+                       (can't be used with row_windows)
+        encode_skimmed_data = if True, upload the selected rows as EncodedLecroyData instead of the raw bytes
+        compression = the codec to compress the skimmed data with before uploading them (None to not compress them)
+        compression_level = the level to compress the skimmed data at (None for the codec's default)
+        defer_skimming = if True, don't read the file to find the rows to select until they're needed or skim
+                         is called, and don't consider the file ready to upload until skim has been called
+        """
+        super().__init__(filepath,filename_append=filename_append,**kwargs)
+        if compression is not None :
+            check_codec(compression)
+        check_window_options(find_event_window,row_windows,time_windows)
+        self.__header_rows = header_rows
+        self.__window_kwargs = {'header_rows':header_rows,
+                                'rows_to_skip':rows_to_skip,
+                                'rows_to_select':rows_to_select,
+                                'find_event_window':find_event_window,
+                                'event_margin_rows':event_margin_rows,
+                                'row_windows':row_windows,
+                                'time_windows':time_windows,
+                               }
+        self.__encode_skimmed_data = encode_skimmed_data
+        self.__compression = compression
+        self.__compression_level = compression_level
+        self.__filename_append = filename_append if filename_append is not None else ''
+        self.__row_windows = None
+        self.__select_bytes = None
+        self.__skim_lock = Lock()
+        self.__skimmed = not defer_skimming
+        if not defer_skimming :
+            self.__find_select_bytes()
+
+    def skim(self,chunk_size=RUN_OPT_CONST.DEFAULT_CHUNK_SIZE) :
+        """
+        Find the rows to select from the file and break them into chunks to upload (if that hasn't been done yet)
+        """
+        self.__find_select_bytes()
+        if not self.__skimmed :
+            self.add_chunks_to_upload(chunk_size=chunk_size)
+
+    def add_chunks_to_upload(self,chunks_to_add=None,chunk_size=RUN_OPT_CONST.DEFAULT_CHUNK_SIZE) :
+        """
+        Add chunks of the selected data to the internal list of chunks to upload. If the skimmed data are
+        encoded or compressed, the chunks hold pieces of the encoded/compressed data in memory instead of
+        bytes read from the file.
+        """
+        self.__find_select_bytes()
+        if not (self.__encode_skimmed_data or self.__compression is not None) :
+            super().add_chunks_to_upload(chunks_to_add,chunk_size)
+            self.__skimmed = True
+            return
+        try :
+            payload = self.__get_skimmed_payload()
+        except Exception as exc :
+            fp = self.filepath.relative_to(self.rootdir) if self.rootdir is not None else self.filepath
+            errmsg = f'ERROR: was not able to encode/compress the data selected from {fp} for uploading. '
+            errmsg+= 'Check log lines below for details on what went wrong. File will not be uploaded.'
+            self.logger.error(errmsg,exc_info=exc)
+            self.to_upload = False
+            self.__skimmed = True
+            return
+        self.chunks_to_upload+=get_in_memory_chunks(self.filepath,self.filename,payload,chunk_size,
+                                                    rootdir=self.rootdir,filename_append=self.__filename_append,
+                                                    chunks_to_add=chunks_to_add)
+        self.__skimmed = True
+
+    def __find_select_bytes(self) :
+        """
+        Find the windows of rows to select and the byte ranges holding them, if they haven't been found yet
+        """
+        with self.__skim_lock :
+            if self.__select_bytes is not None :
+                return
+            header_rows = self.__header_rows
+            self.__row_windows = get_row_windows(self.filepath,logger=self.logger,**self.__window_kwargs)
+            if is_trc_file(self.filepath) :
+                if len(self.__row_windows)>1 and not self.__encode_skimmed_data :
+                    #skimmed binary files don't record which samples were selected, so windows couldn't be told apart
+                    warnmsg = f'WARNING: several windows of samples from {self.filepath} can only be uploaded '
+                    warnmsg+= 'encoded, so the skimmed data will be encoded'
+                    self.logger.warning(warnmsg)
+                    self.__encode_skimmed_data = True
+                #select the same samples from binary files as the rows that would be selected from their CSV exports
+                select_bytes = []
+                for window_rows_to_skip,window_rows_to_select in self.__row_windows :
+                    window_select_bytes = get_trc_select_bytes(self.filepath,window_rows_to_skip-header_rows,
+                                                               window_rows_to_select)
+                    if len(select_bytes)==0 :
+                        select_bytes.append(window_select_bytes[0])
+                    select_bytes+=window_select_bytes[1:]
+                self.__select_bytes = select_bytes
+            else :
+                self.__select_bytes = self.__get_select_bytes(header_rows,self.__row_windows)
+
+    def __get_skimmed_payload(self) :
+        """
+        Return the bytestring of the skimmed data to upload (encoded and/or compressed)
+        """
+        if self.__encode_skimmed_data :
+            payload = EncodedLecroyData.from_lecroy_file(self.filepath,self.__header_rows,
+                                                         row_windows=self.__row_windows).to_bytes()
+        else :
+            payload = b''
+            with open(self.filepath,'rb') as fp :
+                for start,stop in self.__select_bytes :
+                    fp.seek(start)
+                    payload+=fp.read(stop-start)
+        if self.__compression is not None :
+            payload = compress_lecroy_data(payload,self.__compression,self.__compression_level)
+        return payload
+
+    def __get_select_bytes(self,header_rows,row_windows) :
+        """
+        Return the list of byte range tuples that should be uploaded (the header lines and the rows in each window)
+        """
+        #find where the header ends and where the selected rows begin and end using the file's line offset index
+        #(read from its sidecar file if the file has been indexed before)
+        with map_file(self.filepath) as mapped :
+            index = LineOffsetIndex.for_file(self.filepath,mapped)
+            n_header_bytes = index.get_line_offset(mapped,header_rows)
+            #return the ranges for the header and the selected rows
+            to_return = []
+            to_return.append((0,n_header_bytes))
+            for rows_to_skip,rows_to_select in row_windows :
+                first_row = max(rows_to_skip,header_rows)
+                select_start = index.get_line_offset(mapped,first_row)
+                select_stop = index.get_line_offset(mapped,first_row+rows_to_select)
+                to_return.append((select_start,select_stop))
         return to_return
         
 class DownloadLecroyDataFile(DownloadDataFileToMemory) :
     """
-    A Lecroy oscilloscope file downloaded to memory
+    A Lecroy oscilloscope file downloaded to memory. If the skimmed data were compressed,
+    they're decompressed as the chunks holding them arrive. Raw CSV data can also be parsed into
+    time and voltage arrays as the chunks arrive, so that the text of the file is never held in memory.
     """
 
     @property
     def header_rows(self):
         return self.__header_rows
+    @property
+    def compression_metadata(self) :
+        if not self.__compressed :
+            return None
+        return self.__decompressor.metadata # the codec, level, etc. the skimmed data were compressed with
+    @property
+    def parsed_incrementally(self) :
+        return self.__columns is not None # True once raw CSV data have been parsed as their chunks arrived
+    @property
+    def bytestring(self) :
+        if self.__parse_error is not None :
+            raise self.__parse_error
+        if self.__columns is not None :
+            errmsg = f'ERROR: the data in {self.filepath} were parsed as they arrived, so their raw text is not '
+            errmsg+= 'available!'
+            raise ValueError(errmsg)
+        if self.__streamed :
+            if self.__content_bytestring is None :
+                self.__content_bytestring = self.__decompressor.get_decompressed()
+            return self.__content_bytestring
+        return super().bytestring
+    @bytestring.setter
+    def bytestring(self,new_bytestring) :
+        DownloadDataFileToMemory.bytestring.fset(self,new_bytestring)
+    @property
+    def check_file_hash(self) :
+        if self.__streamed :
+            return self.__stream_hash.digest() # the hash of the chunks' data, as they were uploaded
+        return super().check_file_hash
 
-    def __init__(self,*args,header_rows=LECROY_CONST.HEADER_ROWS,**kwargs) :
+    def __init__(self,*args,header_rows=LECROY_CONST.HEADER_ROWS,parse_incrementally=False,voltage_dtype=None,
+                 **kwargs) :
+        """
+        parse_incrementally = set True to parse raw CSV data (compressed or not) into time and voltage arrays
+                              as their chunks arrive instead of holding on to their text until they've all arrived
+        voltage_dtype = the dtype to parse voltages as when they're parsed incrementally (default is double precision)
+        """
         super().__init__(*args,**kwargs)
         self.__header_rows = header_rows
+        #encoded data and skimmed binary files are always held until they're complete
+        self.__parse_incrementally = parse_incrementally and not is_trc_file(self.filepath)
+        self.__voltage_dtype = voltage_dtype
+        #whether the data are compressed (and so whether they're processed in order as they arrive)
+        #isn't known until the first chunk arrives
+        self.__compressed = None
+        self.__streamed = None
+        self.__pending_chunks = {}
+        self.__next_offset = 0
+        self.__n_chunks_streamed = 0
+        self.__stream_hash = sha512()
+        self.__decompressor = None
+        #the pieces of the (decompressed) data held until they show whether they're raw CSV data to parse
+        #(or until they're all here, if they're not)
+        self.__content_pieces = []
+        self.__hold_content = False
+        self.__parser = None
+        self.__parse_error = None
+        self.__columns = None
+        self.__content_bytestring = None
+
+    def _on_add_chunk(self,dfc) :
+        """
+        Decompress and/or parse the consecutive chunks from the beginning of the file that have arrived so far
+        if the data are compressed or parsed incrementally, otherwise add the chunk's data to the file as usual
+        """
+        if self.__streamed is False :
+            super()._on_add_chunk(dfc)
+            return
+        self.__pending_chunks[dfc.chunk_offset_write] = dfc
+        if self.__streamed is None :
+            if 0 not in self.__pending_chunks :
+                return
+            first_data = self.__pending_chunks[0].data
+            self.__compressed = is_compressed_lecroy_data(first_data)
+            self.__streamed = self.__compressed or self.__parse_incrementally
+            if not self.__streamed :
+                for pending_dfc in self.__pending_chunks.values() :
+                    super()._on_add_chunk(pending_dfc)
+                self.__pending_chunks = {}
+                return
+            if self.__compressed :
+                self.__decompressor = StreamingDecompressor(keep_decompressed=not self.__parse_incrementally)
+        while self.__next_offset in self.__pending_chunks :
+            data = self.__pending_chunks.pop(self.__next_offset).data
+            self.__stream_hash.update(data)
+            self.__next_offset+=len(data)
+            self.__n_chunks_streamed+=1
+            if self.__compressed :
+                data = self.__decompressor.feed(data)
+            if self.__parse_incrementally :
+                self.__add_content(data)
+        if self.__parse_incrementally and self.__n_chunks_streamed==self.n_total_chunks :
+            if self.__compressed :
+                self.__add_content(self.__decompressor.finish())
+            self.__finish_content()
+
+    def __add_content(self,data) :
+        """
+        Parse the next piece of the (decompressed) data if they're raw CSV data, otherwise hold on to it
+        """
+        if self.__parse_error is not None :
+            return
+        if self.__parser is not None :
+            try :
+                self.__parser.feed(data)
+            except ValueError as exc :
+                self.__stop_parsing(exc)
+            return
+        self.__content_pieces.append(data)
+        if (not self.__hold_content) and sum(len(piece) for piece in self.__content_pieces)>=len(ENCODED_MAGIC) :
+            self.__start_parsing()
+
+    def __start_parsing(self) :
+        """
+        Start parsing the data held so far if they're raw CSV data (and not encoded)
+        """
+        head = b''.join(self.__content_pieces)
+        if is_encoded_lecroy_data(head) :
+            #keep holding on to the pieces until they're all here
+            self.__content_pieces = [head]
+            self.__hold_content = True
+            return
+        if self.__compressed :
+            expected_size = self.__decompressor.metadata['uncompressed_size']
+        else :
+            #every chunk but the last is as big as the first
+            expected_size = self.n_total_chunks*len(head)
+        #only the header rows are skipped (the selected rows begin right after them, like in encoded data)
+        self.__parser = IncrementalCSVParser(2,self.__header_rows,
+                                             dtypes=[np.float64,self.__voltage_dtype or np.float64],
+                                             expected_size=expected_size)
+        self.__content_pieces = []
+        self.__add_content(head)
+
+    def __stop_parsing(self,exc) :
+        """
+        Stop parsing data that turned out not to be rows of numbers, and remember why to raise later
+        """
+        self.__parse_error = exc
+        self.__parser = None
+        self.__content_pieces = []
+
+    def __finish_content(self) :
+        """
+        Finish parsing the data if they're raw CSV data, otherwise put the pieces held together
+        """
+        if self.__parse_error is not None :
+            return
+        if self.__parser is None and not self.__hold_content :
+            self.__start_parsing()
+        if self.__parser is not None :
+            try :
+                self.__columns = self.__parser.finish()
+            except ValueError as exc :
+                self.__stop_parsing(exc)
+            self.__parser = None
+        else :
+            self.__content_bytestring = b''.join(self.__content_pieces)
+            self.__content_pieces = []
+
+    def get_time_and_voltage(self,voltage_dtype=None) :
+        """
+        Return the time and voltage columns of the data in the file as numpy arrays
+
+        voltage_dtype = the dtype to return the voltages as (default is double precision,
+                        or the dtype they were parsed as if they were parsed incrementally)
+        """
+        if self.__columns is not None :
+            time, voltage = self.__columns
+            return time, voltage if voltage_dtype is None else voltage.astype(voltage_dtype,copy=False)
+        if is_encoded_lecroy_data(self.bytestring) :
+            encoded = EncodedLecroyData.from_bytes(self.bytestring)
+            return encoded.get_time(), encoded.get_voltage(voltage_dtype or 'float64')
+        if is_trc_file(self.filepath) :
+            #skimmed binary files don't record which samples were selected, so their times
+            #start at the horizontal offset of the waveform
+            waveform = LecroyWaveform(self.bytestring)
+            return waveform.get_time(), waveform.get_voltage(dtype=voltage_dtype or 'float64')
+        #only the header rows are skipped (the selected rows begin right after them, like in encoded data)
+        time, voltage = parse_csv_columns(self.bytestring,2,self.header_rows,
+                                          dtypes=[np.float64,voltage_dtype or np.float64])
+        return time, voltage
+
+    def get_windows(self,voltage_dtype=None) :
+        """
+        Return a list of (time, voltage) tuples of numpy arrays for each window of rows selected from the file
+
+        voltage_dtype = the dtype to return the voltages as (default is double precision)
+        """
+        if self.__columns is None and is_encoded_lecroy_data(self.bytestring) :
+            return EncodedLecroyData.from_bytes(self.bytestring).get_windows(voltage_dtype or 'float64')
+        time, voltage = self.get_time_and_voltage(voltage_dtype)
+        if is_trc_file(self.filepath) :
+            #several windows of samples from binary files are always encoded
+            return [(time,voltage)]
+        #the windows in raw CSV files are only separated by jumps in the times of their rows
+        return split_at_time_gaps(time,voltage)
+
+    def get_csv_bytestring(self) :
+        """
+        Return the contents of the skimmed file as a Lecroy CSV file
+        (reconstructed if the skimmed data were encoded)
+        """
+        if is_encoded_lecroy_data(self.bytestring) :
+            return EncodedLecroyData.from_bytes(self.bytestring).to_csv_bytes()
+        if is_trc_file(self.filepath) :
+            raise ValueError(f'ERROR: {self.filepath} is a binary waveform file that was not encoded!')
+        return self.bytestring
@@ -1,44 +1,322 @@
 #imports
 import datetime
+from concurrent.futures import ProcessPoolExecutor, wait
 from openmsistream import DataFileUploadDirectory
 from openmsistream.data_file_io.config import RUN_OPT_CONST
+from .argument_parsing import LecroyArgumentParser
 from .config import LECROY_CONST
-from .lecroy_data_file import UploadLecroyDataFile
+from .event_window import check_window_options
+from .lecroy_csv_reader import LINE_INDEX_SIDECAR_SUFFIX
+from .lecroy_data_file import get_in_memory_chunks, UploadLecroyDataFile
+from .skimming_pool import SkimmingPool
+from .file_watcher import WATCH_METHODS as FILE_WATCH_METHODS
+from .file_watcher import QUIESCENT_SECS, POLL_SECS, get_file_watcher
+from .edge_analysis import PDV_ANALYSIS_TYPES, analyze_lecroy_file
+
+#ways new files can be found (with a FileWatcher, or by the base class scanning the directory)
+WATCH_METHODS = (*FILE_WATCH_METHODS,'scan')
+#longest time (in seconds) to wait for new files when there's nothing else to do (so commands are still responsive)
+IDLE_WATCH_SECS = 0.5
+#longest time to wait for new files while files are being skimmed or analyzed in the background
+BUSY_WATCH_SECS = 0.02
 
 class LecroyFileUploadDirectory(DataFileUploadDirectory) :
     """
     A class to select the relevant data from a Lecroy oscilloscope file 
     and upload it to a kafka topic as a group of messages
+
+    In edge analysis mode, each new file is analyzed in a pool of worker processes instead, and only a compact
+    record of the result and a thumbnail of the velocity trace are uploaded (to a separate results topic).
+    The skimmed data are only uploaded for files whose analysis fails (or for every file if requested).
+
+    New files are skimmed in a bounded pool of worker threads (unless n_skim_workers is zero), so that several
+    can be read at once while the directory is watched.
+
+    New files are found by watching the directory with inotify on Linux (or by polling it elsewhere) instead of
+    rescanning it with a growing wait time, and they're only picked up once they're done being written.
     """
 
+    ARGUMENT_PARSER_TYPE = LecroyArgumentParser
+
+    @property
+    def analyzed_filepaths(self) :
+        return list(self.__analyzed_filepaths) # paths of the files whose results were uploaded in edge analysis mode
+
     @property
     def other_datafile_kwargs(self) :
         return {'header_rows':self.__header_rows,
-                'rows_to_skip':self.__rows_to_skip,
-                'rows_to_select':self.__rows_to_select,
+                **self.__window_kwargs,
+                'encode_skimmed_data':self.__encode_skimmed_data,
+                'compression':self.__compression,
+                'compression_level':self.__compression_level,
                 'filename_append':LECROY_CONST.SKIMMED_FILENAME_APPEND,
+                'defer_skimming':self.__n_skim_workers>0,
                 }
 
     def __init__(self,*args,
                  header_rows=LECROY_CONST.HEADER_ROWS,
                  rows_to_skip=LECROY_CONST.ROWS_TO_SKIP,
                  rows_to_select=LECROY_CONST.ROWS_TO_SELECT,
+                 find_event_window=False,
+                 event_margin_rows=LECROY_CONST.EVENT_MARGIN_ROWS,
+                 row_windows=None,
+                 time_windows=None,
+                 encode_skimmed_data=False,
+                 compression=None,
+                 compression_level=None,
+                 edge_analysis=None,
+                 results_topic_name=LECROY_CONST.RESULTS_TOPIC_NAME,
+                 n_analysis_workers=1,
+                 upload_skimmed_data=False,
+                 n_skim_workers=LECROY_CONST.N_SKIM_WORKERS,
+                 skim_queue_max_size=LECROY_CONST.SKIM_QUEUE_MAX_MEGABYTES,
+                 watch_method='auto',
+                 quiescent_secs=QUIESCENT_SECS,
+                 poll_secs=POLL_SECS,
                  **kwargs) :
         """
         dirpath = path to the directory to watch
         header_rows = the number of rows in the raw files making up the header
         rows_to_skip = the number of rows in the raw files to completely ignore at the beginning
         rows_to_select = the number of rows to select in the raw files after the initial skip
+        find_event_window = if True, find the event in each raw file and skip rows so that the selected rows
+                            begin event_margin_rows before it (instead of always skipping rows_to_skip)
+        event_margin_rows = the number of rows before the event to select when find_event_window is True
+        row_windows = a list of (rows_to_skip, rows_to_select) tuples to select several windows of rows from each
+                      raw file instead of the one set by rows_to_skip and rows_to_select
+        time_windows = a list of (start time, stop time) tuples to select the rows in several windows of time
+                       from each raw file (can't be used with row_windows)
+        encode_skimmed_data = if True, upload the selected rows in a compact binary encoding
+                              (uniform times and packed voltages) instead of as raw bytes
+        compression = the codec to compress the skimmed data with ("zlib", "zstd", or "lz4"; None to not compress)
+        compression_level = the level to compress the skimmed data at (None for the codec's default)
+        edge_analysis = the type of analysis ("spall" or "velocity") to run for each new file before uploading it
+                        (None to just upload the skimmed data as usual)
+        results_topic_name = the name of the topic to upload the results of the analyses to
+        n_analysis_workers = the number of worker processes to run the analyses in
+        upload_skimmed_data = if True, upload the skimmed data for every file in edge analysis mode
+                              (by default they're only uploaded for files whose analysis fails)
+        n_skim_workers = the number of worker threads to skim new files in (the most files that are read at once;
+                         zero to skim files one at a time in the thread watching the directory)
+        skim_queue_max_size = the maximum size (in MB) of the data selected from files that have been skimmed but
+                              not yet added to the upload queue
+        watch_method = how to find new files: "inotify" or "polling" to use a FileWatcher, "auto" to use inotify
+                       if it's available and polling if it's not, or "scan" to rescan the whole directory
+                       with a growing wait time like other DataFileUploadDirectories
+        quiescent_secs = the number of seconds a new file's size and modification time must stay the same
+                         before it's skimmed (when a FileWatcher is used)
+        poll_secs = the number of seconds between scans of the directory when polling
         """
+        check_window_options(find_event_window,row_windows,time_windows)
         self.__header_rows = header_rows
-        self.__rows_to_skip = rows_to_skip
-        self.__rows_to_select = rows_to_select
+        self.__window_kwargs = {'rows_to_skip':rows_to_skip,
+                                'rows_to_select':rows_to_select,
+                                'find_event_window':find_event_window,
+                                'event_margin_rows':event_margin_rows,
+                                'row_windows':row_windows,
+                                'time_windows':time_windows,
+                               }
+        self.__encode_skimmed_data = encode_skimmed_data
+        self.__compression = compression
+        self.__compression_level = compression_level
+        if edge_analysis is not None and edge_analysis not in PDV_ANALYSIS_TYPES :
+            errmsg = f'ERROR: unrecognized edge analysis type "{edge_analysis}" '
+            errmsg+= f'(options are {", ".join(PDV_ANALYSIS_TYPES.keys())})'
+            raise ValueError(errmsg)
+        self.__edge_analysis = edge_analysis
+        self.__results_topic_name = results_topic_name
+        self.__n_analysis_workers = n_analysis_workers
+        self.__upload_skimmed_data = upload_skimmed_data
+        self.__analysis_executor = None
+        self.__results_producer = None
+        self.__n_skim_workers = n_skim_workers
+        self.__skim_queue_max_size = skim_queue_max_size
+        self.__skimming_pool = None
+        self.__chunk_size = RUN_OPT_CONST.DEFAULT_CHUNK_SIZE
+        self.__analyses_in_progress = {}
+        self.__seen_filepaths = set()
+        self.__analyzed_filepaths = []
+        if watch_method not in WATCH_METHODS :
+            errmsg = f'ERROR: unrecognized watch method "{watch_method}" (options are {", ".join(WATCH_METHODS)})'
+            raise ValueError(errmsg)
+        self.__watch_method = watch_method
+        self.__quiescent_secs = quiescent_secs
+        self.__poll_secs = poll_secs
+        self.__watcher = None
+        self.__watching = False
         super().__init__(*args,datafile_type=UploadLecroyDataFile,**kwargs)
 
+    def upload_files_as_added(self,topic_name,chunk_size=RUN_OPT_CONST.DEFAULT_CHUNK_SIZE,**kwargs) :
+        """
+        Watch for new files to be added to the directory and skim and upload them
+        (or analyze them and upload their results, in edge analysis mode)
+        """
+        self.__chunk_size = chunk_size
+        if self.__watch_method!='scan' :
+            #start watching before the directory is first scanned so that no new files are missed
+            self.__watcher = get_file_watcher(self.dirpath,self.__watch_method,logger=self.logger,
+                                              poll_secs=self.__poll_secs,quiescent_secs=self.__quiescent_secs,
+                                              exclude_dirs=[self.dirpath/self.LOG_SUBDIR_NAME],
+                                              exclude_suffixes=[LINE_INDEX_SIDECAR_SUFFIX])
+            self.__watching = False
+        if self.__n_skim_workers>0 :
+            self.__skimming_pool = SkimmingPool(self.__n_skim_workers,int(1000000*self.__skim_queue_max_size),
+                                                chunk_size)
+        if self.__edge_analysis is None :
+            return super().upload_files_as_added(topic_name,chunk_size=chunk_size,**kwargs)
+        self.__results_producer = self.get_new_producer()
+        with ProcessPoolExecutor(max_workers=self.__n_analysis_workers) as executor :
+            self.__analysis_executor = executor
+            to_return = super().upload_files_as_added(topic_name,chunk_size=chunk_size,**kwargs)
+        self.__analysis_executor = None
+        return to_return
+
+    def filepath_should_be_uploaded(self,filepath) :
+        #cached line indices (which used to be written next to the data files) are never uploaded
+        if filepath.name.endswith(LINE_INDEX_SIDECAR_SUFFIX) :
+            return False
+        return super().filepath_should_be_uploaded(filepath)
+
+    def _DataFileUploadDirectory__find_new_files(self,to_upload=True) :
+        #once the watcher takes over it finds the new files, so the base class never scans the whole directory again
+        if self.__watching :
+            return
+        super()._DataFileUploadDirectory__find_new_files(to_upload)
+
+    def _run_iteration(self) :
+        if self.__watcher is not None :
+            if not self.__watching :
+                #the first iteration scans the whole directory like usual to pick up any files already in it
+                super()._run_iteration()
+                self.__watching = True
+                return
+            self.__add_quiescent_files()
+        #files have to be found before any of their chunks are enqueued to hold their skimmed data back
+        if self.__edge_analysis is not None :
+            self.__submit_new_files_for_analysis()
+        if self.__skimming_pool is not None :
+            self.__submit_files_for_skimming()
+        #with a watcher, the base class only has to run when there's something to enqueue
+        if self.__watcher is None or self.have_file_to_upload :
+            super()._run_iteration()
+        if self.__edge_analysis is not None :
+            self.__submit_new_files_for_analysis()
+            self.__upload_finished_analyses()
+        if self.__skimming_pool is not None :
+            self.__submit_files_for_skimming()
+
+    def _on_shutdown(self) :
+        if self.__edge_analysis is not None :
+            #wait for the analyses that are still running and upload their results
+            self.logger.info('Waiting for the analyses of files already found to finish...')
+            self.__upload_finished_analyses(wait_for_all=True)
+            self.__results_producer.flush(timeout=-1)
+            self.__results_producer.close()
+        if self.__skimming_pool is not None :
+            #finish skimming every file that's waiting so that the rest of the shutdown can upload them
+            self.__submit_files_for_skimming()
+            self.__skimming_pool.shutdown()
+            self.__submit_files_for_skimming()
+        if self.__watcher is not None :
+            self.__watcher.close()
+            self.__watcher = None
+            self.__watching = False
+        super()._on_shutdown()
+
+    def __add_quiescent_files(self) :
+        """
+        Wait for the watcher to find new files that are done being written and add them to be uploaded.
+        Only waits as long as nothing else needs to be done.
+        """
+        if self.have_file_to_upload :
+            timeout = 0.
+        elif (len(self.__analyses_in_progress)>0 or
+                (self.__skimming_pool is not None and self.__skimming_pool.n_in_progress>0)) :
+            timeout = BUSY_WATCH_SECS
+        else :
+            timeout = IDLE_WATCH_SECS
+        for filepath in self.__watcher.get_quiescent_files(timeout) :
+            filepath = filepath.resolve()
+            if filepath in self.data_files_by_path or not self.filepath_should_be_uploaded(filepath) :
+                continue
+            self.data_files_by_path[filepath] = UploadLecroyDataFile(filepath,
+                                                                     to_upload=True,
+                                                                     rootdir=self.dirpath,
+                                                                     logger=self.logger,
+                                                                     **self.other_datafile_kwargs)
+
+    def __submit_files_for_skimming(self) :
+        """
+        Start skimming any files that should be uploaded but haven't been skimmed yet in the pool of
+        skimming workers, and stop uploading any files that failed to be skimmed
+        """
+        for datafile,exc in self.__skimming_pool.release_enqueued() :
+            rel_filepath = datafile.filepath.relative_to(self.dirpath)
+            errmsg = f'ERROR: failed to skim {rel_filepath}. The traceback of the Exception will be logged below. '
+            errmsg+= 'File will not be uploaded.'
+            self.logger.error(errmsg,exc_info=exc)
+            datafile.to_upload = False
+        for datafile in self.data_files_by_path.values() :
+            if datafile.to_upload and not datafile.skimmed :
+                self.__skimming_pool.submit(datafile)
+
+    def __submit_new_files_for_analysis(self) :
+        """
+        Start analyzing any new files waiting to be uploaded, holding their skimmed data back
+        until their analyses are done (unless the skimmed data for every file should be uploaded)
+        """
+        for filepath,datafile in self.data_files_by_path.items() :
+            if filepath in self.__seen_filepaths :
+                continue
+            self.__seen_filepaths.add(filepath)
+            #files that aren't going to be uploaded or that were in progress during a previous run are skipped
+            if (not datafile.to_upload) or datafile.fully_enqueued or len(datafile.chunks_to_upload)>0 :
+                continue
+            datafile.to_upload = self.__upload_skimmed_data
+            #the rows to analyze are found in the worker process the same way they'd be found to skim the file
+            future = self.__analysis_executor.submit(analyze_lecroy_file,self.__edge_analysis,filepath,
+                                                     self.__header_rows,window_kwargs=self.__window_kwargs)
+            self.__analyses_in_progress[future] = datafile
+
+    def __upload_finished_analyses(self,wait_for_all=False) :
+        """
+        Produce the result records and thumbnails of any finished analyses to the results topic,
+        and set the files whose analyses failed to have their skimmed data uploaded instead
+
+        wait_for_all = if True, wait for every analysis in progress to finish first
+        """
+        if wait_for_all and len(self.__analyses_in_progress)>0 :
+            wait(self.__analyses_in_progress.keys())
+        for future in [future for future in self.__analyses_in_progress if future.done()] :
+            datafile = self.__analyses_in_progress.pop(future)
+            rel_filepath = datafile.filepath.relative_to(self.dirpath)
+            exc = future.exception()
+            if exc is not None :
+                warnmsg = f'WARNING: failed to analyze {rel_filepath}, so its skimmed data will be uploaded instead. '
+                warnmsg+= 'The traceback of the Exception will be logged below.'
+                self.logger.warning(warnmsg,exc_info=exc)
+                if not datafile.to_upload :
+                    datafile.to_upload = True
+                    #files found during shutdown need their chunks added to be uploaded before quitting
+                    if wait_for_all :
+                        datafile.add_chunks_to_upload(chunk_size=self.__chunk_size)
+                continue
+            for record_name,record,thumbnail_name,thumbnail in future.result() :
+                for name,payload in ((record_name,record),(thumbnail_name,thumbnail)) :
+                    for chunk in get_in_memory_chunks(datafile.filepath.with_name(name),name,payload,
+                                                      self.__chunk_size,rootdir=self.dirpath) :
+                        self.__results_producer.produce_object(chunk,self.__results_topic_name)
+            self.__results_producer.poll(0)
+            self.__analyzed_filepaths.append(datafile.filepath)
+            self.logger.info(f'Uploaded the results of analyzing {rel_filepath} to {self.__results_topic_name}')
+
     @classmethod
     def get_command_line_arguments(cls) :
         superargs,superkwargs = super().get_command_line_arguments()
-        args = [*superargs]
+        args = [*superargs,'find_event_window','event_margin_rows','row_windows','time_windows',
+                'encode_skimmed_data','compression','compression_level',
+                'edge_analysis','results_topic_name','n_analysis_workers','upload_skimmed_data',
+                'n_skim_workers','skim_queue_max_size','watch_method','quiescent_secs','poll_secs']
         kwargs = superkwargs
         kwargs['config']=RUN_OPT_CONST.PRODUCTION_CONFIG_FILE
         kwargs['topic_name']=LECROY_CONST.TOPIC_NAME
@@ -53,7 +331,23 @@ class LecroyFileUploadDirectory(DataFileUploadDirectory) :
         parser = cls.get_argument_parser()
         args = parser.parse_args(args=args)
         #make the LecroyFileUploadDirectory for the specified directory
-        upload_file_directory = cls(args.upload_dir,args.config,update_secs=args.update_seconds)
+        upload_file_directory = cls(args.upload_dir,args.config,update_secs=args.update_seconds,
+                                    find_event_window=args.find_event_window,
+                                    event_margin_rows=args.event_margin_rows,
+                                    row_windows=args.row_windows,
+                                    time_windows=args.time_windows,
+                                    encode_skimmed_data=args.encode_skimmed_data,
+                                    compression=args.compression,
+                                    compression_level=args.compression_level,
+                                    edge_analysis=args.edge_analysis,
+                                    results_topic_name=args.results_topic_name,
+                                    n_analysis_workers=args.n_analysis_workers,
+                                    upload_skimmed_data=args.upload_skimmed_data,
+                                    n_skim_workers=args.n_skim_workers,
+                                    skim_queue_max_size=args.skim_queue_max_size,
+                                    watch_method=args.watch_method,
+                                    quiescent_secs=args.quiescent_secs,
+                                    poll_secs=args.poll_secs)
         #listen for new files in the directory and run uploads as they come in until the process is shut down
         run_start = datetime.datetime.now()
         upload_file_directory.logger.info(f'Listening for Lecroy files to be added to {args.upload_dir}...')
@@ -72,6 +366,13 @@ class LecroyFileUploadDirectory(DataFileUploadDirectory) :
         final_msg+=f' skimmed and uploaded between {run_start} and {run_stop}:\n'
         for fp in uploaded_filepaths :
             final_msg+=f'\t{fp}\n'
+        if args.edge_analysis is not None :
+            analyzed_filepaths = upload_file_directory.analyzed_filepaths
+            final_msg+=f'and the results of analyzing the following {len(analyzed_filepaths)} file'
+            final_msg+=' were' if len(analyzed_filepaths)!=1 else ' was'
+            final_msg+=f' uploaded to the {args.results_topic_name} topic:\n'
+            for fp in analyzed_filepaths :
+                final_msg+=f'\t{fp}\n'
         upload_file_directory.logger.info(final_msg)
 
 #################### MAIN METHOD TO RUN FROM COMMAND LINE ####################
@@ -0,0 +1,176 @@
+#imports
+import pathlib, struct
+import numpy as np
+from .config import LECROY_CONST
+
+# Reading LeCroy binary waveform (.trc) files
+
+#file extension of LeCroy binary waveform files
+TRC_SUFFIX = '.trc'
+#the name at the beginning of the descriptor block
+WAVEDESC_NAME = b'WAVEDESC'
+#the number of bytes at the beginning of a file that might come before the descriptor block
+MAX_WAVEDESC_OFFSET = 64
+#the length of the descriptor block
+WAVEDESC_LENGTH = 346
+#byte offsets (relative to the beginning of the descriptor block) and struct formats of the descriptor
+#fields that are needed to read waveforms
+WAVEDESC_FIELDS = {'COMM_TYPE':(32,'h'),        # 0 for 8 bit samples, 1 for 16 bit samples
+                   'COMM_ORDER':(34,'h'),       # 0 for big-endian, 1 for little-endian
+                   'WAVE_DESCRIPTOR':(36,'i'),  # lengths (in bytes) of the blocks in the file
+                   'USER_TEXT':(40,'i'),
+                   'TRIGTIME_ARRAY':(48,'i'),
+                   'RIS_TIME_ARRAY':(52,'i'),
+                   'WAVE_ARRAY_1':(60,'i'),
+                   'WAVE_ARRAY_COUNT':(116,'i'),
+                   'VERTICAL_GAIN':(156,'f'),
+                   'VERTICAL_OFFSET':(160,'f'),
+                   'HORIZ_INTERVAL':(176,'f'),
+                   'HORIZ_OFFSET':(180,'d'),
+                  }
+
+def is_trc_file(filepath) :
+    """
+    Return True if the file at filepath is a LeCroy binary waveform file (judging by its extension)
+    """
+    return pathlib.Path(filepath).suffix.lower()==TRC_SUFFIX
+
+def parse_wavedesc(header) :
+    """
+    Return a dictionary of the needed descriptor fields in the beginning of a binary waveform file,
+    plus the offset of the descriptor block itself ("WAVEDESC_OFFSET") and the byte order of the fields.
+    The WAVEDESC block can follow a short "#9nnnnnnnnn" block header, and the raw 8 or 16 bit samples
+    come after it and some optional blocks.
+
+    header = at least the first MAX_WAVEDESC_OFFSET+WAVEDESC_LENGTH bytes of the file
+    """
+    header = bytes(header[:MAX_WAVEDESC_OFFSET+WAVEDESC_LENGTH])
+    wavedesc_offset = header.find(WAVEDESC_NAME,0,MAX_WAVEDESC_OFFSET+len(WAVEDESC_NAME))
+    if wavedesc_offset<0 :
+        raise ValueError('ERROR: could not find the WAVEDESC block at the beginning of a LeCroy binary waveform!')
+    if len(header)<wavedesc_offset+WAVEDESC_LENGTH :
+        raise ValueError('ERROR: the WAVEDESC block of a LeCroy binary waveform is truncated!')
+    comm_order_offset = wavedesc_offset+WAVEDESC_FIELDS['COMM_ORDER'][0]
+    byte_order = '<' if struct.unpack_from('<h',header,comm_order_offset)[0]==1 else '>'
+    wavedesc = {'WAVEDESC_OFFSET':wavedesc_offset,'BYTE_ORDER':byte_order}
+    for name,(offset,fmt) in WAVEDESC_FIELDS.items() :
+        wavedesc[name] = struct.unpack_from(byte_order+fmt,header,wavedesc_offset+offset)[0]
+    if wavedesc['COMM_TYPE'] not in (0,1) :
+        raise ValueError(f'ERROR: unrecognized sample type {wavedesc["COMM_TYPE"]} in a LeCroy binary waveform!')
+    return wavedesc
+
+class LecroyWaveform :
+    """
+    The samples of a LeCroy binary waveform, memory-mapped from a file or read from a buffer
+    (like the contents of a skimmed file), converted to times and voltages only when they're needed
+    """
+
+    @property
+    def n_points(self) :
+        return self.__raw.shape[0]
+    @property
+    def sample_interval(self) :
+        return self.__wavedesc['HORIZ_INTERVAL']
+    @property
+    def horizontal_offset(self) :
+        return self.__wavedesc['HORIZ_OFFSET'] # time of the first sample in the waveform
+    @property
+    def vertical_gain(self) :
+        return self.__wavedesc['VERTICAL_GAIN']
+    @property
+    def vertical_offset(self) :
+        return self.__wavedesc['VERTICAL_OFFSET']
+    @property
+    def raw(self) :
+        return self.__raw # the raw integer samples (a memory map if the waveform was read from a file)
+    @property
+    def first_index(self) :
+        return self.__first_index # the index in the full waveform of the first sample held here
+
+    def __init__(self,buffer,first_index=0) :
+        """
+        buffer = the contents of a binary waveform file, or of a file skimmed from one that holds its header
+                 and some of its samples
+        first_index = the index in the full waveform of the first sample in buffer (it's not recorded in
+                      skimmed files, so their times will start at the horizontal offset if it's not given)
+        """
+        self.__wavedesc = parse_wavedesc(buffer)
+        self.__first_index = first_index
+        data_offset = get_trc_data_offset(self.__wavedesc)
+        dtype = get_trc_sample_dtype(self.__wavedesc)
+        n_bytes = min(self.__wavedesc['WAVE_ARRAY_1'],len(buffer)-data_offset)
+        self.__raw = np.frombuffer(buffer,dtype=dtype,count=n_bytes//dtype.itemsize,offset=data_offset)
+
+    @classmethod
+    def from_file(cls,filepath) :
+        """
+        Return the waveform in a binary waveform file, with its samples memory-mapped
+        """
+        return cls(np.memmap(filepath,dtype=np.uint8,mode='r'))
+
+    def get_time(self,start=0,stop=None) :
+        """
+        Return the times of the samples from start to stop (indices of the samples held here)
+        """
+        stop = self.n_points if stop is None else min(stop,self.n_points)
+        return self.horizontal_offset+(self.__first_index+np.arange(start,stop))*self.sample_interval
+
+    def get_voltage(self,start=0,stop=None,dtype=np.float64) :
+        """
+        Return the voltages of the samples from start to stop (indices of the samples held here) as dtype
+        (the raw samples times the vertical gain minus the vertical offset)
+        """
+        gain = np.array(self.vertical_gain,dtype=dtype)
+        offset = np.array(self.vertical_offset,dtype=dtype)
+        return self.__raw[start:stop].astype(dtype)*gain-offset
+
+def get_trc_data_offset(wavedesc) :
+    """
+    Return the byte offset in a binary waveform file where the array of samples begins
+    """
+    return (wavedesc['WAVEDESC_OFFSET']+wavedesc['WAVE_DESCRIPTOR']+wavedesc['USER_TEXT']
+            +wavedesc['TRIGTIME_ARRAY']+wavedesc['RIS_TIME_ARRAY'])
+
+def get_trc_sample_dtype(wavedesc) :
+    """
+    Return the numpy dtype of the samples in a binary waveform file
+    """
+    return np.dtype(wavedesc['BYTE_ORDER']+('i1' if wavedesc['COMM_TYPE']==0 else 'i2'))
+
+def read_trc_header(filepath) :
+    """
+    Return the parsed descriptor of the binary waveform file at filepath (reading only its beginning)
+    """
+    with open(filepath,'rb') as fp :
+        return parse_wavedesc(fp.read(MAX_WAVEDESC_OFFSET+WAVEDESC_LENGTH))
+
+def get_trc_select_bytes(filepath,first_sample,n_samples) :
+    """
+    Return the list of byte range tuples in a binary waveform file holding everything before its samples
+    and the n_samples samples beginning with first_sample
+    """
+    wavedesc = read_trc_header(filepath)
+    data_offset = get_trc_data_offset(wavedesc)
+    itemsize = get_trc_sample_dtype(wavedesc).itemsize
+    n_total = wavedesc['WAVE_ARRAY_1']//itemsize
+    first_sample = min(max(first_sample,0),n_total)
+    last_sample = min(first_sample+n_samples,n_total)
+    to_return = [(0,data_offset)]
+    if last_sample>first_sample :
+        to_return.append((data_offset+first_sample*itemsize,data_offset+last_sample*itemsize))
+    return to_return
+
+def read_lecroy_trc_rows(filepath,rows_to_skip,nrows=None,header_rows=LECROY_CONST.HEADER_ROWS) :
+    """
+    Return the time and voltage of the samples in a binary waveform file that are the same as the rows
+    that would be selected from the CSV export of the same waveform by read_lecroy_csv_rows
+    (i.e. pandas.read_csv(skiprows=rows_to_skip,nrows=nrows) with header_rows lines before the data)
+    """
+    waveform = LecroyWaveform.from_file(filepath)
+    start = rows_to_skip+1-header_rows
+    if start<0 or start>waveform.n_points :
+        errmsg = f'ERROR: skipping {rows_to_skip} rows is outside of the {waveform.n_points} samples '
+        errmsg+= f'in {filepath}!'
+        raise ValueError(errmsg)
+    stop = None if nrows is None else start+nrows
+    return waveform.get_time(start,stop), waveform.get_voltage(start,stop)
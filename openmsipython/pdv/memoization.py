@@ -0,0 +1,115 @@
+#imports
+from threading import RLock
+
+# Memoizing quantities derived from the data in an object, per instance
+
+class MemoizedQuantity :
+    """
+    Descriptor for a read-only property whose value is calculated once per instance and then memoized
+    until it's invalidated. Values are stored on each instance (unlike functools.lru_cache around a method,
+    whose cache holds a strong reference to every instance it's seen), so they're freed along with it.
+    """
+
+    def __init__(self,function,depends_on=()) :
+        """
+        function = the function to call (with the instance as its only argument) to calculate the value
+        depends_on = names of the memoized quantities this one is derived from
+        """
+        self.function = function
+        self.depends_on = tuple(depends_on)
+        self.name = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __set_name__(self,owner,name) :
+        self.name = name
+
+    def __get__(self,instance,owner=None) :
+        if instance is None :
+            return self
+        memo = instance._memo
+        if self.name not in memo :
+            value = self.function(instance)
+            #the calculation may have memoized a value for this quantity itself
+            if self.name in memo :
+                return memo[self.name]
+            memo[self.name] = value
+        return memo[self.name]
+
+def memoized(*depends_on) :
+    """
+    Decorator to turn a method into a MemoizedQuantity derived from the quantities named in depends_on
+    """
+    def decorator(function) :
+        return MemoizedQuantity(function,depends_on)
+    return decorator
+
+class HasMemoizedQuantities :
+    """
+    Mixin class for objects with MemoizedQuantities, adding functions to invalidate them or set their values.
+    Invalidating (or re-memoizing) a quantity also invalidates every quantity derived from it.
+    """
+
+    @property
+    def _memo(self) :
+        try :
+            return self.__memo
+        except AttributeError :
+            self.__memo = {}
+            return self.__memo
+    @property
+    def memoized_names(self) :
+        return tuple(self._memo.keys()) # names of the quantities whose values are currently memoized
+
+    def invalidate(self,*names) :
+        """
+        Forget the memoized values of the named quantities and everything derived from them
+        (or of every memoized quantity if no names are given)
+        """
+        with self.__get_lock() :
+            if len(names)==0 :
+                self._memo.clear()
+                return
+            for name in self.__get_derived_names(names) :
+                self._memo.pop(name,None)
+
+    def _memoize(self,name,value) :
+        """
+        Set the value of a memoized quantity that was calculated along the way to something else,
+        invalidating everything derived from its previous value
+        """
+        with self.__get_lock() :
+            self.invalidate(name)
+            self._memo[name] = value
+
+    def _forget(self,*names) :
+        """
+        Forget the memoized values of the named quantities without invalidating anything derived from them
+        (to release intermediate values once everything that needs them has been calculated)
+        """
+        with self.__get_lock() :
+            for name in names :
+                self._memo.pop(name,None)
+
+    def __get_lock(self) :
+        try :
+            return self.__lock
+        except AttributeError :
+            self.__lock = RLock()
+            return self.__lock
+
+    @classmethod
+    def __get_derived_names(cls,names) :
+        """
+        Return the set of the given names and the names of every memoized quantity derived from any of them
+        """
+        dependencies = {}
+        for klass in cls.__mro__ :
+            for attr_name,attr in vars(klass).items() :
+                if isinstance(attr,MemoizedQuantity) and attr_name not in dependencies :
+                    dependencies[attr_name] = attr.depends_on
+        derived = set(names)
+        n_derived = 0
+        while len(derived)!=n_derived :
+            n_derived = len(derived)
+            derived.update(n for n,deps in dependencies.items() if derived.intersection(deps))
+        return derived
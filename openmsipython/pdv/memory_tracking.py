@@ -0,0 +1,63 @@
+#imports
+import sys, tracemalloc
+from threading import RLock
+
+# Measuring the peak memory used by PDV analyses
+
+class PeakMemoryTracker :
+    """
+    Context manager to measure the peak amount of memory allocated while it's active, in bytes, with tracemalloc
+    (which numpy reports its array allocations to). Tracing is process-wide, so only one tracker measures at a
+    time: trackers in different threads wait for each other, and trackers can't be nested in the same thread.
+    Tracing is started on entering and stopped on exiting, unless tracemalloc was already tracing.
+    """
+
+    __lock = RLock()
+    __active = False
+
+    @property
+    def peak(self) :
+        return self.__peak # the peak memory allocated above what was in use on entering (None until exited)
+
+    def __init__(self) :
+        self.__peak = None
+        self.__baseline = None
+        self.__started_tracing = False
+
+    def __enter__(self) :
+        PeakMemoryTracker.__lock.acquire()
+        if PeakMemoryTracker.__active :
+            PeakMemoryTracker.__lock.release()
+            raise ValueError('ERROR: PeakMemoryTrackers cannot be nested!')
+        PeakMemoryTracker.__active = True
+        self.__started_tracing = not tracemalloc.is_tracing()
+        if self.__started_tracing :
+            tracemalloc.start()
+        elif sys.version_info>=(3,9) :
+            tracemalloc.reset_peak()
+        else :
+            #before Python 3.9 the peak can only be reset by clearing the existing traces
+            tracemalloc.clear_traces()
+        self.__baseline, _ = tracemalloc.get_traced_memory()
+        return self
+
+    def __exit__(self,exc_type,exc_value,exc_tb) :
+        try :
+            _, peak = tracemalloc.get_traced_memory()
+            self.__peak = max(peak-self.__baseline,0)
+            if self.__started_tracing :
+                tracemalloc.stop()
+        finally :
+            PeakMemoryTracker.__active = False
+            PeakMemoryTracker.__lock.release()
+        return False
+
+def format_memory(nbytes) :
+    """
+    Return a string of a number of bytes in human-readable units
+    """
+    for unit in ('B','KiB','MiB') :
+        if abs(nbytes)<1024 :
+            return f'{nbytes:.1f} {unit}'
+        nbytes/=1024
+    return f'{nbytes:.1f} GiB'
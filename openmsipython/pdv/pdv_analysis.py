@@ -1,17 +1,29 @@
 #imports
-import pathlib, math, datetime, functools
+import os, pathlib, datetime, contextlib, dataclasses
 from argparse import ArgumentParser
 from abc import ABC, abstractmethod
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
 from scipy import signal, integrate
-from scipy.fft import fft, ifft
-from scipy.fftpack import fftshift
-import numpy as np, pandas as pd
+import numpy as np
+from .pdv_result import PDVSpallResult, PDVVelocityResult
+from .pdv_signal_processing import calculate_center_frequency, get_cut_window_indices, calculate_velocity
+from .time_frequency import SPECTROGRAM_METHODS
+from .downconversion import downconvert
+from .pdv_pipeline import find_event_times, find_signal_bands, calculate_phase_derivatives, make_plot_spectrogram
+from .event_detection import find_first_true
+from .memory_tracking import PeakMemoryTracker, format_memory
+from .memoization import memoized, HasMemoizedQuantities
+from .waveform_cache import DEFAULT_CACHE_MAX_BYTES, read_waveform, WaveformCache
+from .pdv_batch_analysis import get_filepaths_to_analyze, analyze_files_in_pool
 
-class PDVAnalysis(ABC) :
+class PDVAnalysis(HasMemoizedQuantities,ABC) :
     """
     Base class for running PDV analyses
+
+    The numerical part of the analysis is run by compute(), which doesn't need matplotlib at all.
+    The sheet of plots is made separately by render(), and run() does both.
+    Quantities derived from the data (the carrier frequency, event time, cut window, signal band, phase
+    derivative, and velocity) are each calculated from the quantities they depend on and memoized on each
+    instance until they're invalidated with invalidate().
     """
 
     ################### PROPERTIES ###################
@@ -19,7 +31,7 @@ class PDVAnalysis(ABC) :
     @property
     def req_time_pos(self) :
         return 50e-9 # amount of time where the difference must remain positive for the start point to
-                     # be considered valid. 
+                     # be considered valid.
     @property
     @abstractmethod
     def window_time(self) :
@@ -30,13 +42,42 @@ class PDVAnalysis(ABC) :
     @property
     def expansion(self) :
         return 0.20
-    @property
-    @functools.lru_cache()
+    @memoized()
+    def _cen(self) :
+        # calculate the center frequency, the upshift
+        return calculate_center_frequency(self.__voltage,self.sample_rate)
+    @memoized('_cen')
+    def event_time(self) :
+        return self.__find_event()[0] # time where the event begins in the spectrogram
+    @memoized('event_time')
+    def cut_window(self) :
+        # the first and last indices of the window around the event, and 'fixt', the index where the event
+        # begins in the cut data (which corresponds to the event index in the uncut data)
+        return get_cut_window_indices(self.__time,self.event_time,self.window_time,self.split)
+    @memoized('cut_window','_cen')
+    def _baseband(self) :
+        # the cut data mixed down by the carrier frequency and decimated (None unless they're being downconverted)
+        if self.downconversion_factor==1 :
+            return None
+        return downconvert(self.__get_cut_data()[1],self.sample_rate,self._cen,self.downconversion_factor)
+    @memoized('cut_window','_cen','_baseband')
+    def _signal_band(self) :
+        return self.__find_signal_band()[:2] # the lowest and highest frequencies where the signal peaks
+    @memoized('cut_window','_cen','_baseband','_signal_band')
+    def _phasD2(self) :
+        return self.__calculate_phase_derivative()[0] # the phase derivative of the isolated signal
+    @memoized('_phasD2','_cen')
     def vel(self) :
-        return (1550/2)*((self._phasD2/1e9)-self._cen/1e9)
+        return calculate_velocity(self._phasD2,self._cen)
+    @property
+    def time(self) :
+        return self.__time
+    @property
+    def voltage(self) :
+        return self.__voltage
     @property
     def sample_rate(self) :
-        return 1./(self.__time[1]-self.__time[0])
+        return self.__sample_rate
     @property
     @abstractmethod
     def output_file_name(self) : # Not implemented in base class
@@ -51,11 +92,40 @@ class PDVAnalysis(ABC) :
                 'noverlap':self.__noverlap,
                 'nfft':self.__nfft,
                 'boundary':None}
+    @property
+    def spectrogram_method(self) :
+        return self.__spectrogram_method # "stft" for full spectrograms, "zoom" or "sliding" for only the band
+                                         # around the signal (using zoom FFTs or a sliding DFT)
+    @property
+    def coarse_event_search(self) :
+        return self.__coarse_event_search # if True the event is located in a coarse spectrogram before
+                                          # the full-resolution one is calculated just around it
+    @property
+    def downconversion_factor(self) :
+        return self.__downconversion_factor # the cut data are mixed down and decimated by this factor if it's > 1
+    @property
+    def low_memory(self) :
+        return self.__low_memory # if True the voltage is analyzed in single precision, and intermediate arrays
+                                 # are released as soon as they've been used
+    @property
+    def peak_memory(self) :
+        return self.__peak_memory # peak memory (in bytes) allocated by the most recent calls to compute and render
+                                  # (None unless the analysis was created with report_peak_memory=True)
+    @property
+    @abstractmethod
+    def result_type(self) : # Not implemented in base class
+        pass
+    @property
+    def result(self) :
+        return self._result # the result of the most recent call to compute (None if it hasn't been called)
 
     ################### PUBLIC FUNCTIONS ###################
 
     def __init__(self,*args,**kwargs) :
         self._file = kwargs['file']
+        self.__low_memory = kwargs.get('low_memory',False)
+        self.__report_peak_memory = kwargs.get('report_peak_memory',False)
+        self.__peak_memory = None
         #if the raw data are given then just set them
         if kwargs.get('time') is not None and kwargs.get('voltage') is not None :
             self.__time = kwargs.get('time')
@@ -64,43 +134,160 @@ class PDVAnalysis(ABC) :
         else :
             self.__time, self.__voltage = self.__get_data_from_file(kwargs['file'],
                                                                     kwargs['rows_to_skip'],
-                                                                    kwargs['nrows'])
+                                                                    kwargs['nrows'],
+                                                                    kwargs.get('cache_dir'),
+                                                                    kwargs.get('cache_max_bytes'))
+        self.__sample_rate = 1./(self.__time[1]-self.__time[0])
+        #in low memory mode the voltage is single precision (times stay in double precision
+        #because their offsets are so much larger than the spacing between them)
+        if self.__low_memory :
+            self.__voltage = np.asarray(self.__voltage,dtype=np.float32)
         #set some other variables
-        self.__output_dir = kwargs['output_dir']
+        self.__output_dir = kwargs.get('output_dir')
         self.__N = kwargs['N']
         self.__noverlap = np.floor(kwargs['overlap_frac']*self.__N)
         self.__nfft = self.__N*10
+        self.__spectrogram_method = kwargs.get('spectrogram_method','stft')
+        if self.__spectrogram_method not in SPECTROGRAM_METHODS :
+            errmsg = f'ERROR: unrecognized spectrogram method "{self.__spectrogram_method}" '
+            errmsg+= f'(options are {SPECTROGRAM_METHODS})'
+            raise ValueError(errmsg)
+        self.__coarse_event_search = kwargs.get('coarse_event_search',False)
+        self.__downconversion_factor = kwargs.get('downconversion_factor')
+        if self.__downconversion_factor is None :
+            self.__downconversion_factor = 1
+        if int(self.__downconversion_factor)!=self.__downconversion_factor or self.__downconversion_factor<1 :
+            errmsg = f'ERROR: downconversion_factor must be a positive integer but {self.__downconversion_factor} '
+            errmsg+= 'was given!'
+            raise ValueError(errmsg)
+        self.__downconversion_factor = int(self.__downconversion_factor)
+        if self.__N//self.__downconversion_factor<8 :
+            errmsg = f'ERROR: downconversion_factor {self.__downconversion_factor} is too large for segments of '
+            errmsg+= f'length {self.__N}!'
+            raise ValueError(errmsg)
+        #the output grid plot figure is only created when the results are rendered
+        self.__fig = kwargs.get('pyplot_figure')
+        self.__return_fig = self.__fig is not None
+        self._ax = None
+        self._result = None
+        super().__init__()
+
+    def compute(self,keep_spectrograms=False) :
+        """
+        Run the numerical part of the analysis without making any plots, and return the result
+
+        keep_spectrograms = if True, the spectrograms needed to render the plots are also calculated
+                            and added to the result (otherwise the result holds only the velocity and metrics)
+        """
+        if self.__voltage is None :
+            errmsg = f'ERROR: the raw data for {self._file} were already released after being analyzed in '
+            errmsg+= 'low memory mode, so they cannot be analyzed again!'
+            raise ValueError(errmsg)
+        self.__peak_memory = None
+        with self.__tracking_peak_memory() :
+            spectrograms = self.__calculate_spectrograms() if keep_spectrograms else None
+            cuttime, _ = self.__get_cut_data()
+            window_start_time = cuttime[0]-self.__time[0]
+            freq_low, freq_peak = self._signal_band
+            vel = self.vel
+            if self.low_memory :
+                self.__release_intermediate_arrays()
+            self._result = self.result_type(file=self._file,
+                                             center_frequency=self._cen,
+                                             event_time=self.event_time,
+                                             window_start_time=window_start_time,
+                                             freq_low=freq_low,
+                                             freq_peak=freq_peak,
+                                             cut_time=cuttime,
+                                             velocity=vel,
+                                             spectrograms=spectrograms,
+                                             **self.calculate_metrics(vel,cuttime))
+        return self._result
+
+    def render(self,result=None) :
+        """
+        Draw the sheet of plots for a result and show/save it
+
+        result = the result to plot (default is the result of the most recent call to compute,
+                 which will be made if necessary)
+        """
+        import matplotlib.pyplot as plt
+        if result is None :
+            result = self._result if self._result is not None else self.compute(keep_spectrograms=True)
+        if result.spectrograms is None :
+            errmsg = f'ERROR: the result for {result.file} was computed without its spectrograms, so it '
+            errmsg+= 'cannot be rendered! Call compute(keep_spectrograms=True) to get a result that can be plotted.'
+            raise ValueError(errmsg)
         #start up the output grid plot figure
-        if kwargs.get('pyplot_figure') is not None :
-            self.__fig = kwargs.get('pyplot_figure')
-            self.__return_fig = True
-        else :
+        if self.__fig is None :
             self.__fig = plt.figure(figsize=(10,6),dpi=300)
-            self.__return_fig = False
         self._ax = ((self.__fig.add_subplot(2,2,1),self.__fig.add_subplot(2,2,2)),
                     (self.__fig.add_subplot(2,2,3),self.__fig.add_subplot(2,2,4)))
         self.__fig.subplots_adjust(wspace=0.2,hspace=0.35)
-        super().__init__()
+        with self.__tracking_peak_memory() :
+            self.__plot_imported_data_spectrogram(result)
+            self.__plot_cut_time_data_spectrogram(result)
+            self.__plot_isolated_filtered_signal_spectrogram(result)
+            self._post_run(result)
+        #in low memory mode the analysis doesn't hold on to a result (or its spectrograms) once it's been rendered
+        if self.low_memory and result is self._result :
+            self._result = None
 
     def run(self) :
-        self.__plot_imported_data_spectrogram()
-        self.__calculate_center_frequency()
-        self.__plot_cut_time_data_spectrogram()
-        self.__plot_isolated_filtered_signal_spectrogram()
-        self._post_run()
+        """
+        Compute the result of the analysis, render its plots, and return it
+        (without its spectrograms in low memory mode, so they're released once they've been plotted)
+        """
+        result = self.compute(keep_spectrograms=True)
+        self.render(result)
+        if self.low_memory :
+            result = dataclasses.replace(result,spectrograms=None)
+        return result
 
     ################### PRIVATE HELPER FUNCTIONS ###################
 
+    @contextlib.contextmanager
+    def __tracking_peak_memory(self) :
+        """
+        Context manager to update the peak memory of the analysis with what's allocated inside it,
+        if the peak memory is being reported
+        """
+        if not self.__report_peak_memory :
+            yield
+            return
+        with PeakMemoryTracker() as tracker :
+            yield
+        self.__peak_memory = max(tracker.peak,self.__peak_memory or 0)
+
+    def __release_intermediate_arrays(self) :
+        """
+        Remove references to the raw and intermediate arrays once the velocity has been calculated
+        (only the cut window, the phase derivative, and the spectrograms for plotting are kept)
+        """
+        self.__time = None
+        self.__voltage = None
+        self._forget('_baseband')
+
+    @staticmethod
+    @abstractmethod
+    def calculate_metrics(vel,cuttime) :
+        """
+        Not implemented in the base class. Should return a dictionary of the keyword arguments
+        specific to the type of result made by the analysis, given the velocity history and cut time arrays
+        """
+        pass
+
     @abstractmethod
-    def _post_run(self) : 
+    def _post_run(self,result) :
         """
         Not implemented in the base class, except for showing/saving the output plot
-        i.e., you should call super()._post_run() at the end of implemented _post_run 
+        i.e., you should call super()._post_run(result) at the end of implemented _post_run
         functions to show/save the output file
         """
         if self.__return_fig :
             return
         if self.__output_dir is not None :
+            import matplotlib.pyplot as plt
             if not self.output_plot_file_path.parent.is_dir() :
                 self.output_plot_file_path.parent.mkdir(parents=True)
             self.__fig.savefig(self.output_plot_file_path,bbox_inches='tight')
@@ -108,26 +295,55 @@ class PDVAnalysis(ABC) :
         else :
             self.__fig.show()
 
-    def __get_data_from_file(self,file,rows_to_skip,nrows) :
+    def __get_data_from_file(self,file,rows_to_skip,nrows,cache_dir=None,cache_max_bytes=None) :
         """
-        Read raw data from a file on disk into a pandas dataframe. 
-        Select data of interest and return time and voltage columns as numpy arrays
+        Read the data of interest from a file on disk and return its time and voltage columns as numpy arrays.
+        Only the selected rows are parsed, after seeking to them using the file's (cached) line index.
+        Binary waveform files have the same samples selected as would be from their CSV exports.
+        If a cache directory is given the arrays are read from (or added to) the waveform cache there.
         """
-        data = pd.read_csv(file,skiprows=rows_to_skip,nrows=nrows)
-        data.columns = ['Time','Ampl']
-        time = data['Time'].to_numpy()
-        voltage = data['Ampl'].to_numpy()
-        return time, voltage
-
-    def __plot_imported_data_spectrogram(self) :
-        # calculate the short time fourier transform
-        self.__f,self.__t,Zxx = signal.stft(self.__voltage,**self.stft_kwargs)
-        # calculate power
-        self.__power = 20*(np.log10(np.abs(Zxx)))
+        if cache_dir is None :
+            return read_waveform(file,rows_to_skip,nrows)
+        if cache_max_bytes is None :
+            cache_max_bytes = DEFAULT_CACHE_MAX_BYTES
+        return WaveformCache(cache_dir,cache_max_bytes).read_waveform(file,rows_to_skip,nrows)
+
+    def __calculate_spectrograms(self) :
+        """
+        Return a dictionary of the spectrograms needed to plot the analysis. Each stage is run once:
+        the quantities found along the way are memoized instead of being calculated again.
+        """
+        factor = self.downconversion_factor
+        # the spectrogram of the imported data is otherwise only needed to find the event
+        event_time, (f,t,power) = self.__find_event()
+        self._memoize('event_time',event_time)
+        spectrograms = {'imported':make_plot_spectrogram(f,t,power,self._cen)}
+        freq_low, freq_peak, (cutf,cutt,cutpower) = self.__find_signal_band()
+        self._memoize('_signal_band',(freq_low,freq_peak))
+        spectrograms['cut_time'] = make_plot_spectrogram(cutf,cutt,cutpower,self._cen,factor)
+        phasD2, (isof,isot,isopower) = self.__calculate_phase_derivative(keep_spectrogram=True)
+        self._memoize('_phasD2',phasD2)
+        spectrograms['isolated'] = make_plot_spectrogram(isof,isot,isopower,self._cen,factor)
+        return spectrograms
+
+    def __find_event(self) :
+        """
+        Return the time where the event begins and the frequencies, times, and power of the spectrogram
+        of the imported data it was found in (the coarse one if the event was found with a coarse search)
+        """
+        event_times, spectrograms = find_event_times(self.__voltage,self.sample_rate,self._cen,self.stft_kwargs,
+                                                     self.req_time_pos,self.window_time,self.coarse_event_search,
+                                                     self.spectrogram_method,self.low_memory)
+        if isinstance(event_times[0],Exception) :
+            raise event_times[0]
+        return event_times[0], spectrograms[0]
+
+    def __plot_imported_data_spectrogram(self,result) :
+        spec = result.spectrograms['imported']
         # plot spectrogram
-        pos = self._ax[0][0].imshow(self.__power,
-                                    extent=[self.__t.min()/1e-9, self.__t.max()/1e-9, 
-                                            self.__f.min()/1e9, self.__f.max()/1e9],
+        pos = self._ax[0][0].imshow(spec.power,
+                                    extent=[spec.t.min()/1e-9, spec.t.max()/1e-9,
+                                            spec.f.min()/1e9, spec.f.max()/1e9],
                                     aspect='auto',
                                     origin='lower')
         self.__fig.colorbar(pos,ax=self._ax[0][0],label='Power (dB)')
@@ -135,76 +351,28 @@ class PDVAnalysis(ABC) :
         self._ax[0][0].set_ylabel('Frequency (GHz)',fontsize=8)
         self._ax[0][0].set_title('Imported Data',fontsize=8)
 
-    def __calculate_center_frequency(self) :
-        # calculate the center frequency, the upshift
-        npts = self.__voltage.shape[0]
-        spectra1 = fft(self.__voltage)
-        spectra2 = np.abs(spectra1/npts)
-        spectra3 = spectra2[0:(npts//2 + 1)]
-        spectra3[1:-1] = 2*spectra3[1:-1]
-        w = (self.sample_rate*np.arange(0,(npts/2)))/npts # w = frequency 
-        index = np.argmax(spectra3[99:])
-        self._cen = w[index+99]
-
-    def __get_cut_time_and_voltage(self) :
-        # make an array of the carrier frequency of length t
-        carrier = self._cen*np.ones(len(self.__t))
-        # frequency array correspoding to the max power in the spectrogram
-        freq_max_power = self.__f[np.argmax(self.__power,axis=0)]   
-        # difference between the signal and carrier freq
-        difference = freq_max_power - carrier 
-        # time derivative of the difference 
-        dDdt = (np.diff(difference,n=1)/1e9)/(np.diff(self.__t,n=1)/1e-9)  
-        # indices where the derivative is positive
-        pos_der_idx = (dDdt > 0).nonzero()[0]    
-        # average time step
-        avg_time_step = np.mean(np.diff(self.__t))      
-        # number of steps in the difference array where it must remain positive, rounded up
-        num_steps = math.ceil(self.req_time_pos/avg_time_step)              
-        # loop through the indices where the derivative is positive to find where the 
-        # spall event begins. we are looking for the point where the spall signal
-        # increases above the carrier frequency and stays above it for at least 50ns. 
-        for idx in pos_der_idx :
-            # skipping the first point in the difference array because the derivative
-            # array has one less point then the difference array. check to see if all
-            # points for 50ns beyond idx are positive. if they are positive, save the index
-            # and break the loop. if not, continue the loop. 
-            if np.sum(difference[1:][idx:idx+num_steps] > 0) == num_steps:
-                event_start_idx = idx + 1
-                break
-        # calculate the amount of time before and after the event begins and convert to
-        # the number of indices in the time and voltage arrays
-        time_before = self.window_time*self.split
-        time_after = self.window_time*(1-self.split)
-        avg_time_step2 = np.mean(np.diff(self.__time))
-        idx_before = math.ceil(time_before/avg_time_step2)
-        idx_after = math.ceil(time_after/avg_time_step2)
-        # find the index where the time is closest to the event start time
-        event_idx = np.argmin(np.abs(((self.__time - self.__time[0]) - self.__t[event_start_idx])))
-        # Remove upshift
-        # index where the spall event begins in the cut data. this corresponds to 
-        # 'event_idx' in the uncut data 
-        self.__fixt = idx_before
-        # get the starting and ending indices for the cut time and voltage
-        start_idx = event_idx - idx_before
-        end_idx = event_idx + idx_after
+    def __get_cut_data(self) :
+        """
+        Return the time and voltage in the window around the event
+        """
+        start_idx, end_idx, _ = self.cut_window
         return self.__time[start_idx:end_idx+1], self.__voltage[start_idx:end_idx+1]
 
-    def __plot_cut_time_data_spectrogram(self) :
-        self._cuttime, self.__cutvoltage = self.__get_cut_time_and_voltage()
-        # calculate the short time fourier transform
-        self.__cutf,self.__cutt,Zxx = signal.stft(self.__cutvoltage,**self.stft_kwargs)
-        # calculate the power
-        power = 20*(np.log10(np.abs(Zxx)))
-        # calculate the frequency where the spall signal peaks and is lowest. for the
-        # low frequency make it be non-zero
-        self.__freq_peak = np.max(self.__cutf[np.argmax(power,axis=0)])
-        self.__freq_low = self.__cutf[np.argmax(power,axis=0)]
-        self.__freq_low = np.min(self.__freq_low[np.nonzero(self.__freq_low)])
-        # plot cut time and frequency range on the first plot as a rectangle 
-        anchor = [(self._cuttime[0] - self.__time[0])/1e-9,self.__freq_low*(1-self.expansion)/1e9]
-        width = (self._cuttime[-1] - self._cuttime[0])/1e-9
-        height = (self.__freq_peak*(1+self.expansion) - self.__freq_low*(1-self.expansion))/1e9
+    def __find_signal_band(self) :
+        """
+        Return the frequencies where the signal is lowest (non-zero) and peaks in the cut window, and the
+        frequencies, times, and power of the spectrogram of the cut window they were found in
+        """
+        return find_signal_bands(self.__get_cut_data()[1],self._cen,self.stft_kwargs,self.spectrogram_method,
+                                 self._baseband,self.downconversion_factor,self.low_memory)
+
+    def __plot_cut_time_data_spectrogram(self,result) :
+        from matplotlib.patches import Rectangle
+        spec = result.spectrograms['cut_time']
+        # plot cut time and frequency range on the first plot as a rectangle
+        anchor = [result.window_start_time/1e-9,result.freq_low*(1-self.expansion)/1e9]
+        width = (result.cut_time[-1] - result.cut_time[0])/1e-9
+        height = (result.freq_peak*(1+self.expansion) - result.freq_low*(1-self.expansion))/1e9
         win = Rectangle(anchor,width,height,
                         edgecolor='r',
                         facecolor='none',
@@ -212,61 +380,43 @@ class PDVAnalysis(ABC) :
                         linestyle='-')
         self._ax[0][0].add_patch(win)
         # plot spectrogram in cut timeframe
-        c_min = np.min(power[(self.__cutf>=self.__freq_low*(1-self.expansion)) * (self.__cutf<=self.__freq_peak*(1+self.expansion))])
-        c_max = np.max(power[(self.__cutf>=self.__freq_low*(1-self.expansion)) * (self.__cutf<=self.__freq_peak*(1+self.expansion))])
-        pos = self._ax[0][1].imshow(power,
-                                    extent=[self.__cutt.min()/1e-9, self.__cutt.max()/1e-9, 
-                                            self.__cutf.min()/1e9, self.__cutf.max()/1e9],
-                                    aspect='auto',
-                                    origin='lower',
-                                    vmin=c_min,vmax=c_max)
-        self.__fig.colorbar(pos,ax=self._ax[0][1],label='Power (dB)')
-        self._ax[0][1].set_xlabel('Time (ns)')
-        self._ax[0][1].set_ylabel('Frequency (GHz)')
+        self.__plot_band_limited_spectrogram(self._ax[0][1],spec,result)
         self._ax[0][1].set_title('Cut Time')
-        self._ax[0][1].set_ylim([(self.__freq_low/1e9)*(1-self.expansion),(self.__freq_peak/1e9)*(1+self.expansion)])
-
-    def __plot_isolated_filtered_signal_spectrogram(self) :
-        # filter the data
-        freq = fftshift(np.arange(-len(self._cuttime[self.__fixt:])/2,len(self._cuttime[self.__fixt:])/2) * self.sample_rate/len(self._cuttime[self.__fixt:]))
-        wid = 0.01e9   # 10 MHz
-        order = 6       # order number,6
-        filt_1 = 1-np.exp(-(freq - self._cen)**order / wid**order) - np.exp(-(freq + self._cen)**order / wid**order)
-        # this filter is a sixth order Gaussian notch with an 10 MHz rejection band 
-        # surrounding the beat frequency with strongest intensity in the spectrogram
-        voltagefilt = ifft(fft(self.__cutvoltage[self.__fixt:]) * filt_1)  # data after fixt is filtered
-        voltagefilt = np.concatenate((self.__cutvoltage[0:self.__fixt],voltagefilt))
-        # isolate signal
-        numpts = len(self._cuttime)
-        freq = fftshift(np.arange((-numpts/2),(numpts/2)) * self.sample_rate/numpts)
-        filt = (freq > self.__freq_low*(1-self.expansion)) * (freq < self.__freq_peak*(1+self.expansion))
-        voltagefilt = ifft(fft(voltagefilt)*filt)           
-        # plot spectrogram with the signal isolated and the upshift filtered out. need 
-        # to take only the real part of the voltage in order to prevent scipy from 
-        # giving a two-sided spectrogram output.  
-        f,t,Zxx = signal.stft(np.real(voltagefilt),**self.stft_kwargs)
-        power = 20*(np.log10(np.abs(Zxx)))
-        c_min = np.min(power[(f>=self.__freq_low*(1-self.expansion)) * (f<=self.__freq_peak*(1+self.expansion))])
-        c_max = np.max(power[(f>=self.__freq_low*(1-self.expansion)) * (f<=self.__freq_peak*(1+self.expansion))])
-        pos = self._ax[1][0].imshow(power,
-                                    extent=[t.min()/1e-9, t.max()/1e-9, f.min()/1e9, f.max()/1e9],
-                                    aspect='auto',
-                                    origin='lower',
-                                    vmin=c_min,vmax=c_max)
-        self._ax[1][0].plot(t/1e-9,f[np.argmax(power,axis=0)]/1e9,'k-',linewidth=2)
-        self.__fig.colorbar(pos,ax=self._ax[1][0],label='Power (dB)')
-        self._ax[1][0].set_xlabel('Time (ns)')
-        self._ax[1][0].set_ylabel('Frequency (GHz)')
+
+    def __calculate_phase_derivative(self,keep_spectrogram=False) :
+        """
+        Filter out the upshift, isolate the signal in the cut window, and return its phase derivative and
+        the frequencies, times, and power of its spectrogram (None unless keep_spectrogram is True).
+        'fixt' is the index where the event begins in the cut data.
+        """
+        freq_low, freq_peak = self._signal_band
+        return calculate_phase_derivatives(self.__get_cut_data()[1],self.cut_window[2],self.sample_rate,self._cen,
+                                           freq_low*(1-self.expansion),freq_peak*(1+self.expansion),
+                                           self.stft_kwargs,self.spectrogram_method,self._baseband,
+                                           self.downconversion_factor,self.low_memory,keep_spectrogram)
+
+    def __plot_isolated_filtered_signal_spectrogram(self,result) :
+        spec = result.spectrograms['isolated']
+        self.__plot_band_limited_spectrogram(self._ax[1][0],spec,result)
+        self._ax[1][0].plot(spec.t/1e-9,spec.f[np.argmax(spec.power,axis=0)]/1e9,'k-',linewidth=2)
         self._ax[1][0].set_title('Isolate Signal and Upshift Filtered Out')
-        self._ax[1][0].set_ylim([(self.__freq_low/1e9)*(1-self.expansion),(self.__freq_peak/1e9)*(1+self.expansion)])
-        # calculate velocity history
-        phas = np.unwrap(np.angle(voltagefilt),axis=0)
-        stencil = self.sample_rate/1e9*3    # samplerate/1e9 = 80 means 80 sample per ns; 5 ns stencil
-        phas = phas.reshape(phas.shape[0])
-        b = -smooth_diff(math.floor(stencil))
-        b = b.reshape(b.shape[1])
-        a = 1
-        self._phasD2 = signal.lfilter(b,a,phas)*self.sample_rate/2/np.pi    # 40*ns is smoother than 10*ns
+
+    def __plot_band_limited_spectrogram(self,ax,spec,result) :
+        """
+        Plot a spectrogram with its color scale and y axis limited to the frequency band of the signal
+        """
+        band = (spec.f>=result.freq_low*(1-self.expansion)) * (spec.f<=result.freq_peak*(1+self.expansion))
+        c_min = np.min(spec.power[band])
+        c_max = np.max(spec.power[band])
+        pos = ax.imshow(spec.power,
+                        extent=[spec.t.min()/1e-9, spec.t.max()/1e-9, spec.f.min()/1e9, spec.f.max()/1e9],
+                        aspect='auto',
+                        origin='lower',
+                        vmin=c_min,vmax=c_max)
+        self.__fig.colorbar(pos,ax=ax,label='Power (dB)')
+        ax.set_xlabel('Time (ns)')
+        ax.set_ylabel('Frequency (GHz)')
+        ax.set_ylim([(result.freq_low/1e9)*(1-self.expansion),(result.freq_peak/1e9)*(1+self.expansion)])
 
 class PDVSpallAnalysis(PDVAnalysis) :
     """
@@ -284,35 +434,46 @@ class PDVSpallAnalysis(PDVAnalysis) :
     @property
     def output_file_name(self) :
         return self.__class__.plot_file_name_from_input_file_name(self._file.name)
+    @property
+    def result_type(self) :
+        return PDVSpallResult
 
-    def _post_run(self) :
-        self.__plot_peak_and_pullback_velocity()
-        super()._post_run()
-
-    def __plot_peak_and_pullback_velocity(self) :
-        # get the peak velocity 
-        peak_velocity = np.max(self.vel)
+    @staticmethod
+    def calculate_metrics(vel,cuttime) :
+        # get the peak velocity
+        peak_idx = np.argmax(vel)
+        peak_velocity = vel[peak_idx]
         # get the first local minimum after the peak velocity to get the pullback
-        # velocity. 'order' is the number of points on each side to compare to. 
-        rel_min_idx = signal.argrelmin(self.vel,order=200)[0]    # HARD CODE ---------------
-        extrema = np.append(rel_min_idx,np.argmax(self.vel))
+        # velocity. 'order' is the number of points on each side to compare to.
+        rel_min_idx = signal.argrelmin(vel,order=200)[0]    # HARD CODE ---------------
+        extrema = np.append(rel_min_idx,peak_idx)
         extrema.sort()
-        pullback_idx = extrema[np.where(extrema==np.argmax(self.vel))[0][0] + 1]
-        pullback_velocity = self.vel[pullback_idx]
-        # plot the final velocity trace with the peak and pullback velocities. 
-        t = (self._cuttime-self._cuttime[0])/1e-9
-        self._ax[1][1].plot(t,self.vel,'k-')
-        self._ax[1][1].plot(t[np.argmax(self.vel)],peak_velocity,'go')
-        self._ax[1][1].plot(t[pullback_idx],pullback_velocity,'rs')
-        self._ax[1][1].set_ylim([-30,np.max(self.vel)*1.05])
+        pullback_idx = extrema[np.where(extrema==peak_idx)[0][0] + 1]
+        pullback_velocity = vel[pullback_idx]
+        return {'peak_velocity':peak_velocity,
+                'peak_index':int(peak_idx),
+                'pullback_velocity':pullback_velocity,
+                'pullback_index':int(pullback_idx)}
+
+    def _post_run(self,result) :
+        self.__plot_peak_and_pullback_velocity(result)
+        super()._post_run(result)
+
+    def __plot_peak_and_pullback_velocity(self,result) :
+        # plot the final velocity trace with the peak and pullback velocities.
+        t = (result.cut_time-result.cut_time[0])/1e-9
+        self._ax[1][1].plot(t,result.velocity,'k-')
+        self._ax[1][1].plot(t[result.peak_index],result.peak_velocity,'go')
+        self._ax[1][1].plot(t[result.pullback_index],result.pullback_velocity,'rs')
+        self._ax[1][1].set_ylim([-30,np.max(result.velocity)*1.05])
         self._ax[1][1].set_xlim([0,np.max(t)])
         self._ax[1][1].grid()
         self._ax[1][1].set_xlabel('Time (ns)')
         self._ax[1][1].set_ylabel('Velocity (m/s)')
         self._ax[1][1].set_title(self._file.stem)
         self._ax[1][1].legend(['Free surface velocity',
-                               f'Peak velocity: {peak_velocity}',
-                               f'Pullback velocity: {pullback_velocity}'],
+                               f'Peak velocity: {result.peak_velocity}',
+                               f'Pullback velocity: {result.pullback_velocity}'],
                                loc='lower right',
                                fontsize=8.5)
 
@@ -332,23 +493,20 @@ class PDVVelocityAnalysis(PDVAnalysis) :
     @property
     def output_file_name(self) :
         return self.__class__.plot_file_name_from_input_file_name(self._file.name)
-    def _post_run(self) :
-        self.__plot_flyer_velocity()
-        super()._post_run()
+    @property
+    def result_type(self) :
+        return PDVVelocityResult
 
-    def __plot_flyer_velocity(self) :
+    @staticmethod
+    def calculate_metrics(vel,cuttime) :
         # find where the velocity first goes positive. this is to cut out the large
         # artificial negative velocity at the beginning
-        for i,v in enumerate(self.vel > 0):
-            if v == True:
-                v_pos_idx = i
-                break
-            else:
-                continue 
+        v_pos_idx = find_first_true(vel > 0)
+        if v_pos_idx is None :
+            raise ValueError('ERROR: the velocity never becomes positive, so the impact velocity cannot be found!')
         # only use the data after v_pos_idx
-        t = self._cuttime[v_pos_idx:]
-        t -= t[0]
-        v = self.vel[v_pos_idx:]
+        t = cuttime[v_pos_idx:] - cuttime[v_pos_idx]
+        v = vel[v_pos_idx:]
         # get position by trapezoidal integration of velocity
         position = (integrate.cumulative_trapezoid(v,t))/1e-6
         # spacer thickness for following spall experiments
@@ -362,7 +520,21 @@ class PDVVelocityAnalysis(PDVAnalysis) :
         # calculate impact velocity as an average. skip the first entry because the
         # velocity array is 1 longer than the position array due to the integration
         impact_vel = np.mean(v[1:][pos_left_idx:pos_right_idx])
-        # plot velocity vs position. again skipping the first velocity entry to get 
+        return {'impact_velocity':impact_vel,
+                'first_positive_index':v_pos_idx,
+                'position':position,
+                'averaging_indices':(int(pos_left_idx),int(pos_right_idx))}
+
+    def _post_run(self,result) :
+        self.__plot_flyer_velocity(result)
+        super()._post_run(result)
+
+    def __plot_flyer_velocity(self,result) :
+        from matplotlib.patches import Rectangle
+        position = result.position
+        v = result.velocity[result.first_positive_index:]
+        pos_left_idx, pos_right_idx = result.averaging_indices
+        # plot velocity vs position. skipping the first velocity entry to get
         # arrays of the same length
         self._ax[1][1].plot(position,v[1:],'k-')
         self._ax[1][1].set_ylim([-30,np.max(v)*1.15])
@@ -384,59 +556,10 @@ class PDVVelocityAnalysis(PDVAnalysis) :
         self._ax[1][1].add_patch(win)
         # add legend
         self._ax[1][1].legend(['Flyer velocity',
-                              f'Averaging Area\nImpact Velocity: {impact_vel}'],
+                              f'Averaging Area\nImpact Velocity: {result.impact_velocity}'],
                               loc='lower right',
                               fontsize=8.5)
 
-# smooth differentiation from matlab file exchange
-def smooth_diff(n):
-    '''
-    % A smoothed differentiation filter (digital differentiator). 
-    %
-    % Such a filter has the following advantages:
-    % 
-    % First, the filter involves both the smoothing operation and differentation operation. 
-    % It can be regarded as a low-pass differention filter (digital differentiator). 
-    % It is well known that the common differentiation operation amplifies the high-frequency noises.
-    % Therefore, the smoothded differentiation filter would be valuable in experimental (noisy) data processing. 
-    % 
-    % Secondly, the filter coefficients are all convenient integers (simple units) except for an integer scaling factor,
-    % as may be especially significant in some applications such as those in some single-chip microcomputers
-    % or digital signal processors. 
-    % 
-    % Usage:
-    % h=smooth_diff(n)
-    % n: filter length (positive integer larger no less than 2)
-    % h: filter coefficients (anti-symmetry)
-    %
-    % Examples:
-    % smooth_demo
-    %
-    % Author:
-    % Jianwen Luo <luojw@bme.tsinghua.edu.cn, luojw@ieee.org> 2004-11-02
-    % Department of Biomedical Engineering, Department of Electrical Engineering
-    % Tsinghua University, Beijing 100084, P. R. China  
-    % 
-    % References:
-    % Usui, S.; Amidror, I., 
-    % Digital Low-Pass Differentiation for Biological Signal-Processing. 
-    % IEEE Transactions on Biomedical Engineering 1982, 29, (10), 686-693.
-    % Luo, J. W.; Bai, J.; He, P.; Ying, K., 
-    % Axial strain calculation using a low-pass digital differentiator in ultrasound elastography. 
-    % IEEE Transactions on Ultrasonics Ferroelectrics and Frequency Control 2004, 51, (9), 1119-1127.
-    '''
-    if n>=2 and math.floor(n)==math.ceil(n):
-        if n%2==1:    #is odd
-            m=int(np.fix((n-1)/2))
-            h=np.hstack((-np.ones((1,m)),np.array(0).reshape(1,1),np.ones((1,m))))/m/(m+1)
-            return h
-        else:    #is even
-            m=int(np.fix(n/2))
-            h=np.hstack((-np.ones((1,m)),np.ones((1,m))))/m**2
-            return h
-    else:    
-        raise TypeError('The input parameter (n) should be a positive integer larger no less than 2.')
-
 def parse_arguments(args=None) :
     """
     Return the parsed namespace of arguments for the main script
@@ -447,7 +570,9 @@ def parse_arguments(args=None) :
     parser = ArgumentParser()
     #positional argument: path to the file to analyze
     parser.add_argument('file', type=pathlib.Path, 
-                        help='Path to the file to analyze')
+                        help='''Path to the file to analyze (CSV or LeCroy binary .trc waveform). If this is
+                                a directory or a glob pattern (in quotes), every matching file will be analyzed
+                                in a pool of processes''')
     #optional arguments
     parser.add_argument('--output_dir', type=pathlib.Path, default=pathlib.Path(),
                         help='''Path to directory in which the output plot file should be saved 
@@ -462,6 +587,39 @@ def parse_arguments(args=None) :
                         help='Length of each segment')
     parser.add_argument('--overlap_frac', type=float, default=0.85,
                         help='fraction of overlapped data to use in Fourier transforms')
+    parser.add_argument('--cache_dir', type=pathlib.Path,
+                        help='''Path to a directory to cache the parsed data from files in, so that analyzing
+                                the same files again (with different parameters) doesn't parse them again''')
+    parser.add_argument('--cache_max_bytes', type=int, default=DEFAULT_CACHE_MAX_BYTES,
+                        help=f'''Maximum total size of the cached data in bytes (the least recently used data
+                                 are removed to stay under it). Default is {DEFAULT_CACHE_MAX_BYTES}.''')
+    parser.add_argument('--spectrogram_method', choices=SPECTROGRAM_METHODS, default='stft',
+                        help='''How to calculate spectrograms: "stft" for full short time fourier transforms,
+                                or "zoom" or "sliding" to only calculate the frequencies around the signal using
+                                zoom FFTs of each segment or a sliding DFT, respectively. Default is "stft".''')
+    parser.add_argument('--coarse_event_search', action='store_true',
+                        help='''Add this flag to locate the event in a coarse spectrogram of the decimated data
+                                first, and only calculate the full-resolution spectrogram around it (the sheet
+                                of plots will show the coarse spectrogram of the imported data)''')
+    parser.add_argument('--downconversion_factor', type=int, default=1,
+                        help='''Mix the data around the event down by the carrier frequency and decimate them
+                                by this factor before the later stages of the analysis. Default is 1 (no mixing).''')
+    parser.add_argument('--low_memory', action='store_true',
+                        help='''Add this flag to analyze the voltage in single precision and release intermediate
+                                arrays as soon as they've been used''')
+    parser.add_argument('--report_peak_memory', action='store_true',
+                        help='Add this flag to print the peak memory allocated while running the analysis')
+    parser.add_argument('--headless', action='store_true',
+                        help='''Add this flag to only run the calculations and print the results
+                                without making the sheet of plots''')
+    parser.add_argument('--n_workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes to use when analyzing multiple files')
+    parser.add_argument('--max_in_flight', type=int, default=None,
+                        help='''Maximum number of files submitted to the worker processes at once when
+                                analyzing multiple files (default: twice the number of workers)''')
+    parser.add_argument('--results_csv', type=pathlib.Path, default=None,
+                        help='''Path to the CSV file of metrics for every file written when analyzing multiple
+                                files (default: "pdv_[exp_type]_results.csv" in the output directory)''')
     return parser.parse_args(args=args)
 
 def main(args=None) :
@@ -472,19 +630,51 @@ def main(args=None) :
     start_time = datetime.datetime.now()
     #parse the arguments
     args = parse_arguments(args)
+    analysis_type = PDVSpallAnalysis if args.exp_type=='spall' else PDVVelocityAnalysis
+    #analyze every file in a directory or matching a glob pattern in a pool of processes
+    if not args.file.is_file() :
+        batch_main(args,analysis_type,start_time)
+        return
     #create the analysis object based on the experiment type
-    if args.exp_type=='spall' :
-        analysis = PDVSpallAnalysis(**args.__dict__)
-    elif args.exp_type=='velocity' :
-        analysis = PDVVelocityAnalysis(**args.__dict__)
-    #run the analysis to create and save the sheet of plots
-    analysis.run()
+    analysis = analysis_type(**args.__dict__)
+    #run the analysis to get the results, creating and saving the sheet of plots unless it's not needed
+    if args.headless :
+        result = analysis.compute()
+    else :
+        result = analysis.run()
     #stop the timer
     end_time = datetime.datetime.now()
     #print details of the run
     print(f'Date:               {start_time.strftime("%b %d %Y    %I:%M %p")}')
     print(f'File:               {args.file}')
     print(f'Experiment Type:    {args.exp_type.capitalize()}')
+    for name,value in result.metrics.items() :
+        print(f'{name+":":<20}{value}')
+    if analysis.peak_memory is not None :
+        print(f'Peak Memory:        {format_memory(analysis.peak_memory)}')
+    print(f'Run Time:           {end_time - start_time}')
+
+def batch_main(args,analysis_type,start_time) :
+    """
+    Analyze multiple files in a pool of processes and write out a CSV file of their metrics
+    """
+    filepaths = get_filepaths_to_analyze(args.file)
+    if len(filepaths)<1 :
+        raise FileNotFoundError(f'ERROR: no files to analyze were found at {args.file}!')
+    results_csv = args.results_csv
+    if results_csv is None :
+        results_csv = args.output_dir/f'pdv_{args.exp_type}_results.csv'
+    print(f'Analyzing {len(filepaths)} files in {args.file} using {args.n_workers} worker processes')
+    analysis_kwargs = {k:v for k,v in args.__dict__.items() if k not in ('file','n_workers','max_in_flight',
+                                                                        'results_csv','headless')}
+    analyze_files_in_pool(analysis_type,filepaths,args.n_workers,
+                          max_in_flight=args.max_in_flight,
+                          headless=args.headless,
+                          results_csv=results_csv,
+                          **analysis_kwargs)
+    end_time = datetime.datetime.now()
+    print(f'Date:               {start_time.strftime("%b %d %Y    %I:%M %p")}')
+    print(f'Experiment Type:    {args.exp_type.capitalize()}')
     print(f'Run Time:           {end_time - start_time}')
 
 if __name__=='__main__' :
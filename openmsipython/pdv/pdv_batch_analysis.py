@@ -0,0 +1,259 @@
+#imports
+import glob, csv, pathlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from scipy.fft import set_workers
+import numpy as np
+from .downconversion import downconvert
+from .pdv_signal_processing import calculate_center_frequency, get_cut_window_indices, calculate_velocity
+from .pdv_pipeline import find_event_times, find_signal_bands, calculate_phase_derivatives, make_plot_spectrogram
+
+class PDVBatchAnalysis :
+    """
+    Run the same type of PDV analysis for many shots at once. The voltage traces are stacked into 2-D arrays
+    so that each stage of the analysis (STFTs, FFTs, filtering, and differentiation) runs once for a whole
+    group of shots along the last axis instead of once per shot. The stages are the same functions
+    (in pdv_pipeline) that single-shot analyses run on 1-D arrays.
+
+    All of the shots must have the same number of samples and the same sample rate.
+    """
+
+    @property
+    def analyses(self) :
+        return self.__analyses # the single-shot analysis objects (used to hold data and parameters and to render)
+    @property
+    def n_shots(self) :
+        return len(self.__analyses)
+
+    def __init__(self,analysis_type,shots,N,overlap_frac,batch_size=16,workers=-1,**kwargs) :
+        """
+        analysis_type = the PDVAnalysis subclass to run (PDVSpallAnalysis or PDVVelocityAnalysis)
+        shots = a list of dictionaries of keyword arguments for each shot's analysis object, each with at least
+                a "file" and either "time" and "voltage" arrays or "rows_to_skip" and "nrows" to read the file
+        N = length of each segment in the Fourier transforms
+        overlap_frac = fraction of overlapped data to use in Fourier transforms
+        batch_size = the number of shots to stack together at once (limits the size of the batched spectrograms)
+        workers = the number of workers to use in parallel FFTs (-1 uses all of the available CPUs)
+        any other keyword arguments are passed to every shot's analysis object
+        """
+        if batch_size<1 :
+            raise ValueError(f'ERROR: batch_size must be a positive integer but {batch_size} was given!')
+        self.__analyses = [analysis_type(N=N,overlap_frac=overlap_frac,**{**kwargs,**shot}) for shot in shots]
+        if len(self.__analyses)<1 :
+            raise ValueError('ERROR: PDVBatchAnalysis needs at least one shot to analyze!')
+        self.__batch_size = batch_size
+        self.__workers = workers
+        #all of the shots must share the same time base to be stacked together
+        ref = self.__analyses[0]
+        for analysis in self.__analyses[1:] :
+            if analysis.voltage.shape!=ref.voltage.shape or not np.isclose(analysis.sample_rate,ref.sample_rate) :
+                errmsg = f'ERROR: {analysis._file} has {analysis.voltage.shape[0]} samples at '
+                errmsg+= f'{analysis.sample_rate} Hz but {ref._file} has {ref.voltage.shape[0]} samples '
+                errmsg+= f'at {ref.sample_rate} Hz! All shots in a batch must have the same shape and sample rate.'
+                raise ValueError(errmsg)
+
+    def compute(self,keep_spectrograms=False) :
+        """
+        Run the numerical part of the analysis for every shot and return a list of the results in the same order
+        as the shots were given. Shots that fail (because no event could be found, for example) have the
+        Exception that was raised in their place in the list instead of a result.
+
+        keep_spectrograms = if True, the spectrograms needed to render the plots are also calculated
+                            and added to the results
+        """
+        results = []
+        #every FFT (including those inside the STFTs) is run on the whole stack using multiple workers
+        with set_workers(self.__workers) :
+            for istart in range(0,self.n_shots,self.__batch_size) :
+                results+=self.__compute_batch(self.__analyses[istart:istart+self.__batch_size],keep_spectrograms)
+        return results
+
+    def render(self,results) :
+        """
+        Render the sheets of plots for a list of results returned by compute(keep_spectrograms=True)
+        """
+        for analysis,result in zip(self.__analyses,results) :
+            if isinstance(result,Exception) :
+                continue
+            analysis.render(result)
+
+    def __compute_batch(self,analyses,keep_spectrograms) :
+        """
+        Run the analysis for one group of shots stacked into 2-D arrays and return the list of their results
+        """
+        ref = analyses[0]
+        stft_kwargs = ref.stft_kwargs
+        method = ref.spectrogram_method
+        low_memory = ref.low_memory
+        sample_rate = ref.sample_rate
+        results = [None]*len(analyses)
+        # calculate the center frequencies (and find the events) of all of the shots at once
+        voltages = np.stack([analysis.voltage for analysis in analyses])
+        cens = calculate_center_frequency(voltages,sample_rate)
+        event_times, imported_spectrograms = find_event_times(voltages,sample_rate,cens,stft_kwargs,
+                                                              ref.req_time_pos,ref.window_time,
+                                                              ref.coarse_event_search,method,low_memory)
+        # cut the window around the event in each shot
+        cut_times = []
+        cut_voltages = []
+        fixt = None
+        ok = []
+        for ia,analysis in enumerate(analyses) :
+            try :
+                if isinstance(event_times[ia],Exception) :
+                    raise event_times[ia]
+                start_idx, end_idx, fixt = get_cut_window_indices(analysis.time,event_times[ia],
+                                                                  ref.window_time,ref.split)
+            except Exception as e :
+                results[ia] = e
+                continue
+            ok.append(ia)
+            cut_times.append(analysis.time[start_idx:end_idx+1])
+            cut_voltages.append(analysis.voltage[start_idx:end_idx+1])
+        if len(ok)==0 :
+            return results
+        # everything from here on runs on the stack of cut windows
+        cut_cens = cens[ok]
+        cut_voltages = np.stack(cut_voltages)
+        factor = ref.downconversion_factor
+        baseband = downconvert(cut_voltages,sample_rate,cut_cens,factor) if factor>1 else None
+        freq_lows, freq_peaks, (cutf,cutt,cutpower) = find_signal_bands(cut_voltages,cut_cens,stft_kwargs,method,
+                                                                        baseband,factor,low_memory)
+        phasD2, isolated = calculate_phase_derivatives(cut_voltages,fixt,sample_rate,cut_cens,
+                                                       freq_lows*(1-ref.expansion),freq_peaks*(1+ref.expansion),
+                                                       stft_kwargs,method,baseband,factor,low_memory,
+                                                       keep_spectrograms)
+        vels = calculate_velocity(phasD2,cut_cens)
+        # make the result for each shot
+        for ib,ia in enumerate(ok) :
+            analysis = analyses[ia]
+            spectrograms = None
+            if keep_spectrograms :
+                f,t,power = imported_spectrograms[ia]
+                isof,isot,isopower = isolated
+                spectrograms = {'imported':make_plot_spectrogram(f,t,power.copy(),cut_cens[ib]),
+                                'cut_time':make_plot_spectrogram(cutf,cutt,cutpower[ib].copy(),cut_cens[ib],factor),
+                                'isolated':make_plot_spectrogram(isof,isot,isopower[ib].copy(),cut_cens[ib],factor)}
+            try :
+                results[ia] = analysis.result_type(file=analysis._file,
+                                                   center_frequency=cut_cens[ib],
+                                                   event_time=event_times[ia],
+                                                   window_start_time=cut_times[ib][0]-analysis.time[0],
+                                                   freq_low=freq_lows[ib],
+                                                   freq_peak=freq_peaks[ib],
+                                                   cut_time=cut_times[ib],
+                                                   velocity=vels[ib],
+                                                   spectrograms=spectrograms,
+                                                   **analysis.calculate_metrics(vels[ib],cut_times[ib]))
+            except Exception as e :
+                results[ia] = e
+        return results
+
+def get_filepaths_to_analyze(path) :
+    """
+    Return the sorted list of files to analyze given a path to a single file, a directory
+    (every non-hidden file directly inside it), or a glob pattern
+    """
+    path = pathlib.Path(path)
+    if path.is_dir() :
+        return sorted([fp for fp in path.iterdir() if fp.is_file() and not fp.name.startswith('.')])
+    if path.is_file() :
+        return [path]
+    return sorted([pathlib.Path(fp) for fp in glob.glob(str(path)) if pathlib.Path(fp).is_file()])
+
+def _initialize_pool_worker(headless) :
+    """
+    Give every worker process its own non-interactive matplotlib state (if plots will be made)
+    """
+    if not headless :
+        import matplotlib
+        matplotlib.use('Agg')
+
+def _analyze_file_in_pool_worker(analysis_type,headless,kwargs) :
+    """
+    Run the analysis for a single file in a worker process and return only its scalar metrics,
+    so that no large arrays need to be sent back to the main process
+    """
+    analysis = analysis_type(**kwargs)
+    result = analysis.compute() if headless else analysis.run()
+    return result.metrics
+
+def analyze_files_in_pool(analysis_type,filepaths,n_workers,max_in_flight=None,headless=False,
+                          results_csv=None,print_progress=True,**kwargs) :
+    """
+    Analyze a list of files in parallel using a pool of worker processes. Returns a list of
+    (filepath, metrics dictionary or Exception) tuples in the same order as the filepaths.
+
+    analysis_type = the PDVAnalysis subclass to run for every file
+    filepaths = the list of files to analyze
+    n_workers = the number of worker processes to use
+    max_in_flight = the maximum number of files submitted to the pool at once (limits the memory used by
+                    pending work; default is twice the number of workers)
+    headless = if True, only the numerical analysis is run (no sheets of plots are made)
+    results_csv = path to a CSV file that should be written with the metrics for every file
+    print_progress = if True, a line will be printed as each file finishes and a summary at the end
+    any other keyword arguments are passed to every file's analysis object
+    """
+    if max_in_flight is None :
+        max_in_flight = 2*n_workers
+    if n_workers<1 or max_in_flight<1 :
+        raise ValueError(f'ERROR: n_workers ({n_workers}) and max_in_flight ({max_in_flight}) must be positive!')
+    results = {}
+    n_failed = 0
+    to_submit = list(enumerate(filepaths))[::-1]
+    in_flight = {}
+    with ProcessPoolExecutor(max_workers=n_workers,initializer=_initialize_pool_worker,
+                             initargs=(headless,)) as executor :
+        while len(to_submit)>0 or len(in_flight)>0 :
+            #keep the pool busy without submitting every file at once
+            while len(to_submit)>0 and len(in_flight)<max_in_flight :
+                ifp,filepath = to_submit.pop()
+                future = executor.submit(_analyze_file_in_pool_worker,analysis_type,headless,
+                                         {**kwargs,'file':filepath})
+                in_flight[future] = ifp
+            done,_ = wait(in_flight.keys(),return_when=FIRST_COMPLETED)
+            for future in done :
+                ifp = in_flight.pop(future)
+                exc = future.exception()
+                results[ifp] = exc if exc is not None else future.result()
+                if exc is not None :
+                    n_failed+=1
+                if print_progress :
+                    msg = f'[{len(results)}/{len(filepaths)}] {filepaths[ifp]}: '
+                    msg+= f'FAILED ({exc})' if exc is not None else 'done'
+                    print(msg)
+    to_return = [(filepaths[ifp],results[ifp]) for ifp in range(len(filepaths))]
+    if results_csv is not None :
+        write_metrics_csv(to_return,results_csv)
+    if print_progress :
+        msg = f'{len(filepaths)-n_failed} of {len(filepaths)} file{"s" if len(filepaths)!=1 else ""} '
+        msg+= 'analyzed successfully'
+        if n_failed>0 :
+            msg+=f', {n_failed} failed'
+        if results_csv is not None :
+            msg+=f'. Metrics written to {results_csv}'
+        print(msg)
+    return to_return
+
+def write_metrics_csv(filepaths_and_metrics,csv_path) :
+    """
+    Write a CSV file with one row of metrics per file, given a list of (filepath, metrics dictionary or Exception)
+    tuples. Failed files get a row with their error message and no metrics.
+    """
+    fieldnames = ['file']
+    for _,metrics in filepaths_and_metrics :
+        if not isinstance(metrics,Exception) :
+            for name in metrics.keys() :
+                if name not in fieldnames :
+                    fieldnames.append(name)
+    fieldnames.append('error')
+    csv_path = pathlib.Path(csv_path)
+    if not csv_path.parent.is_dir() :
+        csv_path.parent.mkdir(parents=True)
+    with open(csv_path,'w',newline='') as fp :
+        writer = csv.DictWriter(fp,fieldnames=fieldnames)
+        writer.writeheader()
+        for filepath,metrics in filepaths_and_metrics :
+            if isinstance(metrics,Exception) :
+                writer.writerow({'file':str(filepath),'error':str(metrics)})
+            else :
+                writer.writerow({'file':str(filepath),**metrics,'error':''})
@@ -0,0 +1,100 @@
+#imports
+import numpy as np
+from .pdv_result import PDVSpectrogram
+from .pdv_signal_processing import find_event_start_index, find_event_time_coarse_to_fine, calculate_signal_band
+from .pdv_signal_processing import isolate_signal, calculate_phase_derivative
+from .time_frequency import calculate_spectrogram_with_method
+from .downconversion import get_baseband_stft_kwargs, calculate_baseband_spectrogram, shift_baseband_spectrogram
+from .downconversion import calculate_baseband_signal_band, isolate_baseband_signal, restore_time_base
+
+# The stages of a PDV analysis, shared by single shots (PDVAnalysis) and batches of shots (PDVBatchAnalysis)
+
+def find_event_times(voltage,sample_rate,cen,stft_kwargs,req_time_pos,search_time,coarse_event_search=False,
+                     method='stft',low_memory=False) :
+    """
+    Return a list of the times (relative to the first points) where the events begin in one voltage trace or a
+    stack of them, and a list of the frequencies, times, and power of the spectrograms of the imported data
+    the events were found in, with one entry for each trace. Traces where no event can be found have the
+    Exception that was raised in place of their event time.
+
+    coarse_event_search = if True, each event is located in a coarse spectrogram first, and only the
+                          full-resolution spectrogram around it is calculated (the coarse spectrogram is returned)
+    """
+    voltages = np.atleast_2d(voltage)
+    cens = np.atleast_1d(cen)
+    spectrogram_function = lambda v,kw : calculate_spectrogram_with_method(v,kw,method,low_memory=low_memory)
+    if not coarse_event_search :
+        # the short time fourier transforms of every trace are calculated at once
+        f,t,power = spectrogram_function(voltages,stft_kwargs)
+    event_times = []
+    spectrograms = []
+    for iv in range(voltages.shape[0]) :
+        try :
+            if coarse_event_search :
+                event_time, spectrogram = find_event_time_coarse_to_fine(voltages[iv],sample_rate,cens[iv],
+                                                                         stft_kwargs,req_time_pos,search_time,
+                                                                         spectrogram_function=spectrogram_function)
+            else :
+                spectrogram = (f,t,power[iv])
+                event_time = t[find_event_start_index(f,t,power[iv],cens[iv],req_time_pos)]
+        except Exception as e :
+            event_time, spectrogram = e, None
+        event_times.append(event_time)
+        spectrograms.append(spectrogram)
+    return event_times, spectrograms
+
+def find_signal_bands(cutvoltage,cen,stft_kwargs,method='stft',baseband=None,factor=1,low_memory=False) :
+    """
+    Return the lowest and highest frequencies where the signals peak in cut windows of voltage, and the
+    frequencies, times, and power of the spectrograms they were found in. Like the other stages, this works
+    along the last axis: one shot's cut window is 1-D, and a batch's are stacked with one row per shot
+    (with per-shot scalars like cen given as 1-D arrays).
+
+    baseband = the cut windows mixed down by cen and decimated by factor (used instead of the cut windows
+               if factor is more than one, in which case the spectrograms' frequencies are relative to cen)
+    """
+    if factor>1 :
+        f,t,power = calculate_baseband_spectrogram(baseband,get_baseband_stft_kwargs(stft_kwargs,factor))
+        freq_low, freq_peak = calculate_baseband_signal_band(f,power,cen)
+    else :
+        f,t,power = calculate_spectrogram_with_method(cutvoltage,stft_kwargs,method,low_memory=low_memory)
+        freq_low, freq_peak = calculate_signal_band(f,power)
+    return freq_low, freq_peak, (f,t,power)
+
+def calculate_phase_derivatives(cutvoltage,fixt,sample_rate,cen,freq_low,freq_high,stft_kwargs,method='stft',
+                                baseband=None,factor=1,low_memory=False,keep_spectrograms=False) :
+    """
+    Return the phase derivatives (in Hz, in the time base of the cut windows) of the signals isolated between
+    freq_low and freq_high in cut windows of voltage with the carrier filtered out after fixt, and the
+    frequencies, times, and power of the spectrograms of the isolated signals (None unless keep_spectrograms)
+
+    baseband = the cut windows mixed down by cen and decimated by factor (used instead of the cut windows
+               if factor is more than one, in which case the spectrograms' frequencies are relative to cen)
+    """
+    spectrogram = None
+    if factor>1 :
+        fs = sample_rate/factor
+        voltagefilt = isolate_baseband_signal(baseband,int(round(fixt/factor)),fs,
+                                              freq_low-np.asarray(cen),freq_high-np.asarray(cen))
+        if keep_spectrograms :
+            spectrogram = calculate_baseband_spectrogram(voltagefilt,get_baseband_stft_kwargs(stft_kwargs,factor))
+        # the carrier's phase is added back before differentiating so that the differentiator's start-up
+        # transient is the same as without downconversion, and the result is put back in the original time base
+        phasD2 = calculate_phase_derivative(voltagefilt,fs,carrier_freq=cen)
+        return restore_time_base(phasD2,factor,cutvoltage.shape[-1]), spectrogram
+    voltagefilt = isolate_signal(cutvoltage,fixt,sample_rate,cen,freq_low,freq_high)
+    # the spectrogram with the signal isolated and the upshift filtered out is only needed for plotting.
+    # need to take only the real part of the voltage in order to prevent scipy from giving a two-sided output.
+    if keep_spectrograms :
+        spectrogram = calculate_spectrogram_with_method(np.real(voltagefilt),stft_kwargs,method,
+                                                        freq_low,freq_high,low_memory=low_memory)
+    return calculate_phase_derivative(voltagefilt,sample_rate), spectrogram
+
+def make_plot_spectrogram(f,t,power,cen,factor=1) :
+    """
+    Return a PDVSpectrogram of a single shot's spectrogram to plot, with baseband frequencies
+    (if factor is more than one) shifted back to the original frame
+    """
+    if factor>1 :
+        f, power = shift_baseband_spectrogram(f,power,cen)
+    return PDVSpectrogram(f,t,power)
@@ -3,13 +3,13 @@ import datetime
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import pandas as pd
-from io import BytesIO
+import numpy as np
 from openmsistream import DataFileStreamProcessor
 from openmsistream.utilities import Runnable
 from openmsistream.data_file_io.config import RUN_OPT_CONST
-from ..shared.argument_parsing import OpenMSIPythonArgumentParser
+from .argument_parsing import LecroyArgumentParser
 from .pdv_analysis import PDVSpallAnalysis, PDVVelocityAnalysis
+from .memory_tracking import format_memory
 from .lecroy_data_file import DownloadLecroyDataFile
 from .config import LECROY_CONST
 
@@ -19,14 +19,17 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
     and create spall/velocity plots from them when all of their data are available
     """
 
-    ARGUMENT_PARSER_TYPE = OpenMSIPythonArgumentParser
+    ARGUMENT_PARSER_TYPE = LecroyArgumentParser
 
     @property
     def other_datafile_kwargs(self) :
-        return {'header_rows':self.__header_rows}
+        #the data are parsed as they arrive, so plots can be made as soon as the last chunk of a file does
+        return {'header_rows':self.__header_rows,
+                'parse_incrementally':True,
+                'voltage_dtype':np.float32 if self.__low_memory else None}
 
     def __init__(self,pdv_plot_type,config_path,topic_name,
-                 header_rows=LECROY_CONST.HEADER_ROWS,**otherkwargs) :
+                 header_rows=LECROY_CONST.HEADER_ROWS,low_memory=False,report_peak_memory=False,**otherkwargs) :
         super().__init__(config_path,topic_name,datafile_type=DownloadLecroyDataFile,**otherkwargs)
         self.__pdv_analysis_type = None
         if pdv_plot_type=='spall' :
@@ -36,6 +39,10 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
         else :
             self.logger.error(f'ERROR: unrecognized pdv_plot_type {pdv_plot_type}',ValueError)
         self.__header_rows = header_rows
+        self.__low_memory = low_memory
+        self.__report_peak_memory = report_peak_memory
+        #names of the plot files made for each file (several if a file holds several windows of data)
+        self.__plot_file_names = {}
 
     def make_plots_as_available(self) :
         """
@@ -44,9 +51,11 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
         _,_,processed_data_filepaths = self.process_files_as_read()
         created_plot_paths = []
         for pdfp in processed_data_filepaths :
-            fn = self.__pdv_analysis_type.plot_file_name_from_input_file_name(pdfp.name,
-                                                                              LECROY_CONST.SKIMMED_FILENAME_APPEND)
-            created_plot_paths.append(self._output_dir/fn)
+            fns = self.__plot_file_names.get(pdfp.name)
+            if fns is None :
+                fns = [self.__pdv_analysis_type.plot_file_name_from_input_file_name(pdfp.name,
+                                                                              LECROY_CONST.SKIMMED_FILENAME_APPEND)]
+            created_plot_paths+=[self._output_dir/fn for fn in fns]
         return self.n_msgs_read, self.n_msgs_processed, created_plot_paths
 
     def _process_downloaded_data_file(self,datafile,lock) :
@@ -54,26 +63,40 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
         Make plots for the data in the given file
         """
         try :
-            #get the raw data from the file's bytestring
-            data = pd.read_csv(BytesIO(datafile.bytestring),skiprows=datafile.header_rows)
-            data.columns = ['Time','Ampl']
-            time = data['Time'].to_numpy()
-            voltage = data['Ampl'].to_numpy()
-            #run the analysis using the data
-            fig = plt.figure(figsize=(10,6),dpi=300)
-            analysis = self.__pdv_analysis_type(file=datafile.filepath,
-                                                time=time,
-                                                voltage=voltage,
-                                                output_dir=self._output_dir,
-                                                N=512,
-                                                overlap_frac=0.85,
-                                                pyplot_figure=fig)#self.__figure)
-            analysis.run()
-            #save the plot and close the figure
+            #get the raw data in each window selected from the file
+            windows = datafile.get_windows(np.float32 if self.__low_memory else None)
             fn = self.__pdv_analysis_type.plot_file_name_from_input_file_name(datafile.filepath.name,
                                                                               LECROY_CONST.SKIMMED_FILENAME_APPEND)
-            fig.savefig(self._output_dir/fn,bbox_inches='tight')
-            plt.close()
+            fns = []
+            #run a separate analysis for each window
+            for iw in range(len(windows)) :
+                time, voltage = windows[iw]
+                windows[iw] = None
+                fig = plt.figure(figsize=(10,6),dpi=300)
+                analysis = self.__pdv_analysis_type(file=datafile.filepath,
+                                                    time=time,
+                                                    voltage=voltage,
+                                                    output_dir=self._output_dir,
+                                                    N=512,
+                                                    overlap_frac=0.85,
+                                                    low_memory=self.__low_memory,
+                                                    report_peak_memory=self.__report_peak_memory,
+                                                    pyplot_figure=fig)#self.__figure)
+                #in low memory mode the analysis holds the only references to the data
+                #so that it can release them as soon as it's done with them
+                del time, voltage
+                analysis.run()
+                window_name = f' (window {iw+1} of {len(windows)})' if len(windows)>1 else ''
+                if analysis.peak_memory is not None :
+                    msg = f'Peak memory allocated while making plots for {datafile.filepath.name}{window_name}: '
+                    msg+= f'{format_memory(analysis.peak_memory)}'
+                    self.logger.info(msg)
+                #save the plot and close the figure
+                fns.append(fn if len(windows)==1 else fn[:-len('.png')]+f'_window_{iw+1}.png')
+                fig.savefig(self._output_dir/fns[-1],bbox_inches='tight')
+                plt.close()
+            with lock :
+                self.__plot_file_names[datafile.filepath.name] = fns
         except Exception as e :
             return e
         return None
@@ -91,7 +114,8 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
     @classmethod
     def get_command_line_arguments(cls) :
         superargs,superkwargs = super().get_command_line_arguments()
-        args = [*superargs,'optional_output_dir','pdv_plot_type','update_seconds']
+        args = [*superargs,'optional_output_dir','pdv_plot_type','low_memory','report_peak_memory',
+                'update_seconds']
         kwargs = {**superkwargs,
                   'config':RUN_OPT_CONST.PRODUCTION_CONFIG_FILE,
                   'topic_name':LECROY_CONST.TOPIC_NAME,
@@ -109,6 +133,8 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
         args = parser.parse_args(args=args)
         #make the plot maker
         plot_maker = cls(args.output_dir,args.pdv_plot_type,args.config,args.topic_name,
+                         low_memory=args.low_memory,
+                         report_peak_memory=args.report_peak_memory,
                          n_threads=args.n_threads,
                          update_secs=args.update_seconds,
                          consumer_group_ID=args.consumer_group_ID,
@@ -0,0 +1,62 @@
+#imports
+import pathlib
+from typing import Dict, Optional
+from dataclasses import dataclass, fields
+import numpy as np
+
+@dataclass
+class PDVSpectrogram :
+    """
+    The frequency/time bins and power (in dB) of one short time fourier transform
+    """
+    f : np.ndarray
+    t : np.ndarray
+    power : np.ndarray
+
+@dataclass
+class PDVAnalysisResult :
+    """
+    Arrays and scalar metrics produced by running a PDV analysis without any plotting.
+    Spectrograms are only kept if they were requested (they're only needed to render the plots)
+    """
+    file : pathlib.Path
+    center_frequency : float        # the carrier frequency ("upshift") in Hz
+    event_time : float              # time of the start of the event relative to the first sample, in seconds
+    window_start_time : float       # time of the start of the cut window relative to the first sample, in seconds
+    freq_low : float                # lowest frequency of the signal in the cut window, in Hz
+    freq_peak : float               # highest frequency of the signal in the cut window, in Hz
+    cut_time : np.ndarray           # time values for the cut window
+    velocity : np.ndarray           # velocity history over the cut window, in m/s
+    spectrograms : Optional[Dict[str,PDVSpectrogram]]
+
+    @property
+    def metrics(self) :
+        """
+        A dictionary of the scalar values in the result, keyed by field name
+        """
+        to_return = {}
+        for field in fields(self) :
+            value = getattr(self,field.name)
+            if isinstance(value,(int,float,np.integer,np.floating)) :
+                to_return[field.name] = value.item() if isinstance(value,np.generic) else value
+        return to_return
+
+@dataclass
+class PDVSpallResult(PDVAnalysisResult) :
+    """
+    Result of a PDV analysis for a spall experiment
+    """
+    peak_velocity : float
+    peak_index : int
+    pullback_velocity : float
+    pullback_index : int
+
+@dataclass
+class PDVVelocityResult(PDVAnalysisResult) :
+    """
+    Result of a PDV analysis for a flyer velocity experiment
+    """
+    impact_velocity : float
+    first_positive_index : int     # index in the cut window where the velocity first goes positive
+    position : np.ndarray          # flyer position (in microns) after the velocity first goes positive
+    averaging_indices : tuple      # (left,right) indices in the position array of the impact velocity average
@@ -0,0 +1,348 @@
+#imports
+import math
+from scipy import signal
+from scipy.fft import fft, ifft, rfft
+from scipy.fftpack import fftshift
+import numpy as np
+from .event_detection import find_first_run
+
+# width of the notch filter around the carrier frequency
+NOTCH_WIDTH = 0.01e9   # 10 MHz
+
+# Functions for each numerical stage of a PDV analysis, along the last axis so batches of shots (one per row) work too
+
+def calculate_spectrogram(voltage,stft_kwargs) :
+    """
+    Return the frequencies, times, and power (in dB) of the short time fourier transform of voltage
+    """
+    f,t,Zxx = signal.stft(voltage,axis=-1,**stft_kwargs)
+    return f, t, 20*(np.log10(np.abs(Zxx)))
+
+def calculate_center_frequency(voltage,sample_rate) :
+    """
+    Return the center frequency (the upshift) of voltage, taken as the frequency with the largest amplitude
+    in its spectrum (ignoring the lowest 99 bins)
+    """
+    npts = voltage.shape[-1]
+    spectra1 = fft(voltage,axis=-1)
+    spectra2 = np.abs(spectra1/npts)
+    spectra3 = spectra2[...,0:(npts//2 + 1)]
+    spectra3[...,1:-1] = 2*spectra3[...,1:-1]
+    w = (sample_rate*np.arange(0,(npts/2)))/npts # w = frequency
+    index = np.argmax(spectra3[...,99:],axis=-1)
+    return w[index+99]
+
+def calculate_ridge_frequency(f,power) :
+    """
+    Return the frequency with the maximum power in each time bin of a spectrogram
+    """
+    return f[np.argmax(power,axis=-2)]
+
+def find_event_start_index(f,t,power,cen,req_time_pos) :
+    """
+    Return the index of the time bin in a single spectrogram where the event begins: the point where the
+    signal frequency increases above the carrier frequency and stays above it for at least req_time_pos
+    """
+    # make an array of the carrier frequency of length t
+    carrier = cen*np.ones(len(t))
+    # frequency array correspoding to the max power in the spectrogram
+    freq_max_power = calculate_ridge_frequency(f,power)
+    # difference between the signal and carrier freq
+    difference = freq_max_power - carrier
+    # time derivative of the difference
+    dDdt = (np.diff(difference,n=1)/1e9)/(np.diff(t,n=1)/1e-9)
+    # average time step
+    avg_time_step = np.mean(np.diff(t))
+    # number of steps in the difference array where it must remain positive, rounded up
+    num_steps = math.ceil(req_time_pos/avg_time_step)
+    # find the first point where the derivative is positive that begins a run of points above the
+    # carrier frequency lasting at least req_time_pos. skipping the first point in the difference
+    # array because the derivative array has one less point than the difference array.
+    idx = find_first_run(difference[1:] > 0,num_steps,starts=dDdt > 0)
+    if idx is not None :
+        return idx + 1
+    raise ValueError(f'ERROR: could not find an event that stays above the carrier frequency for {req_time_pos} s!')
+
+def find_event_time_coarse_to_fine(voltage,sample_rate,cen,stft_kwargs,req_time_pos,search_time,
+                                   coarse_factor=4,spectrogram_function=calculate_spectrogram) :
+    """
+    Return the time (relative to the first point) where the event begins in a single voltage trace, along with
+    the frequencies, times, and power (in dB) of a coarse spectrogram of the whole trace.
+
+    The event is first located roughly in a spectrogram of the voltage decimated by coarse_factor, with
+    segments covering the same time as the full spectrogram's but with no overlap or zero-padding. Then the
+    full-resolution spectrogram is only calculated for the segments within search_time around that rough
+    location (plus req_time_pos after it), and the event is found in those segments exactly as it would be
+    found in the full spectrogram. If the event can't be found that way (or begins at the very edge of the
+    search range) the full spectrogram of the whole trace is searched instead.
+
+    spectrogram_function = the function to call with the voltage and stft_kwargs to calculate the full-resolution
+                           spectrogram segments
+    """
+    nperseg = stft_kwargs['nperseg']
+    nstep = int(nperseg-stft_kwargs['noverlap'])
+    # coarse spectrogram of the decimated data
+    coarse_nperseg = max(nperseg//coarse_factor,8)
+    coarse_kwargs = {'fs':sample_rate/coarse_factor,
+                     'nperseg':coarse_nperseg,
+                     'noverlap':0,
+                     'nfft':coarse_nperseg,
+                     'boundary':None}
+    coarse_spectrogram = calculate_spectrogram(signal.decimate(voltage,coarse_factor,ftype='fir',zero_phase=True),
+                                               coarse_kwargs)
+    coarse_f, coarse_t, coarse_power = coarse_spectrogram
+    # the rough location of the event is where the coarse ridge is more than one coarse bin above the carrier
+    coarse_idx = find_first_run(calculate_ridge_frequency(coarse_f,coarse_power) > cen+coarse_f[1],
+                                math.ceil(req_time_pos/np.mean(np.diff(coarse_t))))
+    if coarse_idx is not None :
+        # the full-resolution segments around the rough location, which are exactly the same as the
+        # segments of the full spectrogram with the same indices
+        first_sample = (coarse_t[coarse_idx]-search_time/2)*sample_rate-nperseg/2
+        last_sample = (coarse_t[coarse_idx]+search_time/2+req_time_pos)*sample_rate+nperseg/2
+        first_segment = max(int(first_sample//nstep),0)
+        last_segment = max(int(math.ceil((last_sample-nperseg)/nstep)),first_segment+1)
+        f,_,power = spectrogram_function(voltage[first_segment*nstep:last_segment*nstep+nperseg],stft_kwargs)
+        # times calculated the same way as signal.stft's for the whole trace
+        t = (nperseg/2+(first_segment+np.arange(power.shape[-1]))*float(nstep))/float(sample_rate)
+        try :
+            event_idx = find_event_start_index(f,t,power,cen,req_time_pos)
+        except ValueError :
+            event_idx = None
+        if event_idx is not None and (event_idx>1 or first_segment==0) :
+            return t[event_idx], coarse_spectrogram
+    # fall back to searching the full spectrogram
+    f,t,power = spectrogram_function(voltage,stft_kwargs)
+    return t[find_event_start_index(f,t,power,cen,req_time_pos)], coarse_spectrogram
+
+def get_cut_window_indices(time,event_time,window_time,split) :
+    """
+    Return the start index, end index (inclusive), and number of points before the event for the window of
+    window_time around the time (relative to the first point) where the event begins in a single time array.
+    Raises a ValueError if the window doesn't fit inside the time array.
+    """
+    # calculate the amount of time before and after the event begins and convert to
+    # the number of indices in the time and voltage arrays
+    time_before = window_time*split
+    time_after = window_time*(1-split)
+    avg_time_step = np.mean(np.diff(time))
+    idx_before = math.ceil(time_before/avg_time_step)
+    idx_after = math.ceil(time_after/avg_time_step)
+    # find the index where the time is closest to the event start time
+    event_idx = np.argmin(np.abs(((time - time[0]) - event_time)))
+    # get the starting and ending indices for the cut time and voltage
+    start_idx = event_idx - idx_before
+    end_idx = event_idx + idx_after
+    if start_idx<0 or end_idx>=time.shape[0] :
+        errmsg = f'ERROR: the event at {event_time} s is too close to the edge of the data to cut a window of '
+        errmsg+= f'{window_time} s around it!'
+        raise ValueError(errmsg)
+    return start_idx, end_idx, idx_before
+
+def calculate_signal_band(f,power) :
+    """
+    Return the lowest (nonzero) and highest frequencies where the signal peaks in a spectrogram
+    """
+    freq_max_power = calculate_ridge_frequency(f,power)
+    freq_peak = np.max(freq_max_power,axis=-1)
+    freq_low = np.min(np.where(freq_max_power!=0,freq_max_power,np.inf),axis=-1)
+    return freq_low, freq_peak
+
+def isolate_signal(cutvoltage,fixt,sample_rate,cen,freq_low,freq_high,fused=True) :
+    """
+    Return the complex signal isolated from the cut voltage by notch filtering out the carrier frequency
+    after fixt and then keeping only the band between freq_low and freq_high
+
+    fused = if True, the notch and the band isolation are combined into a single mask applied between one
+            forward and one inverse transform of the whole cut window (see isolate_signal_fused). If False,
+            the notch and band isolation are applied one after the other with two pairs of transforms.
+    """
+    if fused :
+        return isolate_signal_fused(cutvoltage,fixt,sample_rate,cen,freq_low,freq_high)
+    cen = np.asarray(cen)[...,np.newaxis]
+    freq_low = np.asarray(freq_low)[...,np.newaxis]
+    freq_high = np.asarray(freq_high)[...,np.newaxis]
+    # filter the data
+    ntail = cutvoltage.shape[-1]-fixt
+    freq = fftshift(np.arange(-ntail/2,ntail/2) * sample_rate/ntail)
+    filt_1 = 1-carrier_rejection_band(freq,cen)
+    # this filter is a sixth order Gaussian notch with an 10 MHz rejection band
+    # surrounding the beat frequency with strongest intensity in the spectrogram
+    voltagefilt = ifft(fft(cutvoltage[...,fixt:],axis=-1) * filt_1,axis=-1)  # data after fixt is filtered
+    voltagefilt = np.concatenate((cutvoltage[...,0:fixt],voltagefilt),axis=-1)
+    # isolate signal
+    numpts = cutvoltage.shape[-1]
+    freq = fftshift(np.arange((-numpts/2),(numpts/2)) * sample_rate/numpts)
+    filt = (freq > freq_low) * (freq < freq_high)
+    return ifft(fft(voltagefilt,axis=-1)*filt,axis=-1)
+
+def isolate_signal_fused(cutvoltage,fixt,sample_rate,cen,freq_low,freq_high) :
+    """
+    Return the same complex signal as applying the notch and band isolation filters separately, but using
+    one forward real transform of the whole cut window, one combined mask, and one inverse transform.
+
+    The band mask only keeps positive frequencies, so only the rfft of the cut voltage is needed. The notch
+    removes a component from the data after fixt made up of just the few frequencies near the carrier,
+    C[k] = T[k]*R[k] (T being the transform of the data after fixt and R the notch's rejection band).
+    The transform of that component (delayed by fixt) at each bin of the cut window is a geometric series,
+    so it's subtracted in closed form for just the bins in the band instead of transforming the notched data.
+    """
+    cutvoltage = np.asarray(cutvoltage)
+    numpts = cutvoltage.shape[-1]
+    ntail = numpts-fixt
+    lead_shape = cutvoltage.shape[:-1]
+    cen = np.broadcast_to(cen,lead_shape)
+    freq_low = np.broadcast_to(freq_low,lead_shape)
+    freq_high = np.broadcast_to(freq_high,lead_shape)
+    # same frequency labels as the separate filters use
+    freq = fftshift(np.arange((-numpts/2),(numpts/2)) * sample_rate/numpts)[:numpts//2+1]
+    tail_freq = fftshift(np.arange(-ntail/2,ntail/2) * sample_rate/ntail)
+    # the transforms of the data after fixt are only needed at the few bins the notch rejects
+    tail_spectra = rfft(cutvoltage[...,fixt:],axis=-1)
+    # the spectrum of the isolated signal goes in the first part of one preallocated full-length buffer
+    # (single precision data stay in single precision)
+    spectrum = np.zeros(lead_shape+(numpts,),dtype=np.result_type(cutvoltage.dtype,np.complex64))
+    positive = spectrum[...,:numpts//2+1]
+    positive[:] = rfft(cutvoltage,axis=-1)
+    for idx in np.ndindex(lead_shape) :
+        band = np.flatnonzero((freq > freq_low[idx]) * (freq < freq_high[idx]))
+        # the rejection band is negligible more than a few widths away from the carrier
+        near = np.flatnonzero(np.abs(np.abs(tail_freq)-cen[idx])<3*NOTCH_WIDTH)
+        rejection = carrier_rejection_band(tail_freq[near],cen[idx])
+        rejected = near[rejection>np.finfo(np.float64).eps]
+        rejection = rejection[rejection>np.finfo(np.float64).eps]
+        if band.shape[0]>0 and rejected.shape[0]>0 :
+            # the data are real, so the negative frequency bins are conjugates of positive ones
+            folded = np.where(rejected<=ntail//2,rejected,ntail-rejected)
+            tail_spectrum = tail_spectra[idx+(folded,)]
+            tail_spectrum = np.where(rejected<=ntail//2,tail_spectrum,np.conj(tail_spectrum))
+            coeffs = tail_spectrum*rejection/ntail
+            # sum over the ntail points of exp(2 pi i j (k/ntail - q/numpts)) for each rejected bin k and
+            # band bin q, with the phases calculated from integers to keep them exact
+            dphase = (rejected[:,np.newaxis]*numpts-band[np.newaxis,:]*ntail)%(ntail*numpts)
+            denominator = 1-np.exp(2j*np.pi*dphase/(ntail*numpts))
+            numerator = 1-np.exp(2j*np.pi*(dphase%numpts)/numpts)
+            aligned = dphase==0
+            series = np.where(aligned,ntail,numerator/np.where(aligned,1,denominator))
+            delay = np.exp(-2j*np.pi*((fixt*band)%numpts)/numpts)
+            positive[idx+(band,)]-= delay*(coeffs @ series)
+        mask = np.zeros(positive.shape[-1],dtype=bool)
+        mask[band] = True
+        positive[idx]*= mask
+    return ifft(spectrum,axis=-1,overwrite_x=True)
+
+def carrier_rejection_band(freq,cen) :
+    """
+    Return the rejection band of the sixth order Gaussian notch with a 10 MHz width around +/- cen
+    (the notch filter itself is one minus this)
+    """
+    wid = NOTCH_WIDTH
+    order = 6       # order number,6
+    return np.exp(-(freq - cen)**order / wid**order) + np.exp(-(freq + cen)**order / wid**order)
+
+def calculate_phase_derivative(voltagefilt,sample_rate,use_lfilter=False,carrier_freq=None) :
+    """
+    Return the smoothed derivative of the unwrapped phase of a complex signal in Hz
+
+    use_lfilter = if True, the smoothed differentiation filter is applied as a FIR filter with
+                  signal.lfilter instead of with running sums (slower, but kept for validation)
+    carrier_freq = the frequency of a carrier that was mixed out of the signal. Its phase is added back before
+                   differentiating, so the derivative (including its start-up transient) is in the original frame.
+    """
+    # the unwrapped phase grows by thousands of radians over the window, so it's always kept in double
+    # precision (even for single precision signals) to resolve the small changes the derivative needs
+    phas = np.unwrap(np.angle(voltagefilt).astype(np.float64,copy=False),axis=-1)
+    if carrier_freq is not None :
+        carrier_freq = np.asarray(carrier_freq,dtype=np.float64)[...,np.newaxis]
+        phas = phas+2*np.pi*carrier_freq*(np.arange(phas.shape[-1])/sample_rate)
+    stencil = sample_rate/1e9*3    # samplerate/1e9 = 80 means 80 sample per ns; 5 ns stencil
+    if use_lfilter :
+        b = -smooth_diff(math.floor(stencil))
+        b = b.reshape(b.shape[1])
+        a = 1
+        return signal.lfilter(b,a,phas,axis=-1)*sample_rate/2/np.pi    # 40*ns is smoother than 10*ns
+    return apply_smooth_diff(phas,math.floor(stencil))*sample_rate/2/np.pi
+
+def calculate_velocity(phasD2,cen) :
+    """
+    Return the velocity in m/s given the frequency of the signal and the carrier frequency
+    """
+    return (1550/2)*((phasD2/1e9)-np.asarray(cen)[...,np.newaxis]/1e9)
+
+def apply_smooth_diff(x,n) :
+    """
+    Return the same result as signal.lfilter(-smooth_diff(n),1,x,axis=-1) in O(len(x)) time regardless of n.
+
+    The smooth_diff kernel is a pair of constant boxcars of length m with opposite signs (separated by
+    a zero for odd n), so filtering with it is the running sum over m points of the difference between
+    x and x delayed by the length of the first boxcar (plus the zero), scaled by a constant. Taking the
+    difference first keeps the running sums small so that no precision is lost from the phase offset.
+    """
+    if not (n>=2 and math.floor(n)==math.ceil(n)) :
+        raise TypeError('The input parameter (n) should be a positive integer larger no less than 2.')
+    if n%2==1 :    #is odd
+        m = (n-1)//2
+        lag = m+1
+        scale = 1/m/(m+1)
+    else :    #is even
+        m = n//2
+        lag = m
+        scale = 1/m**2
+    # difference between x and x delayed by lag (with zeros before the start, like lfilter)
+    d = np.array(x,dtype=np.result_type(x,np.float64))
+    if lag<d.shape[-1] :
+        d[...,lag:]-= x[...,:-lag]
+    # running sum of the difference over m points
+    y = np.cumsum(d,axis=-1)
+    if m<y.shape[-1] :
+        y[...,m:]-= y[...,:-m].copy()
+    y*= scale
+    return y
+
+# smooth differentiation from matlab file exchange
+def smooth_diff(n):
+    '''
+    % A smoothed differentiation filter (digital differentiator). 
+    %
+    % Such a filter has the following advantages:
+    % 
+    % First, the filter involves both the smoothing operation and differentation operation. 
+    % It can be regarded as a low-pass differention filter (digital differentiator). 
+    % It is well known that the common differentiation operation amplifies the high-frequency noises.
+    % Therefore, the smoothded differentiation filter would be valuable in experimental (noisy) data processing. 
+    % 
+    % Secondly, the filter coefficients are all convenient integers (simple units) except for an integer scaling factor,
+    % as may be especially significant in some applications such as those in some single-chip microcomputers
+    % or digital signal processors. 
+    % 
+    % Usage:
+    % h=smooth_diff(n)
+    % n: filter length (positive integer larger no less than 2)
+    % h: filter coefficients (anti-symmetry)
+    %
+    % Examples:
+    % smooth_demo
+    %
+    % Author:
+    % Jianwen Luo <luojw@bme.tsinghua.edu.cn, luojw@ieee.org> 2004-11-02
+    % Department of Biomedical Engineering, Department of Electrical Engineering
+    % Tsinghua University, Beijing 100084, P. R. China  
+    % 
+    % References:
+    % Usui, S.; Amidror, I., 
+    % Digital Low-Pass Differentiation for Biological Signal-Processing. 
+    % IEEE Transactions on Biomedical Engineering 1982, 29, (10), 686-693.
+    % Luo, J. W.; Bai, J.; He, P.; Ying, K., 
+    % Axial strain calculation using a low-pass digital differentiator in ultrasound elastography. 
+    % IEEE Transactions on Ultrasonics Ferroelectrics and Frequency Control 2004, 51, (9), 1119-1127.
+    '''
+    if n>=2 and math.floor(n)==math.ceil(n):
+        if n%2==1:    #is odd
+            m=int(np.fix((n-1)/2))
+            h=np.hstack((-np.ones((1,m)),np.array(0).reshape(1,1),np.ones((1,m))))/m/(m+1)
+            return h
+        else:    #is even
+            m=int(np.fix(n/2))
+            h=np.hstack((-np.ones((1,m)),np.ones((1,m))))/m**2
+            return h
+    else:    
+        raise TypeError('The input parameter (n) should be a positive integer larger no less than 2.')
@@ -0,0 +1,238 @@
+#imports
+import json, struct, time, zlib, pathlib
+from argparse import ArgumentParser
+from .config import LECROY_CONST
+try :
+    import zstandard
+except ImportError :
+    zstandard = None
+try :
+    import lz4.frame
+except ImportError :
+    lz4 = None
+
+# Compressing data skimmed from Lecroy files before they're uploaded and decompressing them as they're downloaded
+
+#bytes at the beginning of compressed data
+COMPRESSED_MAGIC = b'\x89LCYZIP\n'
+#version of the compressed data format
+COMPRESSION_VERSION = 1
+#names of the codecs that can be used and their default levels
+COMPRESSION_CODECS = {'zlib':6,'zstd':3,'lz4':0}
+
+def is_compressed_lecroy_data(bytestring) :
+    """
+    Return True if bytestring begins with compressed Lecroy data
+    """
+    return bytes(bytestring[:len(COMPRESSED_MAGIC)])==COMPRESSED_MAGIC
+
+def check_codec(codec) :
+    """
+    Raise an error if the codec isn't recognized, or if the package needed to use it isn't installed
+    """
+    if codec not in COMPRESSION_CODECS :
+        errmsg = f'ERROR: compression codec "{codec}" is not recognized! '
+        errmsg+= f'Options are: {", ".join(COMPRESSION_CODECS.keys())}'
+        raise ValueError(errmsg)
+    if (codec=='zstd' and zstandard is None) or (codec=='lz4' and lz4 is None) :
+        errmsg = f'ERROR: compressing with {codec} requires the {"zstandard" if codec=="zstd" else "lz4"} package! '
+        errmsg+= 'Install it with "pip install openmsipython[compression]".'
+        raise ImportError(errmsg)
+
+def compress_lecroy_data(bytestring,codec,level=None) :
+    """
+    Return bytestring compressed with the given codec and level (the codec's default level if None).
+    The result begins with COMPRESSED_MAGIC, then the length of a JSON metadata block (with the codec, level,
+    and uncompressed size) as a little-endian unsigned 32 bit integer, then the metadata, then one compressed stream.
+    """
+    check_codec(codec)
+    if level is None :
+        level = COMPRESSION_CODECS[codec]
+    if codec=='zlib' :
+        compressed = zlib.compress(bytestring,level)
+    elif codec=='zstd' :
+        compressed = zstandard.ZstdCompressor(level=level).compress(bytestring)
+    else :
+        compressed = lz4.frame.compress(bytestring,compression_level=level)
+    metadata = json.dumps({'version':COMPRESSION_VERSION,
+                           'codec':codec,
+                           'level':level,
+                           'uncompressed_size':len(bytestring),
+                          }).encode()
+    return COMPRESSED_MAGIC+struct.pack('<I',len(metadata))+metadata+compressed
+
+def decompress_lecroy_data(bytestring) :
+    """
+    Return the uncompressed contents of compressed Lecroy data
+    """
+    decompressor = StreamingDecompressor()
+    decompressor.feed(bytestring)
+    return decompressor.get_decompressed()
+
+class StreamingDecompressor :
+    """
+    Decompresses compressed Lecroy data fed to it in consecutive pieces (like file chunks as they arrive)
+    """
+
+    @property
+    def metadata(self) :
+        return self.__metadata # the metadata of the compressed data (None until enough has been fed to read it)
+    @property
+    def n_bytes_fed(self) :
+        return self.__n_bytes_fed
+
+    def __init__(self,keep_decompressed=True) :
+        """
+        keep_decompressed = set False to only return each piece of the decompressed data from feed (and the last
+                            piece from finish) instead of also holding on to them for get_decompressed
+        """
+        self.__keep_decompressed = keep_decompressed
+        self.__header_buffer = b''
+        self.__metadata = None
+        self.__decompressor = None
+        self.__decompressed = []
+        self.__n_bytes_fed = 0
+        self.__n_bytes_decompressed = 0
+        self.__finished = False
+
+    def feed(self,data) :
+        """
+        Decompress the next piece of the compressed data and return the data decompressed from it
+        """
+        self.__n_bytes_fed+=len(data)
+        if self.__metadata is None :
+            # the magic bytes and metadata have to be read before anything can be decompressed
+            self.__header_buffer+=bytes(data)
+            data = self.__read_header()
+            if data is None :
+                return b''
+        if len(data)==0 :
+            return b''
+        return self.__add_decompressed(self.__decompressor.decompress(data))
+
+    def finish(self) :
+        """
+        Return the last of the decompressed data (which must all have been fed),
+        and check that the total size of the decompressed data is what was expected
+        """
+        if self.__metadata is None :
+            raise ValueError('ERROR: the header of the compressed Lecroy data was never completely fed!')
+        if self.__finished :
+            return b''
+        self.__finished = True
+        decompressed = b''
+        if self.__metadata['codec']=='zlib' :
+            decompressed = self.__add_decompressed(self.__decompressor.flush())
+        if self.__n_bytes_decompressed!=self.__metadata['uncompressed_size'] :
+            errmsg = f'ERROR: decompressed {self.__n_bytes_decompressed} bytes of Lecroy data but expected '
+            errmsg+= f'{self.__metadata["uncompressed_size"]}!'
+            raise ValueError(errmsg)
+        return decompressed
+
+    def get_decompressed(self) :
+        """
+        Return the decompressed data (which must all have been fed)
+        """
+        if not self.__keep_decompressed :
+            raise ValueError('ERROR: this StreamingDecompressor does not keep the data it decompresses!')
+        self.finish()
+        decompressed = b''.join(self.__decompressed)
+        self.__decompressed = [decompressed]
+        return decompressed
+
+    def __add_decompressed(self,decompressed) :
+        """
+        Count (and keep, if they're being kept) a piece of the decompressed data, and return it
+        """
+        self.__n_bytes_decompressed+=len(decompressed)
+        if self.__keep_decompressed :
+            self.__decompressed.append(decompressed)
+        return decompressed
+
+    def __read_header(self) :
+        """
+        Read the metadata from the beginning of the compressed data, set up decompression, and return the rest
+        of the data fed so far (or None if not enough has been fed yet)
+        """
+        metadata_start = len(COMPRESSED_MAGIC)+4
+        if len(self.__header_buffer)<metadata_start :
+            return None
+        if not is_compressed_lecroy_data(self.__header_buffer) :
+            raise ValueError('ERROR: data fed to a StreamingDecompressor are not compressed Lecroy data!')
+        metadata_length = struct.unpack_from('<I',self.__header_buffer,len(COMPRESSED_MAGIC))[0]
+        if len(self.__header_buffer)<metadata_start+metadata_length :
+            return None
+        metadata = json.loads(self.__header_buffer[metadata_start:metadata_start+metadata_length])
+        if metadata['version']>COMPRESSION_VERSION :
+            errmsg = f'ERROR: compressed Lecroy data have version {metadata["version"]}, but only versions up to '
+            errmsg+= f'{COMPRESSION_VERSION} can be decompressed!'
+            raise ValueError(errmsg)
+        check_codec(metadata['codec'])
+        if metadata['codec']=='zlib' :
+            self.__decompressor = zlib.decompressobj()
+        elif metadata['codec']=='zstd' :
+            self.__decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else :
+            self.__decompressor = lz4.frame.LZ4FrameDecompressor()
+        self.__metadata = metadata
+        rest = self.__header_buffer[metadata_start+metadata_length:]
+        self.__header_buffer = b''
+        return rest
+
+def benchmark_skim_payloads(filepath,header_rows=LECROY_CONST.HEADER_ROWS,rows_to_skip=LECROY_CONST.ROWS_TO_SKIP,
+                            rows_to_select=LECROY_CONST.ROWS_TO_SELECT,codecs=None) :
+    """
+    Return a list of dictionaries with the size of the data skimmed from a Lecroy file and the time taken to
+    compress them and to decompress and parse them back into time and voltage arrays, for raw and encoded data,
+    uncompressed and compressed with each available codec
+    """
+    from .lecroy_data_file import UploadLecroyDataFile, DownloadLecroyDataFile
+    from .skim_encoding import EncodedLecroyData
+    filepath = pathlib.Path(filepath)
+    if codecs is None :
+        codecs = [codec for codec in COMPRESSION_CODECS if codec=='zlib' or
+                  (codec=='zstd' and zstandard is not None) or (codec=='lz4' and lz4 is not None)]
+    upload_file = UploadLecroyDataFile(filepath,header_rows=header_rows,rows_to_skip=rows_to_skip,
+                                       rows_to_select=rows_to_select)
+    raw = b''
+    with open(filepath,'rb') as fp :
+        for start,stop in upload_file.select_bytes :
+            fp.seek(start)
+            raw+=fp.read(stop-start)
+    payloads = {'raw':raw,
+                'encoded':EncodedLecroyData.from_lecroy_file(filepath,header_rows,rows_to_skip,
+                                                             rows_to_select).to_bytes()}
+    results = []
+    for payload_name,payload in payloads.items() :
+        for codec in [None,*codecs] :
+            start_time = time.perf_counter()
+            data = payload if codec is None else compress_lecroy_data(payload,codec)
+            compress_time = time.perf_counter()-start_time
+            start_time = time.perf_counter()
+            download_file = DownloadLecroyDataFile(filepath,header_rows=header_rows,logger_file=filepath.parent)
+            download_file.bytestring = data if codec is None else decompress_lecroy_data(data)
+            download_file.get_time_and_voltage()
+            decode_time = time.perf_counter()-start_time
+            results.append({'payload':payload_name,'codec':codec if codec is not None else 'none',
+                            'size':len(data),'ratio':len(raw)/len(data),
+                            'compress_time':compress_time,'decode_time':decode_time})
+    return results
+
+#################### MAIN METHOD TO RUN FROM COMMAND LINE ####################
+
+def main(args=None) :
+    parser = ArgumentParser(description='Benchmark compressing the data skimmed from a Lecroy file')
+    parser.add_argument('file',type=pathlib.Path,help='Path to the raw Lecroy file to skim')
+    parser.add_argument('--header_rows',type=int,default=LECROY_CONST.HEADER_ROWS)
+    parser.add_argument('--rows_to_skip',type=int,default=LECROY_CONST.ROWS_TO_SKIP)
+    parser.add_argument('--rows_to_select',type=int,default=LECROY_CONST.ROWS_TO_SELECT)
+    parser.add_argument('--codecs',nargs='*',choices=list(COMPRESSION_CODECS.keys()),default=None)
+    args = parser.parse_args(args=args)
+    results = benchmark_skim_payloads(args.file,args.header_rows,args.rows_to_skip,args.rows_to_select,args.codecs)
+    print(f'{"Payload":<10}{"Codec":<8}{"Size [bytes]":>14}{"Ratio":>8}{"Compress [ms]":>15}{"Decode [ms]":>13}')
+    for result in results :
+        print(f'{result["payload"]:<10}{result["codec"]:<8}{result["size"]:>14}{result["ratio"]:>8.2f}'
+              f'{1000*result["compress_time"]:>15.2f}{1000*result["decode_time"]:>13.2f}')
+
+if __name__=='__main__' :
+    main()
@@ -0,0 +1,217 @@
+#imports
+import json, struct
+from io import BytesIO
+import numpy as np
+from .config import LECROY_CONST
+from .lecroy_csv_reader import LineOffsetIndex, map_file, parse_csv_rows
+from .lecroy_trc_file import is_trc_file, LecroyWaveform
+
+# A compact binary encoding of the rows skimmed from a Lecroy file, to upload instead of the raw rows
+
+#bytes at the beginning of encoded data
+ENCODED_MAGIC = b'\x89LCYSKIM\n'
+#version of the encoding (version 2 added multiple windows of rows)
+ENCODING_VERSION = 2
+#dtype of the samples packed from CSV files
+CSV_SAMPLE_DTYPE = np.dtype('<f4')
+#largest deviation of a CSV file's times from uniform spacing, relative to the sampling interval
+#(times are written with only a few significant figures, so they're only approximately uniform)
+MAX_TIME_DEVIATION = 1.
+#last header line for CSV files reconstructed from data encoded from binary waveform files, and the line the
+#lines before it are padded with (so reconstructed files have as many header lines as CSV files do)
+RECONSTRUCTED_CSV_HEADER = b'Time,Ampl\r\n'
+RECONSTRUCTED_CSV_HEADER_PADDING = b'#\r\n'
+
+def is_encoded_lecroy_data(bytestring) :
+    """
+    Return True if bytestring holds encoded Lecroy data (rather than the raw contents of a skimmed file)
+    """
+    return bytes(bytestring[:len(ENCODED_MAGIC)])==ENCODED_MAGIC
+
+def get_reconstructed_csv_header(header_rows) :
+    """
+    Return the header lines for a CSV file with header_rows lines of header reconstructed from a binary waveform
+    file (padding lines followed by the column names)
+    """
+    if header_rows<1 :
+        return b''
+    return RECONSTRUCTED_CSV_HEADER_PADDING*(header_rows-1)+RECONSTRUCTED_CSV_HEADER
+
+class EncodedLecroyData :
+    """
+    The time and voltage of rows selected from a Lecroy CSV or binary waveform file, with uniformly spaced times
+    (kept as the time of the first sample and the sampling interval) and voltages packed as the raw 8/16 bit
+    integers from binary waveform files or as single precision floats from CSV files. The rows can come from
+    several windows in the original file; the row each window begins at is kept so its times can be recovered.
+    """
+
+    @property
+    def t0(self) :
+        return self.__metadata['t0'] # the time of the first sample
+    @property
+    def dt(self) :
+        return self.__metadata['dt'] # the sampling interval
+    @property
+    def gain(self) :
+        return self.__metadata['gain'] # voltages are the samples times gain minus offset
+    @property
+    def offset(self) :
+        return self.__metadata['offset']
+    @property
+    def first_row(self) :
+        return self.__metadata['first_row'] # the row of the original file with the first sample (like rows_to_skip)
+    @property
+    def n_rows(self) :
+        return self.__samples.shape[0]
+    @property
+    def windows(self) :
+        return [tuple(window) for window in self.__metadata['windows']] # (first row, number of rows) of each window
+    @property
+    def header(self) :
+        return self.__metadata['header'].encode('latin-1') # the header lines of the original (CSV) file
+    @property
+    def samples(self) :
+        return self.__samples
+    @property
+    def metadata(self) :
+        return dict(self.__metadata)
+
+    def __init__(self,samples,t0,dt,gain=1.,offset=0.,first_row=0,header=b'',windows=None) :
+        """
+        samples = the packed voltage samples
+        t0 = the time of the first sample
+        dt = the sampling interval
+        gain, offset = the voltages are samples*gain-offset
+        first_row = the row of the original file holding the first sample (numbered the same way as rows_to_skip)
+        header = the header lines of the original file (for reconstructing it as a CSV file)
+        windows = a list of (first row, number of rows) tuples for each window of consecutive rows in samples
+                  (default is one window of every sample beginning at first_row)
+        """
+        self.__samples = np.asarray(samples)
+        if windows is None :
+            windows = [(first_row,self.__samples.shape[0])]
+        if sum(n_rows for _,n_rows in windows)!=self.__samples.shape[0] :
+            errmsg = f'ERROR: windows {windows} do not hold the {self.__samples.shape[0]} samples of encoded data!'
+            raise ValueError(errmsg)
+        self.__metadata = {'version':ENCODING_VERSION,
+                           'sample_dtype':self.__samples.dtype.str,
+                           't0':float(t0),
+                           'dt':float(dt),
+                           'gain':float(gain),
+                           'offset':float(offset),
+                           'first_row':int(windows[0][0]) if len(windows)>0 else int(first_row),
+                           'n_rows':int(self.__samples.shape[0]),
+                           'windows':[[int(window_first_row),int(n_rows)] for window_first_row,n_rows in windows],
+                           'header':bytes(header).decode('latin-1'),
+                          }
+
+    @classmethod
+    def from_lecroy_file(cls,filepath,header_rows=LECROY_CONST.HEADER_ROWS,
+                         rows_to_skip=LECROY_CONST.ROWS_TO_SKIP,rows_to_select=LECROY_CONST.ROWS_TO_SELECT,
+                         row_windows=None) :
+        """
+        Return the encoded data for the rows of a raw Lecroy file that UploadLecroyDataFile would select
+
+        row_windows = a list of (rows_to_skip, rows_to_select) tuples for several windows of rows to select
+                      (used instead of rows_to_skip and rows_to_select if it's given)
+        """
+        if row_windows is None :
+            row_windows = [(rows_to_skip,rows_to_select)]
+        if is_trc_file(filepath) :
+            waveform = LecroyWaveform.from_file(filepath)
+            samples = []
+            windows = []
+            for window_rows_to_skip,window_rows_to_select in row_windows :
+                first_sample = min(max(window_rows_to_skip-header_rows,0),waveform.n_points)
+                samples.append(waveform.raw[first_sample:first_sample+window_rows_to_select])
+                windows.append((first_sample+header_rows,samples[-1].shape[0]))
+            return cls(np.concatenate(samples),
+                       waveform.horizontal_offset+(windows[0][0]-header_rows)*waveform.sample_interval,
+                       waveform.sample_interval,waveform.vertical_gain,waveform.vertical_offset,
+                       header=get_reconstructed_csv_header(header_rows),windows=windows)
+        data = []
+        windows = []
+        with map_file(filepath) as mapped :
+            index = LineOffsetIndex.for_file(filepath,mapped)
+            header = bytes(mapped[:index.get_line_offset(mapped,header_rows)])
+            for window_rows_to_skip,window_rows_to_select in row_windows :
+                first_row = max(window_rows_to_skip,header_rows)
+                data.append(parse_csv_rows(mapped[index.get_line_offset(mapped,first_row):
+                                                  index.get_line_offset(mapped,first_row+window_rows_to_select)],2))
+                windows.append((first_row,data[-1].shape[0]))
+        data = np.concatenate(data)
+        # fit the times to a line to average away the rounding of the few significant figures they're written with
+        time = data[:,0]
+        rows = np.concatenate([np.arange(first_row,first_row+n_rows) for first_row,n_rows in windows])
+        t0 = time[0] if time.shape[0]>0 else 0.
+        dt = 0.
+        if time.shape[0]>1 :
+            dt, t0 = np.polyfit(rows-rows[0],time,1)
+            max_deviation = np.max(np.abs(time-(t0+(rows-rows[0])*dt)))
+            if max_deviation>MAX_TIME_DEVIATION*abs(dt) :
+                errmsg = f'ERROR: the times in {filepath} are not uniformly spaced (they differ from uniform '
+                errmsg+= f'spacing by up to {max_deviation/abs(dt):.3g} samples), so they can\'t be encoded!'
+                raise ValueError(errmsg)
+        return cls(data[:,1].astype(CSV_SAMPLE_DTYPE),t0,dt,header=header,windows=windows)
+
+    @classmethod
+    def from_bytes(cls,bytestring) :
+        """
+        Return the encoded data in a bytestring created by to_bytes
+        """
+        if not is_encoded_lecroy_data(bytestring) :
+            raise ValueError('ERROR: bytestring does not hold encoded Lecroy data!')
+        metadata_start = len(ENCODED_MAGIC)+4
+        metadata_length = struct.unpack_from('<I',bytestring,len(ENCODED_MAGIC))[0]
+        metadata = json.loads(bytes(bytestring[metadata_start:metadata_start+metadata_length]))
+        if metadata['version']>ENCODING_VERSION :
+            errmsg = f'ERROR: encoded Lecroy data have version {metadata["version"]}, but only versions up to '
+            errmsg+= f'{ENCODING_VERSION} can be decoded!'
+            raise ValueError(errmsg)
+        samples = np.frombuffer(bytestring,dtype=np.dtype(metadata['sample_dtype']),count=metadata['n_rows'],
+                                offset=metadata_start+metadata_length)
+        return cls(samples,metadata['t0'],metadata['dt'],metadata['gain'],metadata['offset'],
+                   metadata['first_row'],metadata['header'].encode('latin-1'),metadata.get('windows'))
+
+    def to_bytes(self) :
+        """
+        Return the encoded data as a bytestring: ENCODED_MAGIC (which can't begin a Lecroy CSV or binary waveform
+        file), then the length of a JSON metadata block as a little-endian unsigned 32 bit integer, then the
+        metadata, then the packed samples
+        """
+        metadata = json.dumps(self.__metadata).encode()
+        return ENCODED_MAGIC+struct.pack('<I',len(metadata))+metadata+self.__samples.tobytes()
+
+    def get_time(self) :
+        """
+        Return the times of the samples
+        """
+        rows = np.concatenate([np.arange(first_row,first_row+n_rows) for first_row,n_rows in self.windows]
+                              +[np.arange(0)])
+        return self.t0+(rows-self.first_row)*self.dt
+
+    def get_voltage(self,dtype=np.float64) :
+        """
+        Return the voltages of the samples as dtype
+        """
+        gain = np.array(self.gain,dtype=dtype)
+        offset = np.array(self.offset,dtype=dtype)
+        return self.__samples.astype(dtype)*gain-offset
+
+    def get_windows(self,dtype=np.float64) :
+        """
+        Return a list of (time, voltage) tuples for each window of rows (with voltages as dtype)
+        """
+        splits = np.cumsum([n_rows for _,n_rows in self.windows])[:-1]
+        return list(zip(np.split(self.get_time(),splits),np.split(self.get_voltage(dtype),splits)))
+
+    def to_csv_bytes(self) :
+        """
+        Return the contents of a Lecroy CSV file (the original header followed by the selected rows)
+        reconstructed from the encoded data
+        """
+        csv_bytes = BytesIO()
+        csv_bytes.write(self.header)
+        np.savetxt(csv_bytes,np.column_stack((self.get_time(),self.get_voltage())),fmt='%.9e',delimiter=',',
+                   newline='\r\n')
+        return csv_bytes.getvalue()
@@ -0,0 +1,103 @@
+#imports
+from threading import Condition
+from concurrent.futures import ThreadPoolExecutor, wait
+from openmsistream.data_file_io.config import RUN_OPT_CONST
+
+# Skimming several new Lecroy files at once instead of one at a time in the thread watching the directory
+
+class SkimmingPool :
+    """
+    A bounded pool of worker threads that skim UploadLecroyDataFiles created with defer_skimming=True.
+    Workers wait to skim another file while too much skimmed data is waiting to be added to an upload queue.
+    """
+
+    @property
+    def n_workers(self) :
+        return self.__n_workers # the maximum number of files being skimmed (and open) at once
+    @property
+    def max_pending_bytes(self) :
+        return self.__max_pending_bytes # the maximum size of the skimmed data that haven't been enqueued yet
+    @property
+    def pending_bytes(self) :
+        with self.__condition :
+            return self.__pending_bytes
+    @property
+    def n_in_progress(self) :
+        with self.__condition :
+            return sum(1 for future in self.__futures.values() if not future.done())
+
+    def __init__(self,n_workers,max_pending_bytes,chunk_size=RUN_OPT_CONST.DEFAULT_CHUNK_SIZE) :
+        """
+        n_workers = the number of worker threads to skim files in
+        max_pending_bytes = the maximum total size of the selected byte ranges of files that have been skimmed
+                            but not completely added to an upload queue (a single file larger than this is
+                            still skimmed when nothing else is pending)
+        chunk_size = the size of the chunks to break the skimmed data into
+        """
+        if n_workers<1 or max_pending_bytes<=0 :
+            errmsg = f'ERROR: n_workers ({n_workers}) and max_pending_bytes ({max_pending_bytes}) must be positive!'
+            raise ValueError(errmsg)
+        self.__n_workers = n_workers
+        self.__max_pending_bytes = max_pending_bytes
+        self.__chunk_size = chunk_size
+        self.__executor = ThreadPoolExecutor(max_workers=n_workers,thread_name_prefix='LecroySkimmer')
+        self.__condition = Condition()
+        self.__pending_bytes = 0
+        self.__held_bytes = {}
+        self.__futures = {}
+
+    def submit(self,datafile) :
+        """
+        Start skimming a file (if it hasn't already been submitted)
+        """
+        with self.__condition :
+            if datafile in self.__futures :
+                return
+            self.__futures[datafile] = self.__executor.submit(self.__skim,datafile)
+
+    def release_enqueued(self) :
+        """
+        Stop counting the data of any skimmed files that have been completely enqueued (or won't be uploaded)
+        against the maximum pending size, and return a list of (datafile, Exception) tuples for any files that
+        failed to be skimmed since the last call
+        """
+        with self.__condition :
+            for datafile in [df for df in self.__held_bytes if df.fully_enqueued or not df.to_upload] :
+                self.__pending_bytes-=self.__held_bytes.pop(datafile)
+            self.__condition.notify_all()
+            failed = []
+            for datafile in [df for df,future in self.__futures.items() if future.done()] :
+                exc = self.__futures.pop(datafile).exception()
+                if exc is not None :
+                    failed.append((datafile,exc))
+        return failed
+
+    def wait_for_all(self) :
+        """
+        Lift the limit on the pending size (so that no worker waits for files to be enqueued)
+        and wait for every file that's been submitted to be skimmed
+        """
+        with self.__condition :
+            self.__max_pending_bytes = float('inf')
+            self.__condition.notify_all()
+            futures = list(self.__futures.values())
+        wait(futures)
+
+    def shutdown(self) :
+        """
+        Wait for every submitted file to be skimmed and stop the worker threads
+        """
+        self.wait_for_all()
+        self.__executor.shutdown(wait=True)
+
+    def __skim(self,datafile) :
+        """
+        Skim a file in a worker thread, first waiting for room under the maximum pending size
+        """
+        n_bytes = sum(stop-start for start,stop in datafile.select_bytes)
+        with self.__condition :
+            self.__condition.wait_for(lambda : self.__pending_bytes==0 or
+                                               self.__pending_bytes+n_bytes<=self.__max_pending_bytes)
+            self.__pending_bytes+=n_bytes
+            self.__held_bytes[datafile] = n_bytes
+        datafile.skim(self.__chunk_size)
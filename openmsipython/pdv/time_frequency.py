@@ -0,0 +1,184 @@
+#imports
+from scipy import signal
+from scipy.fft import rfft
+import numpy as np
+from .pdv_signal_processing import calculate_spectrogram
+
+# Spectrograms of only the band of frequencies the PDV beat signal occupies, and other alternatives to full STFTs
+
+#names of the different ways spectrograms can be calculated
+SPECTROGRAM_METHODS = ('stft','zoom','sliding')
+
+def pad_for_stft_segments(voltage,nperseg,nstep) :
+    """
+    Return voltage zero-padded at the end to fit an integer number of segments, like signal.stft does
+    """
+    voltage = np.asarray(voltage)
+    nadd = (-(voltage.shape[-1]-nperseg) % nstep) % nperseg
+    if nadd>0 :
+        voltage = np.concatenate((voltage,np.zeros(voltage.shape[:-1]+(nadd,),dtype=voltage.dtype)),axis=-1)
+    return voltage
+
+def get_band_frequencies(stft_kwargs,freq_min,freq_max) :
+    """
+    Return the indices and frequencies of the bins of the full short time fourier transform
+    between freq_min and freq_max
+    """
+    nfft = stft_kwargs.get('nfft') or stft_kwargs['nperseg']
+    # (calculated the same way as signal.stft's frequencies so that they compare equal)
+    f = np.fft.rfftfreq(nfft,1/stft_kwargs['fs'])
+    bins = np.flatnonzero((f>=freq_min)*(f<=freq_max))
+    if bins.shape[0]<1 :
+        raise ValueError(f'ERROR: there are no spectrogram frequencies between {freq_min} and {freq_max} Hz!')
+    return bins, f[bins]
+
+def find_peak_band(voltage,stft_kwargs,margin_bins=2) :
+    """
+    Return the lowest and highest frequencies around where the power of voltage peaks in every segment of its
+    short time fourier transform. The band is found from a coarse spectrogram with no zero-padding, and widened
+    by margin_bins of that coarse spectrogram on either side so that it contains the peak of every segment in
+    the full (zero-padded) spectrogram too (as long as each of those is in the same main lobe as its coarse peak).
+    """
+    fs = stft_kwargs['fs']
+    nperseg = stft_kwargs['nperseg']
+    coarse_kwargs = {**stft_kwargs,'nfft':nperseg}
+    f,_,Zxx = signal.stft(voltage,axis=-1,**coarse_kwargs)
+    ridge = f[np.argmax(np.abs(Zxx),axis=-2)]
+    return np.min(ridge)-margin_bins*fs/nperseg, np.max(ridge)+margin_bins*fs/nperseg
+
+def get_stft_segments(voltage,stft_kwargs) :
+    """
+    Return the windowed segments of voltage (with segments along the second-to-last axis) and their center
+    times, split up the same way signal.stft splits them for the given keyword arguments
+    (with boundary=None and the default padding)
+    """
+    nperseg = stft_kwargs['nperseg']
+    nstep = int(nperseg-stft_kwargs['noverlap'])
+    voltage = pad_for_stft_segments(voltage,nperseg,nstep)
+    segments = np.lib.stride_tricks.sliding_window_view(voltage,nperseg,axis=-1)[...,::nstep,:]
+    window = signal.get_window(stft_kwargs.get('window','hann'),nperseg)
+    # the STFT's "spectrum" scaling divides by the sum of the window
+    segments = segments*(window/window.sum())
+    t = (nperseg/2+nstep*np.arange(segments.shape[-2]))/stft_kwargs['fs']
+    return segments, t
+
+def calculate_spectrogram_in_blocks(voltage,stft_kwargs,segments_per_block=64) :
+    """
+    Return the same frequencies, times, and power (in dB) as calculate_spectrogram, but transforming the
+    segments a block at a time and keeping the precision of the voltage, so that the full complex transform
+    (and the copies signal.stft makes along the way) never have to be held in memory at once
+    """
+    fs = stft_kwargs['fs']
+    nperseg = stft_kwargs['nperseg']
+    nfft = stft_kwargs.get('nfft') or nperseg
+    nstep = int(nperseg-stft_kwargs['noverlap'])
+    voltage = pad_for_stft_segments(voltage,nperseg,nstep)
+    # a view of the segments, so they're only copied (and windowed) one block at a time
+    segments = np.lib.stride_tricks.sliding_window_view(voltage,nperseg,axis=-1)[...,::nstep,:]
+    dtype = np.result_type(voltage.dtype,np.float32)
+    window = signal.get_window(stft_kwargs.get('window','hann'),nperseg)
+    window = (window/window.sum()).astype(dtype)
+    nsegments = segments.shape[-2]
+    f = np.fft.rfftfreq(nfft,1/fs)
+    t = (nperseg/2+nstep*np.arange(nsegments))/fs
+    power = np.empty(voltage.shape[:-1]+(f.shape[0],nsegments),dtype=dtype)
+    for start in range(0,nsegments,segments_per_block) :
+        spectra = rfft(segments[...,start:start+segments_per_block,:]*window,n=nfft,axis=-1)
+        # (single precision transforms of band-limited signals can be exactly zero far outside of the band)
+        with np.errstate(divide='ignore') :
+            power[...,start:start+segments_per_block] = np.swapaxes(20*np.log10(np.abs(spectra)),-1,-2)
+    return f, t, power
+
+def calculate_band_limited_spectrogram(voltage,stft_kwargs,freq_min,freq_max) :
+    """
+    Return the frequencies, times, and power (in dB) of only the rows of the short time fourier transform
+    of voltage between freq_min and freq_max (the same values as those rows of calculate_spectrogram)
+    """
+    fs = stft_kwargs['fs']
+    segments, t = get_stft_segments(voltage,stft_kwargs)
+    _, f = get_band_frequencies(stft_kwargs,freq_min,freq_max)
+    nbins = f.shape[0]
+    if nbins==1 :
+        spectra = segments@np.exp(-2j*np.pi*f[0]*np.arange(segments.shape[-1])/fs)
+        spectra = spectra[...,np.newaxis]
+    else :
+        zoom = signal.ZoomFFT(segments.shape[-1],[f[0],f[-1]],m=nbins,fs=fs,endpoint=True)
+        spectra = zoom(segments,axis=-1)
+    # put frequencies before times like signal.stft does
+    return f, t, 20*np.log10(np.abs(np.swapaxes(spectra,-1,-2)))
+
+def calculate_sliding_dft_spectrogram(voltage,stft_kwargs,freq_min,freq_max) :
+    """
+    Return the frequencies, times, and power (in dB) of only the rows of the short time fourier transform
+    of voltage between freq_min and freq_max, calculated with a sliding DFT instead of a transform of every
+    segment (the same values as those rows of calculate_spectrogram, for the default Hann window).
+
+    A sliding DFT updates the (unwindowed) DFT of each bin as the segment moves along by adding the samples
+    that enter and removing the ones that leave, so each bin costs a constant amount per sample no matter how
+    much the segments overlap. Here the updates are vectorized as sums of the data times each bin's phasor
+    between consecutive segment edges, accumulated so that the DFT of a segment is the difference of the
+    accumulated sums at its ends. Each bin's phasors are the previous bin's times one more step of phase.
+    The Hann window is applied afterward in the frequency domain, as a combination of each bin and the bins
+    one segment-length frequency (nfft/nperseg bins) on either side of it.
+    """
+    window = stft_kwargs.get('window','hann')
+    if window!='hann' :
+        raise ValueError(f'ERROR: sliding DFT spectrograms are only implemented for Hann windows, not "{window}"!')
+    nperseg = stft_kwargs['nperseg']
+    nfft = stft_kwargs.get('nfft') or nperseg
+    nstep = int(nperseg-stft_kwargs['noverlap'])
+    if nfft%nperseg!=0 :
+        raise ValueError(f'ERROR: sliding DFT spectrograms need nfft ({nfft}) to be a multiple of nperseg ({nperseg})!')
+    shift = nfft//nperseg
+    bins, f = get_band_frequencies(stft_kwargs,freq_min,freq_max)
+    voltage = pad_for_stft_segments(voltage,nperseg,nstep)
+    npts = voltage.shape[-1]
+    starts = np.arange(0,npts-nperseg+1,nstep)
+    ends = starts+nperseg
+    t = (nperseg/2+starts)/stft_kwargs['fs']
+    # the sums are accumulated between every segment edge, and the ends of the last segments are the end of the data
+    edges = np.unique(np.concatenate(([0],starts,ends[ends<npts])))
+    start_edges = np.searchsorted(edges,starts)
+    end_edges = np.where(ends<npts,np.searchsorted(edges,ends),edges.shape[0])
+    # the unwindowed DFTs are needed for the band and the bins one segment-length frequency outside of it
+    all_bins = np.arange(bins[0]-shift,bins[-1]+shift+1)
+    # phases from integer products modulo nfft stay exact for long signals
+    phasors = np.exp(-2j*np.pi*np.arange(nfft)/nfft)
+    sample_index = np.arange(npts)
+    phase_step = phasors[sample_index%nfft]
+    data_times_phasors = voltage*phasors[(all_bins[0]*sample_index)%nfft]
+    accumulated = np.zeros(voltage.shape[:-1]+(edges.shape[0]+1,),dtype=np.complex128)
+    dfts = np.empty(voltage.shape[:-1]+(all_bins.shape[0],starts.shape[0]),dtype=np.complex128)
+    for ibin,b in enumerate(all_bins) :
+        np.cumsum(np.add.reduceat(data_times_phasors,edges,axis=-1),axis=-1,out=accumulated[...,1:])
+        # referenced to the start of each segment like the DFT of the segment alone
+        dfts[...,ibin,:] = ((accumulated[...,end_edges]-accumulated[...,start_edges])
+                            *np.conj(phasors[(b*starts)%nfft]))
+        data_times_phasors*= phase_step
+    # apply the Hann window and the STFT's "spectrum" scaling (dividing by the window's sum, nperseg/2)
+    spectra = (0.5*dfts[...,shift:-shift,:]-0.25*dfts[...,:-2*shift,:]-0.25*dfts[...,2*shift:,:])/(nperseg/2)
+    return f, t, 20*np.log10(np.abs(spectra))
+
+def calculate_spectrogram_with_method(voltage,stft_kwargs,method='stft',freq_min=None,freq_max=None,
+                                     low_memory=False) :
+    """
+    Return the frequencies, times, and power (in dB) of the spectrogram of voltage calculated using a given method
+
+    method = "stft" for the full short time fourier transform, or "zoom" or "sliding" to only calculate
+             the rows around the signal (between freq_min and freq_max if they're given, or around the peaks
+             otherwise) using zoom FFTs of each segment or a sliding DFT, respectively
+    freq_min, freq_max = the band that's needed from the spectrogram (only used by band-limited methods)
+    low_memory = if True, full short time fourier transforms are calculated a block of segments at a time
+    """
+    if method=='stft' :
+        if low_memory :
+            return calculate_spectrogram_in_blocks(voltage,stft_kwargs)
+        return calculate_spectrogram(voltage,stft_kwargs)
+    if method not in SPECTROGRAM_METHODS :
+        raise ValueError(f'ERROR: unrecognized spectrogram method "{method}" (options are {SPECTROGRAM_METHODS})')
+    if freq_min is None or freq_max is None :
+        freq_min, freq_max = find_peak_band(voltage,stft_kwargs)
+    if method=='zoom' :
+        return calculate_band_limited_spectrogram(voltage,stft_kwargs,np.min(freq_min),np.max(freq_max))
+    elif method=='sliding' :
+        return calculate_sliding_dft_spectrogram(voltage,stft_kwargs,np.min(freq_min),np.max(freq_max))
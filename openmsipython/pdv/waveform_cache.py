@@ -0,0 +1,150 @@
+#imports
+import os, pathlib, hashlib
+import numpy as np
+from .lecroy_csv_reader import read_lecroy_csv_rows
+from .lecroy_trc_file import is_trc_file, read_lecroy_trc_rows
+
+# An on-disk cache of the time and voltage arrays parsed from Lecroy files
+
+#default maximum total size of a waveform cache, in bytes
+DEFAULT_CACHE_MAX_BYTES = 4*1024**3
+#the names of the arrays in each cache entry
+CACHED_ARRAY_NAMES = ('time','voltage')
+
+def read_waveform(filepath,rows_to_skip,nrows) :
+    """
+    Return the time and voltage of the selected rows in a Lecroy CSV or binary waveform file
+    """
+    if is_trc_file(filepath) :
+        return read_lecroy_trc_rows(filepath,rows_to_skip,nrows)
+    return read_lecroy_csv_rows(filepath,rows_to_skip,nrows)
+
+class WaveformCache :
+    """
+    A size-bounded, least-recently-used cache of parsed waveforms in a directory. Entries are keyed by the path,
+    size, and modification time of the file they were read from and by which rows were selected, and each one is
+    a pair of .npy files that are memory-mapped when they're read. Several processes can share a cache directory,
+    because entries are written under temporary names and renamed into place.
+    """
+
+    @property
+    def cache_dir(self) :
+        return self.__cache_dir
+    @property
+    def max_bytes(self) :
+        return self.__max_bytes
+    @property
+    def total_bytes(self) :
+        return sum(size for _,_,size in self.__get_entries())
+
+    def __init__(self,cache_dir,max_bytes=DEFAULT_CACHE_MAX_BYTES) :
+        """
+        cache_dir = path to the directory to hold the cached arrays (created if it doesn't exist)
+        max_bytes = the maximum total size of the cached arrays
+        """
+        if max_bytes<=0 :
+            raise ValueError(f'ERROR: the maximum size of a waveform cache must be positive, not {max_bytes}!')
+        self.__cache_dir = pathlib.Path(cache_dir)
+        self.__max_bytes = max_bytes
+        if not self.__cache_dir.is_dir() :
+            self.__cache_dir.mkdir(parents=True,exist_ok=True)
+
+    def read_waveform(self,filepath,rows_to_skip,nrows) :
+        """
+        Return the time and voltage of the selected rows in a file, from the cache if they're there
+        (as read-only memory-mapped arrays), or parsed from the file and added to the cache otherwise
+        """
+        cached = self.get(filepath,rows_to_skip,nrows)
+        if cached is not None :
+            return cached
+        time, voltage = read_waveform(filepath,rows_to_skip,nrows)
+        self.put(filepath,rows_to_skip,nrows,time,voltage)
+        return time, voltage
+
+    def get(self,filepath,rows_to_skip,nrows) :
+        """
+        Return the cached time and voltage arrays for the selected rows in a file, or None if they're not cached
+        """
+        paths = self.__get_entry_paths(self.get_key(filepath,rows_to_skip,nrows))
+        try :
+            arrays = tuple(np.asarray(np.load(paths[name],mmap_mode='r')) for name in CACHED_ARRAY_NAMES)
+            # mark the entry as recently used
+            for path in paths.values() :
+                os.utime(path)
+        except (OSError,ValueError) :
+            return None
+        return arrays
+
+    def put(self,filepath,rows_to_skip,nrows,time,voltage) :
+        """
+        Add the time and voltage arrays for the selected rows in a file to the cache, then remove the least
+        recently used entries until the cache fits in its maximum size
+        """
+        paths = self.__get_entry_paths(self.get_key(filepath,rows_to_skip,nrows))
+        for name,array in zip(CACHED_ARRAY_NAMES,(time,voltage)) :
+            temp_path = paths[name].with_name(paths[name].name+f'.{os.getpid()}.tmp')
+            try :
+                with open(temp_path,'wb') as fp :
+                    np.save(fp,array)
+                os.replace(temp_path,paths[name])
+            except OSError :
+                # the cache is only an optimization, so failing to write to it isn't an error
+                if temp_path.is_file() :
+                    temp_path.unlink()
+                return
+        self.evict()
+
+    def evict(self) :
+        """
+        Remove the least recently used entries until the total size of the cache fits in its maximum size
+        """
+        entries = sorted(self.__get_entries())
+        total_bytes = sum(size for _,_,size in entries)
+        for _,key,size in entries :
+            if total_bytes<=self.__max_bytes :
+                break
+            for path in self.__get_entry_paths(key).values() :
+                try :
+                    path.unlink()
+                except FileNotFoundError :
+                    pass
+            total_bytes-=size
+
+    def clear(self) :
+        """
+        Remove every entry from the cache
+        """
+        for _,key,_ in self.__get_entries() :
+            for path in self.__get_entry_paths(key).values() :
+                try :
+                    path.unlink()
+                except FileNotFoundError :
+                    pass
+
+    @staticmethod
+    def get_key(filepath,rows_to_skip,nrows) :
+        """
+        Return the key of the cache entry for the selected rows in a file as it is right now
+        """
+        filepath = pathlib.Path(filepath).resolve()
+        stat = filepath.stat()
+        key_string = f'{filepath}|{stat.st_size}|{stat.st_mtime_ns}|{rows_to_skip}|{nrows}'
+        return hashlib.sha1(key_string.encode()).hexdigest()
+
+    def __get_entry_paths(self,key) :
+        return {name:self.__cache_dir/f'{key}.{name}.npy' for name in CACHED_ARRAY_NAMES}
+
+    def __get_entries(self) :
+        """
+        Return a list of (last used time, key, total size) tuples for every entry in the cache
+        """
+        entries = {}
+        for path in self.__cache_dir.glob('*.npy') :
+            key = path.name.split('.')[0]
+            try :
+                stat = path.stat()
+            except FileNotFoundError :
+                continue
+            last_used, size = entries.get(key,(0,0))
+            entries[key] = (max(last_used,stat.st_mtime_ns),size+stat.st_size)
+        return [(last_used,key,size) for key,(last_used,size) in entries.items()]
@@ -21,7 +21,10 @@ setupkwargs = dict(
                       'scipy; python_version>="3.8"',
                       'scipy==1.4.1; python_version=="3.7"',
                      ],
-    extras_require = {'test': ['beautifulsoup4',
+    extras_require = {'compression': ['lz4',
+                                      'zstandard',
+                                      ],
+                      'test': ['beautifulsoup4',
                                'gitpython',
                                'lxml',
                                'marko[toc]',
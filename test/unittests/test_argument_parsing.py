@@ -1,10 +1,11 @@
 #imports
 import unittest
 from openmsipython.shared.argument_parsing import OpenMSIPythonArgumentParser
+from openmsipython.pdv.argument_parsing import LecroyArgumentParser
 
 class TestArgumentParsing(unittest.TestCase) :
     """
-    Class for testing functions in shared/argument_parsing.py
+    Class for testing functions in shared/argument_parsing.py and pdv/argument_parsing.py
     """
 
     #test MyArgumentParser by just adding a bunch of arguments
@@ -17,3 +18,15 @@ class TestArgumentParsing(unittest.TestCase) :
         with self.assertRaises(ValueError) :
             parser = OpenMSIPythonArgumentParser()
             parser.add_arguments('never_name_a_command_line_arg_this')
+
+    def test_lecroy_argument_parser(self) :
+        #the arguments for Lecroy files are only in the PDV argument parser
+        self.assertNotIn('row_windows',OpenMSIPythonArgumentParser.ARGUMENTS)
+        parser = LecroyArgumentParser()
+        parser.add_arguments('pdv_plot_type','row_windows','time_windows','n_skim_workers')
+        args = parser.parse_args(args=['--row_windows','100:200','5:10','--time_windows','1e-6:2.5e-6',
+                                       '--n_skim_workers','0'])
+        self.assertEqual(args.pdv_plot_type,'spall')
+        self.assertEqual(args.row_windows,[(100,200),(5,10)])
+        self.assertEqual(args.time_windows,[(1e-6,2.5e-6)])
+        self.assertEqual(args.n_skim_workers,0)
@@ -0,0 +1,61 @@
+#imports
+import unittest, json, shutil
+import numpy as np
+from openmsipython.pdv.edge_analysis import decimate_trace, analyze_lecroy_file
+from config import TEST_CONST
+from test_pdv_analysis import make_analysis, make_pdv_signal, N_SAMPLES
+from test_lecroy_csv_reader import HEADER
+
+#constants
+HEADER_ROWS = 5
+
+class TestEdgeAnalysis(unittest.TestCase) :
+    """
+    Class for testing running PDV analyses before uploading Lecroy files
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_edge_analysis'
+        self.test_dir.mkdir(exist_ok=True)
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    def test_decimate_trace(self) :
+        time = np.arange(10.)
+        velocity = 2*np.arange(10.)
+        dec_time, dec_velocity = decimate_trace(time,velocity,4)
+        self.assertTrue(np.allclose(dec_time,[1.,4.,7.,9.]))
+        self.assertTrue(np.allclose(dec_velocity,2*dec_time))
+        #traces that are already short enough aren't changed
+        dec_time, _ = decimate_trace(time,velocity,20)
+        self.assertTrue(np.array_equal(dec_time,time))
+
+    def test_analyze_lecroy_file(self) :
+        time, voltage = make_pdv_signal('velocity')
+        filepath = self.test_dir/'shot.txt'
+        with open(filepath,'w',newline='') as fp :
+            fp.write(HEADER)
+            np.savetxt(fp,np.column_stack((time,voltage)),delimiter=',',newline='\r\n')
+        results = analyze_lecroy_file('velocity',filepath,HEADER_ROWS,[(HEADER_ROWS,N_SAMPLES)],n_trace_points=500)
+        self.assertEqual(len(results),1)
+        record_name, record, thumbnail_name, thumbnail = results[0]
+        self.assertEqual((record_name,thumbnail_name),('shot_pdv_result.json','shot_pdv_thumbnail.png'))
+        #the record has the same metrics as analyzing the full trace and a decimated copy of the velocity
+        record = json.loads(record)
+        self.assertEqual((record['file'],record['analysis']),('shot.txt','velocity'))
+        expected = make_analysis('velocity').compute()
+        self.assertAlmostEqual(record['metrics']['impact_velocity'],expected.impact_velocity,delta=1.)
+        self.assertAlmostEqual(record['metrics']['center_frequency'],expected.center_frequency,delta=1e6)
+        self.assertLessEqual(len(record['velocity']),500)
+        self.assertEqual(len(record['time']),len(record['velocity']))
+        #the thumbnail is a small PNG, and the whole result is much smaller than the skimmed rows would be
+        self.assertTrue(thumbnail.startswith(b'\x89PNG'))
+        self.assertLess(10*(len(json.dumps(record))+len(thumbnail)),filepath.stat().st_size)
+        #several windows are analyzed separately
+        results = analyze_lecroy_file('velocity',filepath,HEADER_ROWS,[(HEADER_ROWS,N_SAMPLES),
+                                                                        (HEADER_ROWS+10000,N_SAMPLES-10000)])
+        self.assertEqual([result[0] for result in results],['shot_window_1_pdv_result.json',
+                                                             'shot_window_2_pdv_result.json'])
+        with self.assertRaises(ValueError) :
+            analyze_lecroy_file('not_an_analysis',filepath,HEADER_ROWS)
@@ -0,0 +1,39 @@
+#imports
+import unittest
+import numpy as np
+from openmsipython.pdv.event_detection import find_first_run, find_first_true
+
+def find_first_run_loop(mask,run_length,starts) :
+    """
+    The original per-index loop that find_first_run replaces
+    """
+    for idx in starts.nonzero()[0] :
+        if np.sum(mask[idx:idx+run_length]) == run_length :
+            return idx
+    return None
+
+class TestEventDetection(unittest.TestCase) :
+    """
+    Class for testing the vectorized run-finding functions used to detect events
+    """
+
+    def test_find_first_run_matches_loop(self) :
+        rng = np.random.default_rng(0)
+        for _ in range(200) :
+            n = rng.integers(1,300)
+            mask = rng.random(n)<rng.random()
+            starts = rng.random(n)<0.5
+            run_length = int(rng.integers(1,20))
+            self.assertEqual(find_first_run(mask,run_length,starts=starts),
+                             find_first_run_loop(mask,run_length,starts))
+
+    def test_find_first_run_edges(self) :
+        self.assertIsNone(find_first_run(np.ones(3,dtype=bool),4))
+        self.assertEqual(find_first_run(np.array([0,1,1,0,1,1,1],dtype=bool),3),4)
+        self.assertIsNone(find_first_run(np.array([0,0,0,0,1,1],dtype=bool),3))
+        with self.assertRaises(ValueError) :
+            find_first_run(np.ones(3,dtype=bool),0)
+
+    def test_find_first_true(self) :
+        self.assertEqual(find_first_true(np.array([-3.,-1.,2.,5.])>0),2)
+        self.assertIsNone(find_first_true(np.zeros(10)>0))
@@ -0,0 +1,90 @@
+#imports
+import unittest, shutil, logging
+import numpy as np
+from openmsipython.pdv.event_window import find_event_row, find_changed_probe, get_row_windows
+from openmsipython.pdv.lecroy_data_file import UploadLecroyDataFile
+from config import TEST_CONST
+from test_pdv_analysis import make_pdv_signal, CARRIER_FREQ, EVENT_TIME, SAMPLE_RATE
+from test_lecroy_trc_file import write_trc_file, VERTICAL_GAIN, VERTICAL_OFFSET
+
+#constants
+HEADER_ROWS = 5
+EVENT_ROW = HEADER_ROWS+int(EVENT_TIME*SAMPLE_RATE)
+PROBE_STRIDE = 1024
+EARLY_EVENT_OFFSET = 60000
+
+class TestEventWindow(unittest.TestCase) :
+    """
+    Class for testing finding events in raw Lecroy files before they're skimmed
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_event_window'
+        self.test_dir.mkdir(exist_ok=True)
+        time, voltage = make_pdv_signal('velocity')
+        self.csv_path = self.test_dir/'shot.txt'
+        self.write_csv_file(self.csv_path,time,voltage)
+        self.trc_path = self.test_dir/'shot.trc'
+        write_trc_file(self.trc_path,np.round((voltage+VERTICAL_OFFSET)/VERTICAL_GAIN).astype(np.int16))
+        #a file whose event begins early (in the first quarter of the probes)
+        self.early_event_path = self.test_dir/'early_event.txt'
+        self.write_csv_file(self.early_event_path,time[EARLY_EVENT_OFFSET:],voltage[EARLY_EVENT_OFFSET:])
+        self.no_event_path = self.test_dir/'no_event.txt'
+        self.write_csv_file(self.no_event_path,time,np.cos(2*np.pi*CARRIER_FREQ*(time-time[0])))
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    def write_csv_file(self,filepath,time,voltage) :
+        with open(filepath,'w') as fp :
+            fp.write('LECROYWR\nSegments,1\nSegment,TrigTime\n#1,0\nTime,Ampl\n')
+            np.savetxt(fp,np.column_stack((time,voltage)),delimiter=',')
+
+    def test_find_event_row(self) :
+        for filepath in (self.csv_path,self.trc_path) :
+            #the event is found to within a couple of probes
+            event_row = find_event_row(filepath,HEADER_ROWS,probe_stride=PROBE_STRIDE)
+            self.assertLessEqual(abs(event_row-EVENT_ROW),2*PROBE_STRIDE)
+        self.assertIsNone(find_event_row(self.no_event_path,HEADER_ROWS,probe_stride=PROBE_STRIDE))
+        #a single changed probe isn't an event
+        voltages = np.tile(np.sin(np.linspace(0,20*np.pi,256)),(20,1))
+        voltages[12]*=2
+        self.assertIsNone(find_changed_probe(voltages))
+        voltages[12:15]*=2
+        self.assertEqual(find_changed_probe(voltages),12)
+
+    def test_find_early_event_row(self) :
+        #events in the first probes after the beginning of the file are compared to the probes before them
+        event_row = find_event_row(self.early_event_path,HEADER_ROWS,probe_stride=PROBE_STRIDE)
+        self.assertIsNotNone(event_row)
+        #(the velocity ramps up over a few probes, so the first changed probe can be a couple after the event)
+        self.assertGreaterEqual(event_row,EVENT_ROW-EARLY_EVENT_OFFSET-PROBE_STRIDE)
+        self.assertLessEqual(event_row,EVENT_ROW-EARLY_EVENT_OFFSET+3*PROBE_STRIDE)
+        voltages = np.tile(np.sin(np.linspace(0,20*np.pi,256)),(40,1))
+        voltages[2:]*=2
+        self.assertEqual(find_changed_probe(voltages),2)
+        #an event that has already begun in the first probe can't be found
+        self.assertIsNone(find_changed_probe(voltages[2:]))
+        #files without an event found are logged
+        with self.assertLogs(level='WARNING') :
+            logger = logging.getLogger('test_event_window')
+            rows = get_row_windows(self.no_event_path,HEADER_ROWS,rows_to_skip=100,rows_to_select=20000,
+                                   find_event_window=True,logger=logger)
+        self.assertEqual(rows,[(100,20000)])
+
+    def test_upload_selects_rows_around_event(self) :
+        margin = 10000
+        event_row = find_event_row(self.csv_path,HEADER_ROWS)
+        datafile = UploadLecroyDataFile(self.csv_path,header_rows=HEADER_ROWS,rows_to_skip=100,rows_to_select=20000,
+                                        find_event_window=True,event_margin_rows=margin)
+        self.assertEqual(datafile.rows_to_skip,event_row-margin)
+        with open(self.csv_path,'rb') as fp :
+            lines = fp.readlines()
+        (_,n_header_bytes),(start,stop) = datafile.select_bytes
+        self.assertEqual(n_header_bytes,sum(len(line) for line in lines[:HEADER_ROWS]))
+        self.assertEqual(start,sum(len(line) for line in lines[:event_row-margin]))
+        self.assertEqual(stop-start,sum(len(line) for line in lines[event_row-margin:event_row-margin+20000]))
+        #files without an event fall back to the given number of rows to skip
+        datafile = UploadLecroyDataFile(self.no_event_path,header_rows=HEADER_ROWS,rows_to_skip=100,
+                                        rows_to_select=20000,find_event_window=True,event_margin_rows=margin)
+        self.assertEqual(datafile.rows_to_skip,100)
@@ -0,0 +1,84 @@
+#imports
+import unittest, shutil, time, os
+from openmsipython.pdv.file_watcher import InotifyFileWatcher, PollingFileWatcher, get_file_watcher
+from config import TEST_CONST
+
+#constants
+QUIESCENT_SECS = 0.2
+
+def inotify_available() :
+    try :
+        InotifyFileWatcher(TEST_CONST.TEST_DIR_PATH).close()
+    except (OSError,AttributeError) :
+        return False
+    return True
+
+class TestFileWatcher(unittest.TestCase) :
+    """
+    Class for testing finding new files in watched directories once they're done being written
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_file_watcher'
+        self.test_dir.mkdir(exist_ok=True)
+        (self.test_dir/'LOGS').mkdir(exist_ok=True)
+        (self.test_dir/'old_file.txt').write_bytes(b'old')
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    @unittest.skipIf(not inotify_available(),'inotify is not available')
+    def test_inotify_file_watcher(self) :
+        with InotifyFileWatcher(self.test_dir,quiescent_secs=QUIESCENT_SECS,
+                                exclude_dirs=[self.test_dir/'LOGS'],exclude_suffixes=['.lineindex.npz']) as watcher :
+            self.assertEqual(watcher.n_watched_dirs,1)
+            self.check_watcher(watcher)
+            self.assertEqual(watcher.n_watched_dirs,2)
+
+    def test_polling_file_watcher(self) :
+        with PollingFileWatcher(self.test_dir,quiescent_secs=QUIESCENT_SECS,poll_secs=0.05,
+                                exclude_dirs=[self.test_dir/'LOGS'],exclude_suffixes=['.lineindex.npz']) as watcher :
+            #the first scan finds every file that's already there
+            self.assertEqual(self.wait_for_files(watcher),[self.test_dir/'old_file.txt'])
+            self.check_watcher(watcher)
+
+    def test_get_file_watcher(self) :
+        with get_file_watcher(self.test_dir,'polling') as watcher :
+            self.assertIsInstance(watcher,PollingFileWatcher)
+        with get_file_watcher(self.test_dir,'auto') as watcher :
+            self.assertIsInstance(watcher,InotifyFileWatcher if inotify_available() else PollingFileWatcher)
+        with self.assertRaises(ValueError) :
+            _ = get_file_watcher(self.test_dir,'not_a_method')
+
+    def check_watcher(self,watcher) :
+        #a file that's still being written isn't found until it's been left alone for long enough
+        filepath = self.test_dir/'new_file.txt'
+        with open(filepath,'wb') as fp :
+            start = time.monotonic()
+            while time.monotonic()-start<2*QUIESCENT_SECS :
+                fp.write(b'data\n')
+                fp.flush()
+                self.assertEqual(watcher.get_quiescent_files(0.02),[])
+        self.assertEqual(self.wait_for_files(watcher),[filepath])
+        #files moved in and files in new subdirectories are found, but not files in excluded subdirectories
+        #or with excluded suffixes
+        (self.test_dir/'LOGS'/'log.txt').write_bytes(b'log')
+        (self.test_dir/'new_file.txt.lineindex.npz').write_bytes(b'index')
+        (self.test_dir/'outside.tmp').write_bytes(b'moved')
+        os.rename(self.test_dir/'outside.tmp',self.test_dir/'moved_file.txt')
+        (self.test_dir/'subdir').mkdir()
+        (self.test_dir/'subdir'/'sub_file.txt').write_bytes(b'sub')
+        found = self.wait_for_files(watcher,2)
+        self.assertEqual(sorted(found),sorted([self.test_dir/'moved_file.txt',
+                                               self.test_dir/'subdir'/'sub_file.txt']))
+        self.assertEqual(watcher.n_pending,0)
+
+    def wait_for_files(self,watcher,n_files=1,timeout=5.) :
+        found = []
+        start = time.monotonic()
+        while len(found)<n_files and time.monotonic()-start<timeout :
+            found+=watcher.get_quiescent_files(0.05)
+        #give the watcher a bit longer to report anything it shouldn't
+        found+=watcher.get_quiescent_files(2*QUIESCENT_SECS)
+        found+=watcher.get_quiescent_files(2*QUIESCENT_SECS)
+        return [fp for fp in found if fp.name!='outside.tmp']
@@ -0,0 +1,92 @@
+#imports
+import unittest, shutil
+import numpy as np
+from openmsistream.data_file_io.config import DATA_FILE_HANDLING_CONST
+from openmsistream.kafka_wrapper.serialization import DataFileChunkSerializer, DataFileChunkDeserializer
+from openmsipython.pdv.lecroy_csv_reader import IncrementalCSVParser, parse_csv_columns
+from openmsipython.pdv.lecroy_data_file import UploadLecroyDataFile, DownloadLecroyDataFile
+from config import TEST_CONST
+from test_lecroy_csv_reader import write_lecroy_csv
+
+class TestIncrementalParsing(unittest.TestCase) :
+    """
+    Class for testing parsing Lecroy CSV data into time and voltage arrays as their chunks are downloaded
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_incremental_parsing'
+        self.test_dir.mkdir(exist_ok=True)
+        self.csv_path = self.test_dir/'lecroy.txt'
+        write_lecroy_csv(self.csv_path,20000)
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    def test_incremental_csv_parser(self) :
+        contents = self.csv_path.read_bytes()
+        #rows (and the header lines being skipped) split anywhere between pieces are parsed the same
+        for piece_size in (5,1000,65536,len(contents)) :
+            #tiny pieces are slow to feed, so only the beginning of the file is fed in them
+            text = contents[:contents.index(b'\n',10000)+1] if piece_size<1000 else contents
+            expected = parse_csv_columns(text,2,5)
+            for expected_size in (None,len(text),100) :
+                parser = IncrementalCSVParser(2,5,expected_size=expected_size)
+                for start in range(0,len(text),piece_size) :
+                    parser.feed(text[start:start+piece_size])
+                columns = parser.finish()
+                self.assertEqual(parser.n_rows,expected[0].shape[0])
+                for column,expected_column in zip(columns,expected) :
+                    self.assertTrue(np.array_equal(column,expected_column))
+        #a last line without a newline is parsed once everything has been fed
+        parser = IncrementalCSVParser(2,1,dtypes=[np.float64,np.float32])
+        for piece in (b'Time,Ampl\r',b'\n1.5,2',b'\r\n3,',b'4') :
+            parser.feed(piece)
+        time, voltage = parser.finish()
+        self.assertEqual(time.tolist(),[1.5,3.])
+        self.assertEqual(voltage.dtype,np.float32)
+        self.assertEqual(voltage.tolist(),[2.,4.])
+        self.assertEqual([c.shape[0] for c in IncrementalCSVParser(2,1).finish()],[0,0])
+
+    def test_download_parsed_incrementally(self) :
+        kwargs = {'header_rows':5,'rows_to_skip':1000,'rows_to_select':5000}
+        expected = self.download(UploadLecroyDataFile(self.csv_path,**kwargs))
+        self.assertFalse(expected.parsed_incrementally)
+        expected_time, expected_voltage = expected.get_time_and_voltage()
+        for compression in (None,'zlib') :
+            for reverse in (False,True) :
+                upload_file = UploadLecroyDataFile(self.csv_path,compression=compression,**kwargs)
+                download_file = self.download(upload_file,reverse,header_rows=5,parse_incrementally=True,
+                                              voltage_dtype=np.float32)
+                self.assertTrue(download_file.parsed_incrementally)
+                time, voltage = download_file.get_time_and_voltage()
+                self.assertTrue(np.array_equal(time,expected_time))
+                self.assertEqual(voltage.dtype,np.float32)
+                self.assertTrue(np.array_equal(voltage,expected_voltage.astype(np.float32)))
+                self.assertEqual(len(download_file.get_windows()),1)
+                #the text of the file isn't kept
+                with self.assertRaises(ValueError) :
+                    _ = download_file.bytestring
+        #encoded data are still held until they've all arrived
+        for compression in (None,'zlib') :
+            upload_file = UploadLecroyDataFile(self.csv_path,encode_skimmed_data=True,compression=compression,
+                                               **kwargs)
+            download_file = self.download(upload_file,True,header_rows=5,parse_incrementally=True)
+            self.assertFalse(download_file.parsed_incrementally)
+            time, _ = download_file.get_time_and_voltage()
+            #encoded data have the same rows as raw data
+            self.assertTrue(np.allclose(time,expected_time,rtol=0,atol=1e-16))
+
+    def download(self,upload_file,reverse=False,**kwargs) :
+        """
+        Return a DownloadLecroyDataFile reconstructed from the chunks of upload_file
+        """
+        upload_file.add_chunks_to_upload(chunk_size=1024)
+        serializer = DataFileChunkSerializer()
+        deserializer = DataFileChunkDeserializer()
+        chunks = [deserializer(serializer(chunk)) for chunk in upload_file.chunks_to_upload]
+        self.assertGreater(len(chunks),1)
+        download_file = DownloadLecroyDataFile(chunks[0].filepath,logger_file=self.test_dir,**kwargs)
+        for chunk in (reversed(chunks) if reverse else chunks) :
+            code = download_file.add_chunk(chunk)
+        self.assertEqual(code,DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE)
+        return download_file
@@ -0,0 +1,127 @@
+#imports
+import unittest, shutil, os
+import numpy as np, pandas as pd
+from openmsipython.pdv.lecroy_csv_reader import LineOffsetIndex, read_lecroy_csv_rows, get_line_index_sidecar_path
+from openmsipython.pdv.lecroy_csv_reader import parse_csv_columns, benchmark_csv_parsing
+from openmsipython.pdv.lecroy_data_file import UploadLecroyDataFile
+from config import TEST_CONST
+
+#constants
+HEADER = 'LECROYWR,...\r\nSegments,1,SegmentSize,10000\r\nSegment,TrigTime,TimeSinceSegment1\r\n#1,0,0\r\nTime,Ampl\r\n'
+
+def write_lecroy_csv(path,n,voltage=None,seed=0) :
+    """
+    Write a synthetic Lecroy CSV file with n rows of evenly spaced times and random voltages
+    (or the given voltage array) after the five-line header
+    """
+    if voltage is None :
+        voltage = 0.01*np.random.default_rng(seed).standard_normal(n)
+    with open(path,'w',newline='') as fp :
+        fp.write(HEADER)
+        np.savetxt(fp,np.column_stack((np.arange(n)*1.25e-11-2e-8,voltage)),delimiter=',',fmt='%.6e',newline='\r\n')
+
+class TestLecroyCSVReader(unittest.TestCase) :
+    """
+    Class for testing reading selected rows of Lecroy CSV files using line offset indices
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_lecroy_csv_reader'
+        self.test_dir.mkdir(exist_ok=True)
+        self.filepath = self.test_dir/'lecroy.txt'
+        write_lecroy_csv(self.filepath,10000)
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+        #remove the line index cached in the default directory
+        sidecar_path = get_line_index_sidecar_path(self.filepath)
+        if sidecar_path.is_file() :
+            sidecar_path.unlink()
+
+    def test_line_offset_index(self) :
+        contents = self.filepath.read_bytes()
+        line_starts = [0]+[i+1 for i,c in enumerate(contents) if c==ord('\n')][:-1]
+        for stride in (1,7,4096) :
+            index = LineOffsetIndex.from_buffer(contents,stride=stride)
+            self.assertEqual(index.n_lines,len(line_starts))
+            for line in (0,1,stride-1,stride,stride+3,len(line_starts)-1) :
+                self.assertEqual(index.get_line_offset(contents,line),line_starts[line])
+            self.assertEqual(index.get_line_offset(contents,len(line_starts)),len(contents))
+        #a last line without a newline still counts
+        self.assertEqual(LineOffsetIndex.from_buffer(b'a\nb\nc',stride=2).n_lines,3)
+
+    def test_matches_pandas(self) :
+        for rows_to_skip,nrows in ((4,100),(4,None),(5000,4097),(9990,100)) :
+            data = pd.read_csv(self.filepath,skiprows=rows_to_skip,nrows=nrows)
+            time, voltage = read_lecroy_csv_rows(self.filepath,rows_to_skip,nrows)
+            self.assertTrue(np.array_equal(data.iloc[:,0].to_numpy(),time))
+            self.assertTrue(np.array_equal(data.iloc[:,1].to_numpy(),voltage))
+        with self.assertRaises(ValueError) :
+            read_lecroy_csv_rows(self.filepath,0,10)
+
+    def test_sidecar_index(self) :
+        cache_dir = self.test_dir/'line_indices'
+        sidecar_path = get_line_index_sidecar_path(self.filepath,cache_dir)
+        self.assertFalse(sidecar_path.is_file())
+        time, _ = read_lecroy_csv_rows(self.filepath,100,10,cache_dir=cache_dir)
+        self.assertTrue(sidecar_path.is_file())
+        self.assertTrue(np.array_equal(read_lecroy_csv_rows(self.filepath,100,10,cache_dir=cache_dir)[0],time))
+        #nothing is written next to the data file, and files with the same name in different directories
+        #have different sidecar files
+        self.assertEqual([fp.name for fp in self.test_dir.iterdir() if fp.is_file()],[self.filepath.name])
+        self.assertNotEqual(get_line_index_sidecar_path(cache_dir/self.filepath.name,cache_dir),sidecar_path)
+        #a stale index (for a file that has changed since) is rebuilt
+        with open(self.filepath,'ab') as fp :
+            fp.write(b'1.0e-7,0.5\r\n')
+        stat = self.filepath.stat()
+        os.utime(self.filepath,ns=(stat.st_atime_ns,stat.st_mtime_ns+1000))
+        time, voltage = read_lecroy_csv_rows(self.filepath,10004,None,cache_dir=cache_dir)
+        self.assertEqual(time.tolist(),[1.0e-7])
+        self.assertEqual(voltage.tolist(),[0.5])
+
+    def test_upload_select_bytes(self) :
+        with open(self.filepath,'rb') as fp :
+            line_lengths = [len(line) for line in fp.readlines()]
+        for rows_to_skip,rows_to_select in ((5,100),(4000,4097),(9990,100),(20000,10),(2,10)) :
+            datafile = UploadLecroyDataFile(self.filepath,header_rows=5,rows_to_skip=rows_to_skip,
+                                            rows_to_select=rows_to_select)
+            first_row = max(rows_to_skip,5)
+            self.assertEqual(datafile.select_bytes,[(0,sum(line_lengths[:5])),
+                                                    (sum(line_lengths[:first_row]),
+                                                     sum(line_lengths[:first_row+rows_to_select]))])
+        #the file's line index is saved for the next time it's skimmed
+        self.assertTrue(get_line_index_sidecar_path(self.filepath).is_file())
+
+    def test_parse_csv_columns(self) :
+        contents = self.filepath.read_bytes()
+        data = pd.read_csv(self.filepath,skiprows=4)
+        time, voltage = parse_csv_columns(memoryview(contents),2,5)
+        self.assertTrue(np.array_equal(data.iloc[:,0].to_numpy(),time))
+        self.assertTrue(np.array_equal(data.iloc[:,1].to_numpy(),voltage))
+        _, voltage = parse_csv_columns(contents,2,5,dtypes=[np.float64,np.float32])
+        self.assertEqual(voltage.dtype,np.float32)
+        self.assertTrue(np.array_equal(data.iloc[:,1].to_numpy(dtype=np.float32),voltage))
+        #random values written in a random mix of formats with up to eight significant digits (like Lecroy
+        #files have) are within a unit in the last place of what float() gives for each field
+        rng = np.random.default_rng(1)
+        fmts = ('%.6e','%.7E','%.8g','%d','%+.3e','%.0f','%.2g')
+        for n_rows in (1,100,5000) :
+            values = rng.standard_normal((n_rows,2))*10.**rng.integers(-12,12,(n_rows,2))
+            fields = [[fmts[rng.integers(len(fmts))]%value for value in row] for row in values]
+            text = ('Time,Ampl\n'+'\n'.join(','.join(row) for row in fields)+'\n').encode()
+            columns = parse_csv_columns(text,2,1)
+            for icol,column in enumerate(columns) :
+                expected = np.array([float(row[icol]) for row in fields])
+                self.assertTrue(np.all(np.abs(column-expected)<=np.spacing(np.abs(expected))))
+        for text,expected in ((b'h\n-1.5e+3,+2.\r\n.5,-0e-0\r\n',[[-1500.,2.],[0.5,-0.]]),
+                              (b'h\n1,2\n\n3,4',[[1.,2.],[3.,4.]]),
+                              (b'h\nnan,1\n2,inf\n',[[np.nan,1.],[2.,np.inf]])) :
+            self.assertTrue(np.array_equal(np.column_stack(parse_csv_columns(text,2,1)),expected,equal_nan=True))
+        self.assertEqual([c.shape[0] for c in parse_csv_columns(b'h\n',2,1)],[0,0])
+        with self.assertRaises(ValueError) :
+            parse_csv_columns(b'h\n1,2\n3,x\n',2,1)
+
+    def test_benchmark_csv_parsing(self) :
+        results = benchmark_csv_parsing(n_rows=(1000,),fmts=('%.6e','%.10f'),n_repeats=1)
+        self.assertEqual(len(results),2)
+        self.assertTrue(all(result['matches'] for result in results))
@@ -0,0 +1,99 @@
+#imports
+import unittest, struct, shutil
+import numpy as np
+from openmsipython.pdv.lecroy_trc_file import WAVEDESC_FIELDS, WAVEDESC_LENGTH, LecroyWaveform
+from openmsipython.pdv.lecroy_trc_file import get_trc_select_bytes, read_lecroy_trc_rows
+from openmsipython.pdv.lecroy_csv_reader import read_lecroy_csv_rows
+from openmsipython.pdv.lecroy_data_file import UploadLecroyDataFile
+from config import TEST_CONST
+
+#constants
+VERTICAL_GAIN = 2.5e-5
+VERTICAL_OFFSET = 0.01
+HORIZ_INTERVAL = 1.25e-11
+HORIZ_OFFSET = -2e-8
+
+def write_trc_file(filepath,raw,byte_order='<',user_text=b'') :
+    """
+    Write a LeCroy binary waveform file holding the given raw samples
+    """
+    raw = np.asarray(raw)
+    wavedesc = bytearray(WAVEDESC_LENGTH)
+    wavedesc[:8] = b'WAVEDESC'
+    wavedesc[16:24] = b'LECROY_2'
+    values = {'COMM_TYPE':0 if raw.dtype.itemsize==1 else 1,
+              'COMM_ORDER':1 if byte_order=='<' else 0,
+              'WAVE_DESCRIPTOR':WAVEDESC_LENGTH,
+              'USER_TEXT':len(user_text),
+              'TRIGTIME_ARRAY':0,
+              'RIS_TIME_ARRAY':0,
+              'WAVE_ARRAY_1':raw.nbytes,
+              'WAVE_ARRAY_COUNT':raw.shape[0],
+              'VERTICAL_GAIN':VERTICAL_GAIN,
+              'VERTICAL_OFFSET':VERTICAL_OFFSET,
+              'HORIZ_INTERVAL':HORIZ_INTERVAL,
+              'HORIZ_OFFSET':HORIZ_OFFSET}
+    for name,(offset,fmt) in WAVEDESC_FIELDS.items() :
+        struct.pack_into(byte_order+fmt,wavedesc,offset,values[name])
+    body = bytes(wavedesc)+user_text+raw.astype(raw.dtype.newbyteorder(byte_order)).tobytes()
+    with open(filepath,'wb') as fp :
+        fp.write(f'#9{len(body):09d}'.encode()+body)
+
+class TestLecroyTrcFile(unittest.TestCase) :
+    """
+    Class for testing reading LeCroy binary waveform files
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_lecroy_trc_file'
+        self.test_dir.mkdir(exist_ok=True)
+        self.raw = np.random.default_rng(0).integers(-32768,32767,size=5000,dtype=np.int16)
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    def test_read_waveform(self) :
+        for byte_order,raw in (('<',self.raw),('>',self.raw),('<',(self.raw//256).astype(np.int8))) :
+            filepath = self.test_dir/'waveform.trc'
+            write_trc_file(filepath,raw,byte_order,user_text=b'some text')
+            waveform = LecroyWaveform.from_file(filepath)
+            self.assertEqual(waveform.n_points,raw.shape[0])
+            self.assertTrue(np.array_equal(waveform.raw,raw))
+            self.assertTrue(np.allclose(waveform.get_voltage(),
+                                        np.float32(VERTICAL_GAIN)*raw-np.float32(VERTICAL_OFFSET)))
+            self.assertTrue(np.allclose(waveform.get_time(10,20),
+                                        HORIZ_OFFSET+np.arange(10,20)*np.float32(HORIZ_INTERVAL)))
+            self.assertEqual(waveform.get_voltage(0,10,np.float32).dtype,np.float32)
+            del waveform
+
+    def test_matches_csv_export(self) :
+        trc_path = self.test_dir/'waveform.trc'
+        write_trc_file(trc_path,self.raw)
+        waveform = LecroyWaveform.from_file(trc_path)
+        csv_path = self.test_dir/'waveform.txt'
+        with open(csv_path,'w') as fp :
+            fp.write('LECROYWR\nSegments,1\nSegment,TrigTime\n#1,0\nTime,Ampl\n')
+            np.savetxt(fp,np.column_stack((waveform.get_time(),waveform.get_voltage())),delimiter=',',fmt='%.17e')
+        del waveform
+        for rows_to_skip,nrows in ((4,100),(1000,50),(4,None)) :
+            csv_time, csv_voltage = read_lecroy_csv_rows(csv_path,rows_to_skip,nrows)
+            trc_time, trc_voltage = read_lecroy_trc_rows(trc_path,rows_to_skip,nrows)
+            self.assertTrue(np.array_equal(csv_time,trc_time))
+            self.assertTrue(np.array_equal(csv_voltage,trc_voltage))
+
+    def test_select_bytes(self) :
+        filepath = self.test_dir/'waveform.trc'
+        write_trc_file(filepath,self.raw)
+        select_bytes = get_trc_select_bytes(filepath,1000,200)
+        data_offset = select_bytes[0][1]
+        self.assertEqual(select_bytes,[(0,data_offset),(data_offset+2000,data_offset+2400)])
+        self.assertEqual(get_trc_select_bytes(filepath,4900,200)[1],(data_offset+9800,data_offset+10000))
+        #uploaded files select the same samples as from CSV exports with the same numbers of rows
+        datafile = UploadLecroyDataFile(filepath,header_rows=5,rows_to_skip=1005,rows_to_select=200)
+        self.assertEqual(datafile.select_bytes,select_bytes)
+        #the skimmed file contents can be read back
+        contents = filepath.read_bytes()
+        skimmed = b''.join(contents[start:stop] for start,stop in select_bytes)
+        waveform = LecroyWaveform(skimmed,first_index=1000)
+        self.assertTrue(np.array_equal(waveform.raw,self.raw[1000:1200]))
+        self.assertTrue(np.allclose(waveform.get_time(),HORIZ_OFFSET+np.arange(1000,1200)*np.float32(HORIZ_INTERVAL)))
@@ -0,0 +1,43 @@
+#imports
+import unittest, threading, tracemalloc
+import numpy as np
+from openmsipython.pdv.memory_tracking import PeakMemoryTracker, format_memory
+
+class TestMemoryTracking(unittest.TestCase) :
+    """
+    Class for testing peak memory measurements
+    """
+
+    def test_peak_memory(self) :
+        with PeakMemoryTracker() as tracker :
+            a = np.ones(1000000)
+            del a
+        self.assertGreaterEqual(tracker.peak,8000000)
+        self.assertLess(tracker.peak,9000000)
+        self.assertFalse(tracemalloc.is_tracing())
+        with PeakMemoryTracker() :
+            with self.assertRaises(ValueError) :
+                with PeakMemoryTracker() :
+                    pass
+        self.assertEqual(format_memory(3*1024*1024),'3.0 MiB')
+
+    def test_concurrent_trackers(self) :
+        #a small allocation measured while a large one happens in another thread only sees its own peak
+        large_started = threading.Event()
+        trackers = {}
+        def allocate(name,size) :
+            with PeakMemoryTracker() as tracker :
+                if name=='large' :
+                    large_started.set()
+                a = np.ones(size)
+                del a
+            trackers[name] = tracker
+        large_thread = threading.Thread(target=allocate,args=('large',4000000))
+        large_thread.start()
+        large_started.wait()
+        small_thread = threading.Thread(target=allocate,args=('small',1000))
+        small_thread.start()
+        large_thread.join()
+        small_thread.join()
+        self.assertGreaterEqual(trackers['large'].peak,32000000)
+        self.assertLess(trackers['small'].peak,1000000)
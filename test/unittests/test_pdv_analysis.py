@@ -0,0 +1,243 @@
+#imports
+import unittest, pathlib, sys, csv, shutil, weakref, gc
+import numpy as np
+from openmsipython.pdv.pdv_analysis import PDVSpallAnalysis, PDVVelocityAnalysis
+from openmsipython.pdv.pdv_batch_analysis import PDVBatchAnalysis, get_filepaths_to_analyze, analyze_files_in_pool
+from config import TEST_CONST
+
+#constants
+SAMPLE_RATE = 80e9
+CARRIER_FREQ = 1.0e9
+N_SAMPLES = 120000
+EVENT_TIME = 0.9e-6
+
+def make_pdv_signal(exp_type,seed=0) :
+    """
+    Return time and voltage arrays for a synthetic PDV trace: a carrier alone before EVENT_TIME and a beat
+    signal at a frequency set by a known velocity history afterward
+    """
+    rng = np.random.default_rng(seed)
+    time = np.arange(N_SAMPLES)/SAMPLE_RATE + 1.234e-6
+    rel_time = time-time[0]
+    after = rel_time>EVENT_TIME
+    s = rel_time[after]-EVENT_TIME
+    velocity = np.zeros(N_SAMPLES)
+    if exp_type=='spall' :
+        velocity[after] = (400*np.clip(s/10e-9,0,1)-120*np.clip((s-40e-9)/30e-9,0,1)
+                           +50*np.clip((s-70e-9)/20e-9,0,1))
+    else :
+        velocity[after] = 600*(1-np.exp(-s/30e-9))
+    phase = 2*np.pi*np.cumsum(CARRIER_FREQ+velocity/775*1e9)/SAMPLE_RATE
+    voltage = np.where(after,0.3,1.0)*np.cos(2*np.pi*CARRIER_FREQ*rel_time)+np.where(after,1.0,0.0)*np.cos(phase)
+    voltage+= 0.02*rng.standard_normal(N_SAMPLES)
+    return time, voltage
+
+def make_analysis(exp_type,**kwargs) :
+    """
+    Return a PDV analysis object for a synthetic trace of the given type
+    """
+    time, voltage = make_pdv_signal(exp_type)
+    analysis_type = PDVSpallAnalysis if exp_type=='spall' else PDVVelocityAnalysis
+    return analysis_type(file=pathlib.Path(f'synthetic_{exp_type}.txt'),time=time,voltage=voltage,
+                         N=512,overlap_frac=0.85,**kwargs)
+
+class TestPDVAnalysis(unittest.TestCase) :
+    """
+    Class for testing the numerical parts of PDV analyses using synthetic traces
+    """
+
+    def test_compute_spall_headless(self) :
+        result = make_analysis('spall').compute()
+        self.assertIsNone(result.spectrograms)
+        self.assertAlmostEqual(result.center_frequency,CARRIER_FREQ,delta=1e6)
+        self.assertAlmostEqual(result.event_time,EVENT_TIME,delta=5e-9)
+        self.assertAlmostEqual(result.peak_velocity,400.,delta=5.)
+        self.assertEqual(result.velocity.shape,result.cut_time.shape)
+        self.assertIn('pullback_velocity',result.metrics)
+
+    def test_compute_velocity_headless(self) :
+        result = make_analysis('velocity').compute()
+        self.assertAlmostEqual(result.impact_velocity,600.,delta=5.)
+        self.assertEqual(result.position.shape[0],result.velocity.shape[0]-result.first_positive_index-1)
+
+    def test_compute_keeps_spectrograms(self) :
+        result = make_analysis('spall').compute(keep_spectrograms=True)
+        self.assertEqual(set(result.spectrograms.keys()),{'imported','cut_time','isolated'})
+        headless_result = make_analysis('spall').compute()
+        self.assertTrue(np.array_equal(result.velocity,headless_result.velocity))
+
+    def test_render_requires_spectrograms(self) :
+        analysis = make_analysis('spall')
+        result = analysis.compute()
+        with self.assertRaises(ValueError) :
+            analysis.render(result)
+
+    def test_compute_does_not_import_matplotlib(self) :
+        if 'matplotlib' in sys.modules :
+            self.skipTest('matplotlib was already imported by another test')
+        make_analysis('velocity').compute()
+        self.assertNotIn('matplotlib',sys.modules)
+
+    def test_band_limited_spectrograms_give_same_result(self) :
+        result = make_analysis('spall').compute()
+        for method in ('zoom','sliding') :
+            zoom_result = make_analysis('spall',spectrogram_method=method).compute(keep_spectrograms=True)
+            self.assertEqual(result.metrics,zoom_result.metrics)
+            self.assertTrue(np.array_equal(result.velocity,zoom_result.velocity))
+        with self.assertRaises(ValueError) :
+            make_analysis('spall',spectrogram_method='not_a_method')
+
+    def test_coarse_event_search_gives_same_result(self) :
+        for exp_type in ('spall','velocity') :
+            result = make_analysis(exp_type).compute()
+            analysis = make_analysis(exp_type,coarse_event_search=True)
+            coarse_result = analysis.compute(keep_spectrograms=True)
+            self.assertEqual(result.event_time,coarse_result.event_time)
+            self.assertEqual(result.metrics,coarse_result.metrics)
+            self.assertTrue(np.array_equal(result.velocity,coarse_result.velocity))
+            #the imported spectrogram is the coarse one
+            self.assertLess(coarse_result.spectrograms['imported'].power.size,
+                            make_analysis(exp_type).compute(keep_spectrograms=True).spectrograms['imported'].power.size)
+        batch_result = PDVBatchAnalysis(PDVVelocityAnalysis,[{'file':analysis._file,'time':analysis.time,
+                                                              'voltage':analysis.voltage}],512,0.85,
+                                        coarse_event_search=True).compute(keep_spectrograms=True)[0]
+        self.assertTrue(np.allclose(batch_result.velocity,coarse_result.velocity))
+
+    def test_low_memory_gives_close_result(self) :
+        for exp_type in ('spall','velocity') :
+            analysis = make_analysis(exp_type,report_peak_memory=True)
+            result = analysis.compute(keep_spectrograms=True)
+            low_memory_analysis = make_analysis(exp_type,low_memory=True,report_peak_memory=True)
+            low_memory_result = low_memory_analysis.compute(keep_spectrograms=True)
+            self.assertEqual(low_memory_result.spectrograms['imported'].power.dtype,np.float32)
+            self.assertEqual(result.event_time,low_memory_result.event_time)
+            self.assertEqual(result.freq_peak,low_memory_result.freq_peak)
+            self.assertTrue(np.allclose(result.velocity,low_memory_result.velocity,atol=1e-3))
+            self.assertLess(low_memory_analysis.peak_memory,analysis.peak_memory/2)
+            #the raw data are released, so the analysis can't be computed again
+            self.assertIsNone(low_memory_analysis.voltage)
+            with self.assertRaises(ValueError) :
+                low_memory_analysis.compute()
+        self.assertIsNone(make_analysis('spall').peak_memory)
+
+    def test_low_memory_render_does_not_change_result(self) :
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+        analysis = make_analysis('spall',low_memory=True,pyplot_figure=fig)
+        result = analysis.compute(keep_spectrograms=True)
+        analysis.render(result)
+        plt.close(fig)
+        #the result that was passed in keeps its spectrograms, but the analysis doesn't hold on to it
+        self.assertEqual(set(result.spectrograms.keys()),{'imported','cut_time','isolated'})
+        self.assertIsNone(analysis.result)
+
+    def test_memoized_quantities(self) :
+        analysis = make_analysis('velocity')
+        #the velocity can be used before compute is called, and only the quantities it needs are calculated
+        vel = analysis.vel
+        self.assertTrue({'_cen','event_time','cut_window','_phasD2','vel'}.issubset(analysis.memoized_names))
+        self.assertIsNone(analysis.result)
+        self.assertIs(analysis.vel,vel)
+        #invalidating the cut window invalidates everything derived from it
+        analysis.invalidate('cut_window')
+        self.assertEqual(set(analysis.memoized_names),{'_cen','event_time'})
+        self.assertTrue(np.array_equal(analysis.compute().velocity,vel))
+        analysis.invalidate()
+        self.assertEqual(analysis.memoized_names,())
+        #memoized values don't keep analyses alive after they're deleted
+        ref = weakref.ref(analysis)
+        del analysis
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_downconversion_gives_close_result(self) :
+        result = make_analysis('velocity').compute()
+        analysis = make_analysis('velocity',downconversion_factor=8)
+        downconverted_result = analysis.compute(keep_spectrograms=True)
+        self.assertEqual(downconverted_result.velocity.shape,result.velocity.shape)
+        self.assertAlmostEqual(downconverted_result.impact_velocity,result.impact_velocity,delta=1.)
+        self.assertAlmostEqual(downconverted_result.freq_peak,result.freq_peak,delta=0.02e9)
+        #the start-up transient of the differentiator is cut out in the same place (to within a couple of
+        #decimated samples), so the position and flyer velocity start from the same point
+        self.assertLess(result.velocity[0],-700.)
+        self.assertLess(downconverted_result.velocity[0],-700.)
+        self.assertAlmostEqual(downconverted_result.first_positive_index,result.first_positive_index,delta=2*8)
+        #away from the start-up transient of the differentiator the velocities should be close everywhere
+        self.assertLess(np.percentile(np.abs(downconverted_result.velocity-result.velocity)[300:],99),5.)
+        self.assertGreater(downconverted_result.spectrograms['cut_time'].f.min(),0.)
+        batch_result = PDVBatchAnalysis(PDVVelocityAnalysis,[{'file':analysis._file,'time':analysis.time,
+                                                              'voltage':analysis.voltage}],512,0.85,
+                                        downconversion_factor=8).compute()[0]
+        self.assertTrue(np.allclose(batch_result.velocity,downconverted_result.velocity))
+        with self.assertRaises(ValueError) :
+            make_analysis('velocity',downconversion_factor=0)
+
+    def test_batch_matches_single_shots(self) :
+        shots = []
+        for seed in range(3) :
+            time, voltage = make_pdv_signal('velocity',seed=seed)
+            shots.append({'file':pathlib.Path(f'synthetic_velocity_{seed}.txt'),'time':time,'voltage':voltage})
+        #add a shot with no event in it, which should fail without stopping the others
+        time, voltage = make_pdv_signal('velocity')
+        shots.append({'file':pathlib.Path('no_event.txt'),'time':time,
+                      'voltage':np.cos(2*np.pi*CARRIER_FREQ*(time-time[0]))})
+        batch = PDVBatchAnalysis(PDVVelocityAnalysis,shots,512,0.85,batch_size=2)
+        results = batch.compute()
+        self.assertEqual(len(results),4)
+        self.assertIsInstance(results[3],Exception)
+        for shot,result in zip(shots[:3],results[:3]) :
+            single_result = PDVVelocityAnalysis(N=512,overlap_frac=0.85,**shot).compute()
+            self.assertTrue(np.allclose(result.velocity,single_result.velocity))
+            self.assertAlmostEqual(result.impact_velocity,single_result.impact_velocity)
+
+    def test_event_too_close_to_edge(self) :
+        #move the event to 200 ns before the end of the data, leaving no room for the 600 ns window after it
+        time, voltage = make_pdv_signal('velocity')
+        voltage = np.roll(voltage,N_SAMPLES-int(round((EVENT_TIME+200e-9)*SAMPLE_RATE)))
+        shot = {'file':pathlib.Path('edge.txt'),'time':time,'voltage':voltage}
+        with self.assertRaises(ValueError) as single_error :
+            PDVVelocityAnalysis(N=512,overlap_frac=0.85,**shot).compute()
+        self.assertIn('too close to the edge',str(single_error.exception))
+        batch_result = PDVBatchAnalysis(PDVVelocityAnalysis,[shot],512,0.85).compute()[0]
+        self.assertIsInstance(batch_result,ValueError)
+        self.assertEqual(str(batch_result),str(single_error.exception))
+
+    def test_batch_requires_same_shape(self) :
+        time, voltage = make_pdv_signal('spall')
+        shots = [{'file':pathlib.Path('a.txt'),'time':time,'voltage':voltage},
+                 {'file':pathlib.Path('b.txt'),'time':time[:-10],'voltage':voltage[:-10]}]
+        with self.assertRaises(ValueError) :
+            PDVBatchAnalysis(PDVSpallAnalysis,shots,512,0.85)
+
+    def test_analyze_files_in_pool(self) :
+        test_dir = TEST_CONST.TEST_DIR_PATH/'test_pdv_analysis_pool'
+        test_dir.mkdir(exist_ok=True)
+        try :
+            #write two good files and one without an event, each with a header row after the skipped rows
+            for name,seed in (('shot_0.txt',0),('shot_1.txt',1),('shot_2.txt',None)) :
+                time, voltage = make_pdv_signal('velocity',seed=0 if seed is None else seed)
+                if seed is None :
+                    voltage = np.cos(2*np.pi*CARRIER_FREQ*(time-time[0]))
+                with open(test_dir/name,'w') as fp :
+                    fp.write('skipped\nTime,Ampl\n')
+                    np.savetxt(fp,np.column_stack((time,voltage)),delimiter=',')
+            (test_dir/'.hidden').touch()
+            filepaths = get_filepaths_to_analyze(test_dir)
+            self.assertEqual([fp.name for fp in filepaths],['shot_0.txt','shot_1.txt','shot_2.txt'])
+            self.assertEqual(get_filepaths_to_analyze(test_dir/'shot_[01].txt'),filepaths[:2])
+            results_csv = test_dir/'results.csv'
+            results = analyze_files_in_pool(PDVVelocityAnalysis,filepaths,2,max_in_flight=1,headless=True,
+                                            results_csv=results_csv,print_progress=False,
+                                            rows_to_skip=1,nrows=N_SAMPLES,N=512,overlap_frac=0.85)
+            self.assertEqual([r[0] for r in results],filepaths)
+            self.assertAlmostEqual(results[0][1]['impact_velocity'],600.,delta=5.)
+            self.assertIsInstance(results[2][1],Exception)
+            with open(results_csv) as fp :
+                rows = list(csv.DictReader(fp))
+            self.assertEqual(len(rows),3)
+            self.assertEqual(rows[2]['impact_velocity'],'')
+            self.assertNotEqual(rows[2]['error'],'')
+        finally :
+            shutil.rmtree(test_dir)
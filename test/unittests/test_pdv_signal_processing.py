@@ -0,0 +1,98 @@
+#imports
+import unittest
+import numpy as np
+from scipy import signal
+from openmsipython.pdv.pdv_signal_processing import smooth_diff, apply_smooth_diff, calculate_phase_derivative
+from openmsipython.pdv.pdv_signal_processing import isolate_signal, calculate_spectrogram
+from openmsipython.pdv.time_frequency import calculate_band_limited_spectrogram, calculate_spectrogram_with_method
+from openmsipython.pdv.time_frequency import calculate_spectrogram_in_blocks
+
+class TestPDVSignalProcessing(unittest.TestCase) :
+    """
+    Class for testing the fast versions of PDV signal processing stages against the original implementations
+    """
+
+    def test_apply_smooth_diff_matches_lfilter(self) :
+        rng = np.random.default_rng(0)
+        for n in (2,3,8,9,240,241) :
+            for npts in (1,5,240,2000) :
+                x = np.cumsum(rng.standard_normal((3,npts)),axis=-1)+1.e4
+                ref = signal.lfilter(-smooth_diff(n).ravel(),1,x,axis=-1)
+                self.assertTrue(np.allclose(apply_smooth_diff(x,n),ref,rtol=1e-9,atol=1e-8))
+        with self.assertRaises(TypeError) :
+            apply_smooth_diff(np.ones(10),1)
+
+    def test_phase_derivative_matches_lfilter(self) :
+        sample_rate = 80e9
+        time = np.arange(40000)/sample_rate
+        analytic = np.exp(1j*2*np.pi*(1.5e9*time+1e16*time**2))
+        ref = calculate_phase_derivative(analytic,sample_rate,use_lfilter=True)
+        fast = calculate_phase_derivative(analytic,sample_rate)
+        #differences of less than 1 Hz are far below the frequency resolution of a PDV measurement
+        self.assertLess(np.max(np.abs(fast-ref)),1.)
+
+    def test_fused_isolation_matches_separate_filters(self) :
+        sample_rate = 80e9
+        rng = np.random.default_rng(1)
+        for numpts,fixt in ((16001,1600),(20000,2001)) :
+            time = np.arange(numpts)/sample_rate
+            cutvoltages = []
+            for cen in (1.0e9,1.2e9) :
+                beat = np.where(np.arange(numpts)>=fixt,np.cos(2*np.pi*(1.4e9*time+3e15*time**2)),0.)
+                cutvoltages.append(np.cos(2*np.pi*cen*time)+beat+0.02*rng.standard_normal(numpts))
+            cutvoltages = np.stack(cutvoltages)
+            args = (fixt,sample_rate,np.array([1.0e9,1.2e9]),np.array([0.9e9,1.1e9]),np.array([2.2e9,2.4e9]))
+            ref = isolate_signal(cutvoltages,*args,fused=False)
+            fused = isolate_signal(cutvoltages,*args)
+            self.assertLess(np.max(np.abs(fused-ref)),1e-9*np.max(np.abs(ref)))
+            single = isolate_signal(cutvoltages[1],fixt,sample_rate,1.2e9,1.1e9,2.4e9)
+            self.assertLess(np.max(np.abs(single-ref[1])),1e-9*np.max(np.abs(ref)))
+
+    def test_band_limited_spectrogram_matches_stft_rows(self) :
+        sample_rate = 80e9
+        time = np.arange(10001)/sample_rate
+        voltage = np.stack([np.cos(2*np.pi*(1.2e9*time+2e15*time**2)),np.cos(2*np.pi*1.5e9*time)])
+        stft_kwargs = {'fs':sample_rate,'nperseg':256,'noverlap':np.floor(0.85*256),'nfft':2560,'boundary':None}
+        f,t,power = calculate_spectrogram(voltage,stft_kwargs)
+        bf,bt,bpower = calculate_band_limited_spectrogram(voltage,stft_kwargs,1.0e9,2.0e9)
+        rows = np.flatnonzero((f>=1.0e9)*(f<=2.0e9))
+        self.assertTrue(np.array_equal(f[rows],bf))
+        self.assertTrue(np.array_equal(t,bt))
+        self.assertTrue(np.allclose(power[:,rows,:],bpower,atol=1e-6))
+        zf,_,zpower = calculate_spectrogram_with_method(voltage,stft_kwargs,'zoom')
+        self.assertLess(zf.shape[0],f.shape[0]/4)
+        self.assertTrue(np.array_equal(f[np.argmax(power,axis=-2)],zf[np.argmax(zpower,axis=-2)]))
+
+    def test_sliding_dft_spectrogram_matches_stft_rows(self) :
+        sample_rate = 80e9
+        time = np.arange(10001)/sample_rate
+        voltage = np.stack([np.cos(2*np.pi*(1.2e9*time+2e15*time**2)),np.cos(2*np.pi*1.5e9*time)])
+        for overlap_frac in (0.5,0.85,0.95) :
+            stft_kwargs = {'fs':sample_rate,'nperseg':256,'noverlap':np.floor(overlap_frac*256),
+                           'nfft':2560,'boundary':None}
+            f,t,power = calculate_spectrogram(voltage,stft_kwargs)
+            sf,st,spower = calculate_spectrogram_with_method(voltage,stft_kwargs,'sliding',0.,2.0e9)
+            rows = np.flatnonzero(f<=2.0e9)
+            self.assertTrue(np.array_equal(f[rows],sf))
+            self.assertTrue(np.array_equal(t,st))
+            #(bins with no power at all are only rounding error in both)
+            significant = power[:,rows,:]>-200.
+            self.assertTrue(np.allclose(power[:,rows,:][significant],spower[significant],atol=1e-6))
+        with self.assertRaises(ValueError) :
+            calculate_spectrogram_with_method(voltage,{**stft_kwargs,'window':'hamming'},'sliding',0.,2.0e9)
+
+    def test_blocked_spectrogram_matches_stft(self) :
+        sample_rate = 80e9
+        time = np.arange(10001)/sample_rate
+        voltage = np.stack([np.cos(2*np.pi*(1.2e9*time+2e15*time**2)),np.cos(2*np.pi*1.5e9*time)])
+        stft_kwargs = {'fs':sample_rate,'nperseg':256,'noverlap':np.floor(0.85*256),'nfft':2560,'boundary':None}
+        f,t,power = calculate_spectrogram(voltage,stft_kwargs)
+        bf,bt,bpower = calculate_spectrogram_in_blocks(voltage,stft_kwargs,segments_per_block=7)
+        self.assertTrue(np.array_equal(f,bf))
+        self.assertTrue(np.array_equal(t,bt))
+        significant = power>-200.
+        self.assertTrue(np.allclose(power[significant],bpower[significant],atol=1e-6))
+        #single precision data give a single precision spectrogram that's still close where there's signal
+        sf,st,spower = calculate_spectrogram_with_method(voltage.astype(np.float32),stft_kwargs,low_memory=True)
+        self.assertEqual(spower.dtype,np.float32)
+        self.assertTrue(np.allclose(power[power>-60.],spower[power>-60.],atol=1e-2))
@@ -0,0 +1,88 @@
+#imports
+import unittest, shutil
+import numpy as np
+from openmsistream.data_file_io.config import DATA_FILE_HANDLING_CONST
+from openmsistream.kafka_wrapper.serialization import DataFileChunkSerializer, DataFileChunkDeserializer
+from openmsipython.pdv import skim_compression
+from openmsipython.pdv.skim_compression import compress_lecroy_data, decompress_lecroy_data, StreamingDecompressor
+from openmsipython.pdv.skim_compression import is_compressed_lecroy_data, benchmark_skim_payloads
+from openmsipython.pdv.lecroy_data_file import UploadLecroyDataFile, DownloadLecroyDataFile
+from config import TEST_CONST
+from test_lecroy_csv_reader import write_lecroy_csv
+
+class TestSkimCompression(unittest.TestCase) :
+    """
+    Class for testing compressing data skimmed from Lecroy files and decompressing them as they're downloaded
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_skim_compression'
+        self.test_dir.mkdir(exist_ok=True)
+        self.csv_path = self.test_dir/'lecroy.txt'
+        write_lecroy_csv(self.csv_path,20000)
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    def test_compress_and_decompress(self) :
+        contents = self.csv_path.read_bytes()
+        compressed = compress_lecroy_data(contents,'zlib',9)
+        self.assertTrue(is_compressed_lecroy_data(compressed))
+        self.assertLess(len(compressed),len(contents)/2)
+        self.assertEqual(decompress_lecroy_data(compressed),contents)
+        #feeding the compressed data in small pieces gives the same result
+        decompressor = StreamingDecompressor()
+        for start in range(0,len(compressed),7) :
+            decompressor.feed(compressed[start:start+7])
+        self.assertEqual(decompressor.metadata['codec'],'zlib')
+        self.assertEqual(decompressor.metadata['level'],9)
+        self.assertEqual(decompressor.get_decompressed(),contents)
+        #truncated data are an error
+        with self.assertRaises(ValueError) :
+            decompress_lecroy_data(compressed[:len(compressed)//2])
+        with self.assertRaises(ValueError) :
+            compress_lecroy_data(contents,'not_a_codec')
+        if skim_compression.zstandard is None :
+            with self.assertRaises(ImportError) :
+                compress_lecroy_data(contents,'zstd')
+
+    def test_upload_and_download_compressed_data(self) :
+        uncompressed = self.download(UploadLecroyDataFile(self.csv_path,header_rows=5,rows_to_skip=1000,
+                                                          rows_to_select=5000))
+        self.assertIsNone(uncompressed.compression_metadata)
+        expected_time, expected_voltage = uncompressed.get_time_and_voltage()
+        for encode_skimmed_data in (False,True) :
+            upload_file = UploadLecroyDataFile(self.csv_path,header_rows=5,rows_to_skip=1000,rows_to_select=5000,
+                                               encode_skimmed_data=encode_skimmed_data,compression='zlib')
+            download_file = self.download(upload_file)
+            self.assertEqual(download_file.compression_metadata['codec'],'zlib')
+            time, voltage = download_file.get_time_and_voltage()
+            if encode_skimmed_data :
+                #encoded data have the same rows, with single precision voltages
+                self.assertTrue(np.allclose(time,expected_time,rtol=0,atol=1e-16))
+                self.assertTrue(np.allclose(voltage,expected_voltage,atol=1e-8))
+            else :
+                self.assertTrue(np.array_equal(time,expected_time))
+                self.assertTrue(np.array_equal(voltage,expected_voltage))
+
+    def test_benchmark(self) :
+        results = benchmark_skim_payloads(self.csv_path,5,1000,5000,codecs=['zlib'])
+        self.assertEqual([(r['payload'],r['codec']) for r in results],
+                         [('raw','none'),('raw','zlib'),('encoded','none'),('encoded','zlib')])
+        self.assertEqual(results[0]['ratio'],1.)
+        self.assertGreater(results[1]['ratio'],1.)
+
+    def download(self,upload_file) :
+        """
+        Return a DownloadLecroyDataFile reconstructed from the chunks of upload_file, added in reverse order
+        """
+        upload_file.add_chunks_to_upload(chunk_size=1024)
+        serializer = DataFileChunkSerializer()
+        deserializer = DataFileChunkDeserializer()
+        chunks = [deserializer(serializer(chunk)) for chunk in upload_file.chunks_to_upload]
+        self.assertGreater(len(chunks),1)
+        download_file = DownloadLecroyDataFile(chunks[0].filepath,logger_file=self.test_dir)
+        for chunk in reversed(chunks) :
+            code = download_file.add_chunk(chunk)
+        self.assertEqual(code,DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE)
+        return download_file
@@ -0,0 +1,153 @@
+#imports
+import unittest, shutil
+import numpy as np, pandas as pd
+from io import BytesIO
+from openmsistream.data_file_io.config import DATA_FILE_HANDLING_CONST
+from openmsistream.kafka_wrapper.serialization import DataFileChunkSerializer, DataFileChunkDeserializer
+from openmsipython.pdv.config import LECROY_CONST
+from openmsipython.pdv.skim_encoding import EncodedLecroyData, is_encoded_lecroy_data
+from openmsipython.pdv.lecroy_csv_reader import read_lecroy_csv_rows, parse_csv_columns
+from openmsipython.pdv.lecroy_trc_file import read_lecroy_trc_rows
+from openmsipython.pdv.lecroy_data_file import UploadLecroyDataFile, DownloadLecroyDataFile
+from openmsipython.pdv.event_window import get_row_windows_for_time_windows, merge_row_windows
+from config import TEST_CONST
+from test_lecroy_csv_reader import HEADER, write_lecroy_csv
+from test_lecroy_trc_file import write_trc_file
+
+class TestSkimEncoding(unittest.TestCase) :
+    """
+    Class for testing the compact binary encoding of data skimmed from Lecroy files
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_skim_encoding'
+        self.test_dir.mkdir(exist_ok=True)
+        n = 20000
+        rng = np.random.default_rng(0)
+        self.raw = rng.integers(-32768,32767,size=n,dtype=np.int16)
+        self.csv_path = self.test_dir/'lecroy.txt'
+        write_lecroy_csv(self.csv_path,n,self.raw*2.5e-5-0.01)
+        self.trc_path = self.test_dir/'lecroy.trc'
+        write_trc_file(self.trc_path,self.raw)
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    def test_encode_csv_file(self) :
+        encoded = EncodedLecroyData.from_lecroy_file(self.csv_path,5,1000,5000)
+        self.assertEqual((encoded.first_row,encoded.n_rows),(1000,5000))
+        self.assertEqual(encoded.header,HEADER.encode())
+        bytestring = encoded.to_bytes()
+        self.assertTrue(is_encoded_lecroy_data(bytestring))
+        self.assertFalse(is_encoded_lecroy_data(self.csv_path.read_bytes()))
+        decoded = EncodedLecroyData.from_bytes(bytestring)
+        #the same rows as the full file would give with pandas semantics (the skipped row is a header)
+        time, voltage = read_lecroy_csv_rows(self.csv_path,999,5000)
+        self.assertTrue(np.allclose(decoded.get_time(),time,rtol=0,atol=1e-16))
+        self.assertTrue(np.array_equal(decoded.get_voltage(),voltage.astype(np.float32)))
+        #the encoded data are several times smaller than the raw rows
+        select_bytes = UploadLecroyDataFile(self.csv_path,header_rows=5,rows_to_skip=1000,
+                                            rows_to_select=5000).select_bytes
+        self.assertLess(5*len(bytestring),sum(stop-start for start,stop in select_bytes))
+        #the CSV file can be reconstructed
+        data = pd.read_csv(BytesIO(decoded.to_csv_bytes()),skiprows=4)
+        self.assertEqual(data.shape,(5000,2))
+        self.assertTrue(np.allclose(data['Ampl'].to_numpy(),voltage))
+        #non-uniform times can't be encoded
+        with open(self.csv_path,'ab') as fp :
+            fp.write(b'1.0,0.5\r\n')
+        with self.assertRaises(ValueError) :
+            EncodedLecroyData.from_lecroy_file(self.csv_path,5,19000,5000)
+
+    def test_encode_trc_file(self) :
+        encoded = EncodedLecroyData.from_lecroy_file(self.trc_path,5,1000,5000)
+        self.assertEqual(encoded.samples.dtype,np.int16)
+        decoded = EncodedLecroyData.from_bytes(encoded.to_bytes())
+        time, voltage = read_lecroy_trc_rows(self.trc_path,999,5000)
+        #unlike skimmed binary waveform files, encoded data know the times of their samples
+        self.assertTrue(np.allclose(decoded.get_time(),time,rtol=0,atol=1e-16))
+        self.assertTrue(np.array_equal(decoded.get_voltage(),voltage))
+
+    def test_upload_and_download_encoded_data(self) :
+        for filepath in (self.csv_path,self.trc_path) :
+            upload_file = UploadLecroyDataFile(filepath,header_rows=5,rows_to_skip=1000,rows_to_select=5000,
+                                               encode_skimmed_data=True,rootdir=self.test_dir,
+                                               filename_append=LECROY_CONST.SKIMMED_FILENAME_APPEND)
+            upload_file.add_chunks_to_upload(chunk_size=4096)
+            self.assertGreater(len(upload_file.chunks_to_upload),1)
+            serializer = DataFileChunkSerializer()
+            deserializer = DataFileChunkDeserializer()
+            chunks = [deserializer(serializer(chunk)) for chunk in upload_file.chunks_to_upload]
+            download_file = DownloadLecroyDataFile(chunks[0].filepath,logger_file=self.test_dir)
+            for chunk in reversed(chunks) :
+                code = download_file.add_chunk(chunk)
+            self.assertEqual(code,DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE)
+            self.assertIn(LECROY_CONST.SKIMMED_FILENAME_APPEND,download_file.filename)
+            time, voltage = download_file.get_time_and_voltage()
+            self.assertEqual(time.shape,(5000,))
+            self.assertTrue(np.allclose(voltage,self.raw[995:5995]*2.5e-5-0.01,atol=1e-7))
+            #reconstructed CSV files have as many header lines as the original CSV files
+            header_lines = download_file.get_csv_bytestring().split(b'\r\n')[:5]
+            self.assertTrue(header_lines[0].startswith(b'LECROY' if filepath==self.csv_path else b'#'))
+            self.assertEqual(header_lines[4],b'Time,Ampl')
+
+    def test_raw_and_encoded_data_give_same_rows(self) :
+        kwargs = {'header_rows':5,'rows_to_skip':1000,'rows_to_select':5000}
+        expected_time, expected_voltage = read_lecroy_csv_rows(self.csv_path,999,5000)
+        for encode_skimmed_data in (False,True) :
+            for compression in (None,'zlib') :
+                download_file = self.download(UploadLecroyDataFile(self.csv_path,compression=compression,
+                                                                   encode_skimmed_data=encode_skimmed_data,**kwargs))
+                time, voltage = download_file.get_time_and_voltage()
+                self.assertEqual(time.shape,expected_time.shape)
+                self.assertTrue(np.allclose(time,expected_time,rtol=0,atol=1e-16))
+                #encoded voltages are single precision
+                self.assertTrue(np.allclose(voltage,expected_voltage,rtol=1e-6,atol=1e-12))
+                #the CSV files they're reconstructed as have the same rows after the same number of header lines
+                csv_time, csv_voltage = parse_csv_columns(download_file.get_csv_bytestring(),2,5)
+                self.assertTrue(np.allclose(csv_time,time,rtol=1e-8,atol=0))
+                self.assertTrue(np.allclose(csv_voltage,voltage,rtol=1e-8,atol=1e-12))
+        #including CSV files reconstructed from encoded binary waveform files
+        expected_time, expected_voltage = read_lecroy_trc_rows(self.trc_path,999,5000)
+        download_file = self.download(UploadLecroyDataFile(self.trc_path,encode_skimmed_data=True,
+                                                           compression='zlib',**kwargs))
+        csv_time, csv_voltage = parse_csv_columns(download_file.get_csv_bytestring(),2,5)
+        self.assertTrue(np.allclose(csv_time,expected_time,rtol=1e-8,atol=0))
+        self.assertTrue(np.allclose(csv_voltage,expected_voltage,rtol=1e-8,atol=1e-12))
+
+    def test_multiple_windows(self) :
+        #windows are merged where they overlap or touch and converted from times to rows
+        self.assertEqual(merge_row_windows([(3000,100),(1000,500),(1400,200),(1600,10)]),[(1000,610),(3000,100)])
+        row_times = lambda row : (row-5)*1.25e-11-2e-8
+        self.assertEqual(get_row_windows_for_time_windows(self.csv_path,[(row_times(1000),row_times(1499)),
+                                                                         (row_times(3000),row_times(3099))],5),
+                         [(1000,500),(3000,100)])
+        for filepath,encode in ((self.csv_path,False),(self.csv_path,True),(self.trc_path,False)) :
+            upload_file = UploadLecroyDataFile(filepath,header_rows=5,row_windows=[(3000,100),(1000,500)],
+                                               encode_skimmed_data=encode,rootdir=self.test_dir)
+            self.assertEqual(upload_file.row_windows,[(1000,500),(3000,100)])
+            #several windows from binary waveform files are always encoded
+            self.assertEqual(upload_file.encode_skimmed_data,encode or filepath==self.trc_path)
+            windows = self.download(upload_file).get_windows()
+            self.assertEqual(len(windows),2)
+            #raw and encoded data have the same rows in every window
+            for (time,voltage),(rows_to_skip,rows_to_select) in zip(windows,[(1000,500),(3000,100)]) :
+                self.assertEqual(time.shape,(rows_to_select,))
+                self.assertTrue(np.allclose(time,row_times(np.arange(rows_to_skip,rows_to_skip+rows_to_select)),
+                                            rtol=0,atol=1e-15))
+                self.assertTrue(np.allclose(voltage,self.raw[rows_to_skip-5:rows_to_skip-5+rows_to_select]*2.5e-5-0.01,
+                                            atol=1e-7))
+
+    def download(self,upload_file) :
+        """
+        Return a DownloadLecroyDataFile reconstructed from the chunks of upload_file
+        """
+        upload_file.add_chunks_to_upload(chunk_size=4096)
+        serializer = DataFileChunkSerializer()
+        deserializer = DataFileChunkDeserializer()
+        chunks = [deserializer(serializer(chunk)) for chunk in upload_file.chunks_to_upload]
+        download_file = DownloadLecroyDataFile(chunks[0].filepath,logger_file=self.test_dir)
+        for chunk in chunks :
+            code = download_file.add_chunk(chunk)
+        self.assertEqual(code,DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE)
+        return download_file
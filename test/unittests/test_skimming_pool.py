@@ -0,0 +1,90 @@
+#imports
+import unittest, shutil, time
+from openmsipython.pdv.skimming_pool import SkimmingPool
+from openmsipython.pdv.lecroy_data_file import UploadLecroyDataFile
+from openmsipython.pdv.lecroy_file_upload_directory import LecroyFileUploadDirectory
+from config import TEST_CONST
+from test_lecroy_csv_reader import write_lecroy_csv
+
+#constants
+N_FILES = 4
+
+class TestSkimmingPool(unittest.TestCase) :
+    """
+    Class for testing skimming several Lecroy files at once in a bounded pool of worker threads
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_skimming_pool'
+        self.test_dir.mkdir(exist_ok=True)
+        self.filepaths = []
+        for i in range(N_FILES) :
+            self.filepaths.append(self.test_dir/f'lecroy_{i}.txt')
+            write_lecroy_csv(self.filepaths[-1],20000,seed=i)
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    def test_skim_files(self) :
+        kwargs = {'header_rows':5,'rows_to_skip':1000,'rows_to_select':5000}
+        datafiles = [UploadLecroyDataFile(fp,defer_skimming=True,**kwargs) for fp in self.filepaths]
+        for datafile in datafiles :
+            #files aren't ready to upload until they've been skimmed
+            self.assertFalse(datafile.skimmed)
+            self.assertFalse(datafile.waiting_to_upload or datafile.upload_in_progress)
+            self.assertEqual(len(datafile.chunks_to_upload),0)
+        pool = SkimmingPool(2,100000000,chunk_size=4096)
+        for datafile in datafiles :
+            pool.submit(datafile)
+        pool.shutdown()
+        self.assertEqual(pool.release_enqueued(),[])
+        for filepath,datafile in zip(self.filepaths,datafiles) :
+            self.assertTrue(datafile.skimmed)
+            self.assertTrue(datafile.upload_in_progress)
+            #the chunks are the same as for a file skimmed right away
+            expected = UploadLecroyDataFile(filepath,**kwargs)
+            expected.add_chunks_to_upload(chunk_size=4096)
+            self.assertEqual(self.get_chunk_keys(datafile),self.get_chunk_keys(expected))
+            #skimming again doesn't add more chunks
+            datafile.skim(4096)
+            self.assertEqual(len(datafile.chunks_to_upload),len(expected.chunks_to_upload))
+
+    def test_pending_bytes_limit(self) :
+        datafiles = [UploadLecroyDataFile(fp,header_rows=5,defer_skimming=True) for fp in self.filepaths]
+        #only one file fits under the limit at once, even with several workers
+        pool = SkimmingPool(N_FILES,1,chunk_size=4096)
+        for datafile in datafiles :
+            pool.submit(datafile)
+        self.assertTrue(self.wait_for(lambda : sum(df.skimmed for df in datafiles)==1))
+        time.sleep(0.1)
+        self.assertEqual(sum(df.skimmed for df in datafiles),1)
+        self.assertGreater(pool.pending_bytes,0)
+        self.assertEqual(pool.n_in_progress,N_FILES-1)
+        #files that have been enqueued stop counting against the limit, so the next can be skimmed
+        for n_skimmed in range(2,N_FILES+1) :
+            for datafile in datafiles :
+                if datafile.skimmed :
+                    datafile.fully_enqueued = True
+            pool.release_enqueued()
+            self.assertTrue(self.wait_for(lambda : sum(df.skimmed for df in datafiles)==n_skimmed))
+        pool.shutdown()
+        with self.assertRaises(ValueError) :
+            _ = SkimmingPool(0,1)
+
+    def test_command_line_threads(self) :
+        #files are skimmed in the pool, so the directory uploads with one thread unless told otherwise
+        parser = LecroyFileUploadDirectory.get_argument_parser()
+        self.assertEqual(parser.parse_args([str(self.test_dir)]).n_threads,1)
+        self.assertEqual(parser.parse_args([str(self.test_dir),'--n_threads','4']).n_threads,4)
+
+    def get_chunk_keys(self,datafile) :
+        return [(chunk.chunk_offset_read,chunk.chunk_size,chunk.chunk_hash,chunk.file_hash)
+                for chunk in datafile.chunks_to_upload]
+
+    def wait_for(self,condition,timeout=10.) :
+        start = time.time()
+        while not condition() :
+            if time.time()-start>timeout :
+                return False
+            time.sleep(0.01)
+        return True
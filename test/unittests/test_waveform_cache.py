@@ -0,0 +1,70 @@
+#imports
+import unittest, os, time, shutil
+import numpy as np
+from openmsipython.pdv.waveform_cache import WaveformCache
+from openmsipython.pdv.pdv_analysis import PDVVelocityAnalysis
+from config import TEST_CONST
+from test_pdv_analysis import make_pdv_signal, N_SAMPLES
+
+class TestWaveformCache(unittest.TestCase) :
+    """
+    Class for testing the on-disk cache of parsed waveforms
+    """
+
+    def setUp(self) :
+        self.test_dir = TEST_CONST.TEST_DIR_PATH/'test_waveform_cache'
+        self.test_dir.mkdir(exist_ok=True)
+        self.cache_dir = self.test_dir/'cache'
+        self.filepaths = []
+        for seed in range(3) :
+            filepath = self.test_dir/f'shot_{seed}.txt'
+            t, voltage = make_pdv_signal('velocity',seed=seed)
+            with open(filepath,'w') as fp :
+                fp.write('skipped\nTime,Ampl\n')
+                np.savetxt(fp,np.column_stack((t,voltage)),delimiter=',')
+            self.filepaths.append(filepath)
+
+    def tearDown(self) :
+        shutil.rmtree(self.test_dir)
+
+    def test_cache_hits_and_misses(self) :
+        cache = WaveformCache(self.cache_dir)
+        self.assertIsNone(cache.get(self.filepaths[0],1,1000))
+        parsed_time, parsed_voltage = cache.read_waveform(self.filepaths[0],1,1000)
+        cached_time, cached_voltage = cache.get(self.filepaths[0],1,1000)
+        self.assertTrue(np.array_equal(parsed_time,cached_time))
+        self.assertTrue(np.array_equal(parsed_voltage,cached_voltage))
+        #the cached arrays are read-only memory maps
+        self.assertFalse(cached_voltage.flags.writeable)
+        #other selections and modified files aren't hits
+        self.assertIsNone(cache.get(self.filepaths[0],1,999))
+        stat = self.filepaths[0].stat()
+        os.utime(self.filepaths[0],ns=(stat.st_atime_ns,stat.st_mtime_ns+1000))
+        self.assertIsNone(cache.get(self.filepaths[0],1,1000))
+        cache.clear()
+        self.assertEqual(cache.total_bytes,0)
+
+    def test_least_recently_used_eviction(self) :
+        entry_bytes = 2*(8*1000+128)
+        cache = WaveformCache(self.cache_dir,max_bytes=2*entry_bytes)
+        for filepath in self.filepaths[:2] :
+            cache.read_waveform(filepath,1,1000)
+            time.sleep(0.01)
+        #using the first entry again makes the second one the least recently used
+        self.assertIsNotNone(cache.get(self.filepaths[0],1,1000))
+        time.sleep(0.01)
+        cache.read_waveform(self.filepaths[2],1,1000)
+        self.assertLessEqual(cache.total_bytes,cache.max_bytes)
+        self.assertIsNotNone(cache.get(self.filepaths[0],1,1000))
+        self.assertIsNone(cache.get(self.filepaths[1],1,1000))
+        self.assertIsNotNone(cache.get(self.filepaths[2],1,1000))
+
+    def test_analysis_uses_cache(self) :
+        kwargs = {'file':self.filepaths[0],'rows_to_skip':1,'nrows':N_SAMPLES,'N':512,'overlap_frac':0.85}
+        result = PDVVelocityAnalysis(**kwargs).compute()
+        first_cached_result = PDVVelocityAnalysis(**kwargs,cache_dir=self.cache_dir).compute()
+        self.assertIsNotNone(WaveformCache(self.cache_dir).get(self.filepaths[0],1,N_SAMPLES))
+        cached_result = PDVVelocityAnalysis(**kwargs,cache_dir=self.cache_dir).compute()
+        for other_result in (first_cached_result,cached_result) :
+            self.assertEqual(result.metrics,other_result.metrics)
+            self.assertTrue(np.array_equal(result.velocity,other_result.velocity))